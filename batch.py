@@ -0,0 +1,200 @@
+from __future__ import annotations
+import argparse
+import glob
+import hashlib
+import json
+import os
+import signal
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import fragments
+from budget import Budget, BudgetExceeded
+from clausedb import ClauseDB
+from parser import DimacsError, parse_db
+from preprocess import preprocess
+from kbcache import load_db
+from stats import Stats
+
+try:
+    import resource
+except ImportError:  # not on Windows: no memory or hard CPU limits
+    resource = None
+
+SUFFIXES = (".cnf", ".cnf.gz", ".cnf.xz", ".cnf.lzma", ".cnf.bz2")
+
+
+class _Timeout(Exception):
+    pass
+
+
+def instances(patterns: list[str]) -> list[str]:
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                paths.extend(os.path.join(root, name) for name in files if name.endswith(SUFFIXES))
+        else:
+            paths.extend(glob.glob(pattern, recursive=True) or [pattern])
+    return sorted(dict.fromkeys(paths))
+
+
+def model_hash(model: list[int]) -> str:
+    return hashlib.sha256(" ".join(map(str, model)).encode()).hexdigest()[:16]
+
+
+def _limit_memory(megabytes: int | None):
+    # Pool initializer: MemoryError inside the worker instead of swapping
+    if megabytes and resource is not None:
+        limit = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _alarm(signum, frame):
+    raise _Timeout
+
+
+def _arm(timeout: float | None):
+    # Returns what _disarm needs to put the process back as it was: workers
+    # are reused (batch pools, the server's pool), so a limit left behind
+    # would kill a later, unrelated job
+    if not timeout:
+        return None
+    handler = signal.signal(signal.SIGALRM, _alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    limit = None
+    if resource is not None:
+        # Backstop if the alarm cannot interrupt: the kernel kills the worker
+        # a little later, and the runner reports it as crashed.
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = int(usage.ru_utime + usage.ru_stime + timeout) + 5
+        limit = resource.getrlimit(resource.RLIMIT_CPU)
+        hard = limit[1]
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu if hard == resource.RLIM_INFINITY else min(cpu, hard), hard))
+    return handler, limit
+
+
+def _disarm(armed):
+    if armed is None:
+        return
+    handler, limit = armed
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, signal.SIG_DFL if handler is None else handler)
+    if limit is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, limit)
+
+
+def solve_file(path: str, timeout: float | None = None, simplify: bool = False, cache_dir: str | None = None,
+               db: ClauseDB | None = None, **solver_options) -> dict:
+    # db: path already parsed, by a caller that keeps it loaded
+    stats = Stats()
+    record = {"instance": path, "status": None, "route": None, "seconds": None, "model_hash": None}
+    start = time.perf_counter()
+    # The solver stops itself at the deadline; the alarm a second later only
+    # catches phases that do not check the budget, such as parsing
+    budget = Budget(timeout) if timeout else None
+    armed = _arm(timeout and timeout + 1)
+    try:
+        if db is None:
+            db = parse_db(path, stats=stats) if cache_dir is None else load_db(path, cache_dir or None, stats=stats)
+        simplified = None
+        if simplify:
+            try:
+                simplified = preprocess(db, stats=stats, budget=budget)
+            except BudgetExceeded as exceeded:
+                simplified = exceeded.partial
+        result = fragments.solve(simplified.db if simplified else db, stats=stats, budget=budget, **solver_options)
+        record["status"] = "TIMEOUT" if result.exhausted == "deadline" else result.status
+        record["route"] = result.route
+        if result.model is not None:
+            record["model_hash"] = model_hash(simplified.extend(result.model) if simplified else result.model)
+    except _Timeout:
+        record["status"] = "TIMEOUT"
+    except MemoryError:
+        record["status"] = "MEMOUT"
+    except (DimacsError, OSError) as error:
+        record["status"] = "ERROR"
+        record["error"] = str(error)
+    finally:
+        _disarm(armed)
+    record["seconds"] = round(time.perf_counter() - start, 6)
+    record["stats"] = stats.as_dict()
+    return record
+
+
+def _run_pool(queue: list[str], workers: int, timeout: float | None, memory: int | None, solver_options: dict,
+              suspects: list[str]):
+    # Runs instances off the queue until it is empty or a worker dies; the
+    # instances in flight when the pool broke are added to suspects.
+    with ProcessPoolExecutor(workers, initializer=_limit_memory, initargs=(memory,)) as pool:
+        running = {}
+        try:
+            while queue or running:
+                while queue and len(running) < workers:
+                    path = queue.pop()
+                    running[pool.submit(solve_file, path, timeout, **solver_options)] = path
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        record = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as error:
+                        record = {"instance": running[future], "status": "ERROR", "seconds": None,
+                                  "model_hash": None, "error": repr(error)}
+                    del running[future]
+                    yield record
+        except BrokenProcessPool:
+            suspects.extend(running.values())
+
+
+def run(paths: list[str], workers: int | None = None, timeout: float | None = None, memory: int | None = None,
+        **solver_options):
+    # Yields one record per instance as soon as it finishes, with at most
+    # `workers` instances in flight. A worker that dies (killed, hard CPU
+    # limit) breaks the pool, which is rebuilt for the rest of the batch.
+    workers = workers or os.cpu_count() or 1
+    queue = list(reversed(paths))
+    suspects = []
+    while queue:
+        yield from _run_pool(queue, workers, timeout, memory, solver_options, suspects)
+
+    # Rerun alone whatever was in flight during a crash, so only the
+    # instance that really kills its worker is reported as crashed
+    for path in suspects:
+        crashed = []
+        yield from _run_pool([path], 1, timeout, memory, solver_options, crashed)
+        if crashed:
+            yield {"instance": path, "status": "CRASHED", "seconds": None, "model_hash": None}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Solve many DIMACS instances in parallel, one JSON line per instance")
+    arg_parser.add_argument("paths", nargs="+", help="files, directories or glob patterns of .cnf instances")
+    arg_parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    arg_parser.add_argument("--timeout", type=float, help="seconds per instance")
+    arg_parser.add_argument("--memory", type=int, metavar="MB", help="address-space limit per worker")
+    arg_parser.add_argument("--output", help="write JSON Lines here instead of stdout")
+    arg_parser.add_argument("--preprocess", action="store_true", help="simplify each instance before solving")
+    arg_parser.add_argument("--cache", nargs="?", const="", metavar="DIR", help="reuse parsed instances from an on-disk cache")
+    arg_parser.add_argument("--restarts", choices=("luby", "glucose"), default="luby")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    paths = instances(args.paths)
+    output = open(args.output, "w") if args.output else sys.stdout
+    summary = Counter()
+    start = time.perf_counter()
+    try:
+        for record in run(paths, args.workers, args.timeout, args.memory, simplify=args.preprocess, cache_dir=args.cache,
+                          restarts=args.restarts, seed=args.seed):
+            summary[record["status"]] += 1
+            print(json.dumps(record), file=output, flush=True)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    counts = " ".join(f"{status}={count}" for status, count in sorted(summary.items()))
+    print(f"c {len(paths)} instances in {time.perf_counter() - start:.2f}s: {counts}", file=sys.stderr)
@@ -0,0 +1,218 @@
+from __future__ import annotations
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import cdcl
+import cube
+import datalog
+import fragments
+from clausedb import ClauseDB
+from generators import (chain, datalog_girls, datalog_path, deep_implies, flat_coloring, model_or_chain, nested_iff,
+                        random_horn, random_kcnf, renamed_horn, tree)
+from hadeh import And, Symbol, convert_to_cnf
+from incremental import MaterializedClosure
+from main import Closure, forward_chaining, sld_resolution
+from parser import parse, parse_db, write_dimacs
+from session import Session
+from vectorized import RuleMatrix
+
+
+@dataclass
+class Benchmark:
+    name: str
+    sizes: list
+    setup: Callable[[Any], Any]
+    run: Callable[[Any], Any]
+
+
+_temp_files = set()  # made by _cnf_file, removed by measure once timed
+
+
+def _cnf_file(num_vars: int) -> str:
+    fd, path = tempfile.mkstemp(suffix=".cnf")
+    _temp_files.add(path)
+    with os.fdopen(fd, "w") as file:
+        write_dimacs(random_kcnf(num_vars), file)
+    return path
+
+
+def _horn_with_goal(size: int):
+    knowledge_base = random_horn(size, size // 2, seed=size)
+    return knowledge_base, [Symbol(f"p{size // 4}")]
+
+
+def _batch_goals(size: int):
+    knowledge_base, _ = _horn_with_goal(size)
+    symbols = [Symbol(f"p{i}") for i in range(size // 2)]
+    goals = [And(symbols[i], symbols[(i * 7) % len(symbols)]) if i % 2 else symbols[i] for i in range(len(symbols))]
+    return Closure(knowledge_base), goals
+
+
+def _updates(closure: MaterializedClosure, facts: list):
+    for fact in facts:
+        closure.assert_fact(fact)
+    for fact in facts:
+        closure.retract_fact(fact)
+
+
+def _session_queries(size: int):
+    knowledge_base, _ = _horn_with_goal(size)
+    return Session(knowledge_base), [Symbol(f"p{i}") for i in range(0, size // 2, 7)]
+
+
+BUNDLED = ["tc1.cnf", "tc2.cnf", "flat30-1.cnf"]  # reported by name, read from next to this file
+
+
+def _bundled(name: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+
+BENCHMARKS = [
+    Benchmark("parse/bundled", BUNDLED, _bundled, parse),
+    Benchmark("parse_db/random-3cnf", [1000, 4000, 16000], _cnf_file, parse_db),
+    Benchmark("cnf/equivalent/nested-iff", [2, 3, 4, 5], nested_iff, convert_to_cnf),
+    Benchmark("cnf/equisatisfiable/nested-iff", [8, 32, 128, 512], nested_iff,
+              lambda expr: convert_to_cnf(expr, mode="equisatisfiable")),
+    Benchmark("cnf/equivalent/deep-implies", [10000, 40000, 160000], deep_implies, convert_to_cnf),
+    Benchmark("cnf/model/or-chain", [10000, 40000, 160000], model_or_chain, lambda expr: expr.to_cnf()),
+    Benchmark("str/deep-implies", [10000, 40000, 160000], deep_implies, str),
+    Benchmark("str/model-or-chain", [10000, 40000, 160000], model_or_chain, str),
+    Benchmark("forward/chain", [1000, 4000, 16000], chain, forward_chaining),
+    Benchmark("forward/random-horn", [1000, 4000, 16000], lambda n: random_horn(n, n // 2, seed=n), forward_chaining),
+    Benchmark("forward/random-horn-db", [1000, 4000, 16000],
+              lambda n: ClauseDB.from_exprs(random_horn(n, n // 2, seed=n)), forward_chaining),
+    Benchmark("vectorized/random-horn", [1000, 4000, 16000], lambda n: RuleMatrix.from_kb(random_horn(n, n // 2, seed=n)),
+              lambda matrix: matrix.closure()),
+    Benchmark("vectorized/scenarios-64", [1000, 4000, 16000], lambda n: (
+        RuleMatrix.from_kb(random_horn(n, n // 2, seed=n)),
+        [[(f"p{(s * 31 + i) % (n // 2)}", True) for i in range(20)] for s in range(64)]),
+        lambda args: args[0].closure(args[1])),
+    Benchmark("datalog/girls", [10000, 100000, 1000000], datalog_girls, lambda args: datalog.evaluate(*args)),
+    Benchmark("datalog/path-chain", [100, 200, 400], datalog_path, lambda args: datalog.evaluate(*args)),
+    Benchmark("sld/chain", [1000, 4000, 16000], lambda n: (chain(n), [Symbol(f"p{n}")]),
+              lambda args: sld_resolution(*args)),
+    Benchmark("sld/tree", [256, 1024, 4096], lambda leaves: (tree(leaves.bit_length() - 1), [Symbol("t")]),
+              lambda args: sld_resolution(*args)),
+    Benchmark("sld/random-horn", [1000, 4000, 16000], _horn_with_goal, lambda args: sld_resolution(*args)),
+    Benchmark("goals/random-horn", [1000, 4000, 16000], _batch_goals, lambda args: args[0].holds_all(args[1])),
+    Benchmark("incremental/random-horn", [4000, 16000, 64000],
+              lambda n: (MaterializedClosure(random_horn(n, n // 2, seed=n)), [Symbol(f"p{i}") for i in range(0, n // 2, n // 200)]),
+              lambda args: _updates(*args)),
+    Benchmark("session/random-horn", [1000, 4000], _session_queries,
+              lambda args: [args[0].entails(goal) for goal in args[1]]),
+    Benchmark("cdcl/bundled", BUNDLED, lambda name: parse_db(_bundled(name)), cdcl.solve),
+    Benchmark("fragments/renamed-horn", [10000, 40000, 160000], renamed_horn, fragments.solve),
+    Benchmark("cdcl/renamed-horn", [10000, 40000, 160000], renamed_horn, cdcl.solve),
+    Benchmark("cdcl/random-3cnf", [50, 100, 150], random_kcnf, cdcl.solve),
+    Benchmark("cube/lookahead/flat-coloring", [50, 100, 200], flat_coloring, lambda db: cube.Cuber(db).cubes(4)),
+    Benchmark("cdcl/flat-coloring", [50, 100, 200], flat_coloring, cdcl.solve),
+]
+
+
+def measure(benchmark: Benchmark, size, repeat: int) -> dict:
+    data = benchmark.setup(size)
+    try:
+        seconds = math.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            benchmark.run(data)
+            seconds = min(seconds, time.perf_counter() - start)
+
+        # Separate run, tracemalloc slows everything down
+        tracemalloc.start()
+        benchmark.run(data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        if isinstance(data, str) and data in _temp_files:
+            _temp_files.discard(data)
+            os.remove(data)
+    return {"size": size, "seconds": seconds, "peak_bytes": peak}
+
+
+def scaling(points: list[dict]) -> float | None:
+    # Exponent b of time ~ size^b between the smallest and largest size
+    first, last = points[0], points[-1]
+    if not isinstance(first["size"], (int, float)) or len(points) < 2:
+        return None
+    if first["seconds"] <= 0 or last["seconds"] <= 0:
+        return None
+    return math.log(last["seconds"] / first["seconds"]) / math.log(last["size"] / first["size"])
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(only: str | None = None, quick: bool = False, repeat: int = 3) -> dict:
+    results = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": {},
+    }
+    for benchmark in BENCHMARKS:
+        if only and only not in benchmark.name:
+            continue
+        sizes = benchmark.sizes[:2] if quick else benchmark.sizes
+        points = []
+        for size in sizes:
+            point = measure(benchmark, size, repeat)
+            points.append(point)
+            print(f"{benchmark.name:36} {str(size):>14} {point['seconds'] * 1000:10.2f} ms {point['peak_bytes'] / 1024:10.0f} KiB")
+        exponent = scaling(points)
+        if exponent is not None:
+            print(f"{benchmark.name:36} {'scaling':>14} {'~n^%.2f' % exponent:>13}")
+        results["benchmarks"][benchmark.name] = {"points": points, "scaling": exponent}
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, current in results["benchmarks"].items():
+        old = {str(p["size"]): p for p in baseline.get("benchmarks", {}).get(name, {}).get("points", [])}
+        for point in current["points"]:
+            before = old.get(str(point["size"]))
+            if before is None or before["seconds"] <= 0:
+                continue
+            ratio = point["seconds"] / before["seconds"]
+            flag = "REGRESSION" if ratio > threshold else ""
+            print(f"{name:36} {str(point['size']):>14} {ratio:8.2f}x {flag}")
+            if flag:
+                regressions.append(f"{name}[{point['size']}]")
+    return regressions
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Time and memory benchmarks for parsing, CNF conversion and inference")
+    arg_parser.add_argument("--only", help="run benchmarks whose name contains this string")
+    arg_parser.add_argument("--quick", action="store_true", help="only the two smallest sizes of each benchmark")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--save", metavar="FILE", help="write results as a JSON baseline")
+    arg_parser.add_argument("--compare", metavar="FILE", help="compare against a saved JSON baseline")
+    arg_parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = arg_parser.parse_args()
+
+    results = run(args.only, args.quick, args.repeat)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print("Regressions:", ", ".join(regressions))
+            sys.exit(1)
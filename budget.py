@@ -0,0 +1,81 @@
+from __future__ import annotations
+import threading
+import time
+
+# Resource limits for one inference call, shared by every engine:
+#
+#   seconds    wall-clock deadline, from when the budget is made
+#   steps      units of work: propagated literals (CDCL, Horn), resolved
+#              subgoals (SLD), clauses built (CNF), derived tuples (Datalog)
+#   conflicts  CDCL conflicts
+#   live       clauses (or facts, tuples) the engine holds at once
+#   token      anything with is_set(), e.g. a threading or multiprocessing
+#              Event; cancel() sets it from another thread or a signal handler
+#
+# Engines keep their own step counter and only call check() once it reaches
+# the count the previous check() returned, so the hot loop pays a single
+# integer comparison. Engines that answer with a status return "UNKNOWN"
+# when the budget runs out; those that return a value raise BudgetExceeded,
+# with what they had derived so far where that is sound on its own: forward
+# chaining's facts, a Datalog model, and for CNF conversion in "equivalent"
+# mode the clauses of the conjuncts already converted (a Tseitin encoding
+# cut short has none). Counters in a Stats passed alongside are filled in
+# either way.
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, reason: str, partial=None):
+        super().__init__(f"budget exhausted: {reason}")
+        self.reason = reason  # "deadline", "steps", "conflicts", "live" or "cancelled"
+        self.partial = partial
+
+
+class Budget:
+    interval = 1024  # steps between deadline and cancellation checks
+
+    def __init__(self, seconds: float | None = None, steps: int | None = None, conflicts: int | None = None,
+                 live: int | None = None, token=None):
+        self.deadline = None if seconds is None else time.monotonic() + seconds
+        self.steps = steps
+        self.conflicts = conflicts
+        self.live = live
+        self.token = threading.Event() if token is None else token
+        self.exhausted = None  # reason, once a check has failed
+
+    def cancel(self):
+        self.token.set()
+
+    def check(self, steps: int = 0, live: int = 0, conflicts: int = 0) -> int:
+        # Raises BudgetExceeded, or returns the step count for the next check
+        if self.token.is_set():
+            self._exceeded("cancelled")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self._exceeded("deadline")
+        if self.steps is not None and steps > self.steps:
+            self._exceeded("steps")
+        if self.conflicts is not None and conflicts > self.conflicts:
+            self._exceeded("conflicts")
+        if self.live is not None and live > self.live:
+            self._exceeded("live")
+        return steps + self.interval if self.steps is None else min(steps + self.interval, self.steps)
+
+    def split(self, parts: int, steps: int = 0, conflicts: int = 0) -> dict:
+        # Budget() arguments for one of `parts` workers in other processes
+        # sharing this budget, of which steps and conflicts are used up: the
+        # time left, an even share of the steps and conflicts left, and the
+        # live limit as it is, since every worker holds its own clauses.
+        # The token does not cross processes; pass a multiprocessing Event.
+        share = lambda limit, used: None if limit is None else max(1, (limit - used) // parts)
+        return {
+            "seconds": None if self.deadline is None else self.deadline - time.monotonic(),
+            "steps": share(self.steps, steps),
+            "conflicts": share(self.conflicts, conflicts),
+            "live": self.live,
+        }
+
+    def conflict_limit(self) -> float:
+        return float("inf") if self.conflicts is None else self.conflicts
+
+    def _exceeded(self, reason: str):
+        self.exhausted = reason
+        raise BudgetExceeded(reason)
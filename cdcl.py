@@ -0,0 +1,643 @@
+from __future__ import annotations
+import heapq
+import random
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from budget import Budget, BudgetExceeded
+from clausedb import ClauseDB
+from proof import ProofWriter
+from stats import Stats
+
+# Literals are encoded as 2*var for var and 2*var + 1 for ¬var, so that
+# negation is lit ^ 1 and both values of a variable live side by side.
+TRUE, FALSE, UNASSIGNED = 1, -1, 0
+
+
+def _encode(lit: int) -> int:
+    return 2 * lit if lit > 0 else -2 * lit + 1
+
+
+def _decode(lit: int) -> int:
+    return -(lit >> 1) if lit & 1 else lit >> 1
+
+
+@dataclass
+class SolveResult:
+    status: str  # "SAT", "UNSAT" or "UNKNOWN"
+    model: list[int] | None = None
+    stats: dict = field(default_factory=dict)
+    core: list[int] | None = None  # assumptions that made it UNSAT
+    route: str = "cdcl"  # decision procedure used, see fragments.solve
+    reason: str | None = None
+    exhausted: str | None = None  # the budget limit that ran out, when UNKNOWN
+
+
+class _Clause:
+    __slots__ = ("lits", "learnt", "activity", "lbd", "deleted", "id")
+
+    def __init__(self, lits: list[int], learnt: bool = False, lbd: int = 0, clause_id: int = 0):
+        self.lits = lits
+        self.id = clause_id  # proof clause id, 0 without a proof
+        self.learnt = learnt
+        self.activity = 0.0
+        self.lbd = lbd
+        self.deleted = False
+
+
+def luby(i: int) -> int:
+    # 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...
+    size, seq = 1, 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i %= size
+    return 1 << seq
+
+
+class Solver:
+    def __init__(
+        self,
+        db: ClauseDB | None = None,
+        seed: int = 0,
+        restarts: str = "luby",
+        restart_base: int = 100,
+        var_decay: float = 0.95,
+        clause_decay: float = 0.999,
+        initial_phase: bool = False,
+        stats: Stats | None = None,
+        proof: ProofWriter | None = None,
+        exchange=None,
+    ):
+        if restarts not in ("luby", "glucose"):
+            raise ValueError(f"Unknown restart policy: {restarts}")
+        if exchange is not None and proof is not None:
+            raise ValueError("Imported clauses have no proof, so a proof cannot be combined with clause exchange")
+        self.restarts = restarts
+        self.restart_base = restart_base
+        self.var_decay = var_decay
+        self.clause_decay = clause_decay
+        self.initial_phase = initial_phase
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.stats = stats
+        self.proof = proof
+        # Clause sharing with other solvers on the same formula, see
+        # portfolio.ClauseRing: learnt clauses up to exchange.max_len
+        # literals go to export(), receive() is drained at every restart
+        self.exchange = exchange
+        self.exported = self.imported = 0
+        self.unit_ids = {}  # level-0 variable -> id of its unit clause in the proof
+        self.hints = []
+
+        self.num_vars = 0
+        self.value = [UNASSIGNED, UNASSIGNED]  # per literal
+        self.level = [0]
+        self.reason = [None]
+        self.phase = [initial_phase]
+        self.activity = [0.0]
+        self.watches = [[], []]
+        self.heap = []
+        self.var_inc = 1.0
+        self.clause_inc = 1.0
+
+        self.clauses = []
+        self.learnts = []
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+        self.ok = True
+        self.assumptions = []
+        self.core = None
+        self.budget = None
+        self.budget_base = (0, 0)  # propagations and conflicts when solve() was called
+        self.next_check = self.conflict_limit = float("inf")
+
+        self.conflicts = 0
+        self.decisions = 0
+        self.propagations = 0
+        self.restart_count = 0
+        self.reductions = 0
+        self.max_learnts = 0
+        self.lbd_slow = 0.0
+
+        if db is not None:
+            if proof is not None:
+                proof.reserve(len(db))
+            self.reserve(db.num_vars)
+            for clause in db:
+                self.add_clause(clause)
+
+    # -- variables and clauses ------------------------------------------
+
+    def reserve(self, num_vars: int):
+        while self.num_vars < num_vars:
+            self.num_vars += 1
+            self.value += [UNASSIGNED, UNASSIGNED]
+            self.level.append(0)
+            self.reason.append(None)
+            self.phase.append(self.initial_phase)
+            activity = self.rng.random() * 1e-5 if self.seed else 0.0
+            self.activity.append(activity)
+            self.watches += [[], []]
+            heapq.heappush(self.heap, (-activity, self.num_vars))
+
+    def add_clause(self, lits: Iterable[int], learnt: bool = False) -> bool:
+        # Only at decision level 0; returns False once the formula is UNSAT.
+        # learnt: implied by the clauses already there, and may be deleted
+        # again by clause database reduction
+        clause_id = self.proof.original() if self.proof is not None else 0
+        if not self.ok:
+            return False
+        lits = list(dict.fromkeys(_encode(lit) for lit in lits))
+        self.reserve(max((lit >> 1 for lit in lits), default=0))
+
+        clause = []
+        for lit in lits:
+            if self.value[lit] == TRUE or lit ^ 1 in clause:
+                return True  # satisfied or tautology
+            if self.value[lit] == UNASSIGNED:
+                clause.append(lit)
+
+        if self.proof is not None and self.proof.hints and len(clause) < len(lits):
+            # LRAT: the clause without its level-0 false literals is a new clause
+            hints = [self._unit_id(lit >> 1) for lit in lits if self.value[lit] == FALSE]
+            clause_id = self.proof.add([_decode(lit) for lit in clause], hints + [clause_id])
+
+        if not clause:
+            self.ok = False
+            if self.proof is not None and not self.proof.hints:
+                self.proof.add([])
+        elif len(clause) == 1:
+            self._assign(clause[0], None)
+            if self.proof is not None:
+                self.unit_ids[clause[0] >> 1] = clause_id
+            conflict = self._propagate()
+            if conflict is not None:
+                self.ok = False
+                self._refute(conflict)
+        elif learnt:
+            c = _Clause(clause, learnt=True, lbd=len(clause), clause_id=clause_id)
+            self.learnts.append(c)
+            self._watch(c)
+        else:
+            c = _Clause(clause, clause_id=clause_id)
+            self.clauses.append(c)
+            self._watch(c)
+        return self.ok
+
+    def _watch(self, c: _Clause):
+        self.watches[c.lits[0]].append(c)
+        self.watches[c.lits[1]].append(c)
+
+    # -- assignment -----------------------------------------------------
+
+    def _assign(self, lit: int, reason: _Clause | None):
+        var = lit >> 1
+        self.value[lit] = TRUE
+        self.value[lit ^ 1] = FALSE
+        self.level[var] = len(self.trail_lim)
+        self.reason[var] = reason
+        self.trail.append(lit)
+
+    def _cancel_until(self, level: int):
+        if len(self.trail_lim) <= level:
+            return
+        value, phase, reason, activity, heap = self.value, self.phase, self.reason, self.activity, self.heap
+        start = self.trail_lim[level]
+        for lit in self.trail[start:]:
+            var = lit >> 1
+            value[lit] = value[lit ^ 1] = UNASSIGNED
+            phase[var] = not lit & 1
+            reason[var] = None
+            heapq.heappush(heap, (-activity[var], var))
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.qhead = len(self.trail)
+
+    def _propagate(self) -> _Clause | None:
+        # Two watched literals: a clause is only visited when one of its two
+        # watched literals becomes false.
+        value, watches, trail = self.value, self.watches, self.trail
+        conflict = None
+        while self.qhead < len(trail):
+            false_lit = trail[self.qhead] ^ 1
+            self.qhead += 1
+            self.propagations += 1
+            ws = watches[false_lit]
+            i = j = 0
+            n = len(ws)
+            while i < n:
+                c = ws[i]
+                i += 1
+                if c.deleted:
+                    continue
+                lits = c.lits
+                if lits[0] == false_lit:
+                    lits[0], lits[1] = lits[1], false_lit
+                first = lits[0]
+                if value[first] == TRUE:
+                    ws[j] = c
+                    j += 1
+                    continue
+                for k in range(2, len(lits)):
+                    if value[lits[k]] != FALSE:
+                        lits[1], lits[k] = lits[k], false_lit
+                        watches[lits[1]].append(c)
+                        break
+                else:
+                    ws[j] = c
+                    j += 1
+                    if value[first] == FALSE:
+                        conflict = c
+                        while i < n:
+                            ws[j] = ws[i]
+                            j += 1
+                            i += 1
+                    else:
+                        self._assign(first, c)
+            del ws[j:]
+            if conflict is not None:
+                self.qhead = len(trail)
+                return conflict
+        return None
+
+    # -- conflict analysis ----------------------------------------------
+
+    def _bump_var(self, var: int):
+        self.activity[var] += self.var_inc
+        if self.activity[var] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.var_inc *= 1e-100
+            self._rebuild_heap()
+        elif self.value[2 * var] == UNASSIGNED:
+            heapq.heappush(self.heap, (-self.activity[var], var))
+            if len(self.heap) > 4 * self.num_vars + 64:
+                self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        # The heap keeps stale entries instead of updating keys in place
+        self.heap = [(-self.activity[v], v) for v in range(1, self.num_vars + 1) if self.value[2 * v] == UNASSIGNED]
+        heapq.heapify(self.heap)
+
+    def _bump_clause(self, c: _Clause):
+        c.activity += self.clause_inc
+        if c.activity > 1e20:
+            for learnt in self.learnts:
+                learnt.activity *= 1e-20
+            self.clause_inc *= 1e-20
+
+    def _analyze(self, conflict: _Clause) -> tuple[list[int], int]:
+        # First unique implication point
+        level, reason = self.level, self.reason
+        current = len(self.trail_lim)
+        seen = set()
+        learnt = [0]
+        pending = 0
+        index = len(self.trail) - 1
+        lit = None
+        c = conflict
+        chain = [] if self.proof is not None and self.proof.hints else None
+        while True:
+            if c.learnt:
+                self._bump_clause(c)
+            if chain is not None:
+                chain.append(c)
+            for q in (c.lits if lit is None else c.lits[1:]):
+                var = q >> 1
+                if var not in seen and level[var] > 0:
+                    seen.add(var)
+                    self._bump_var(var)
+                    if level[var] >= current:
+                        pending += 1
+                    else:
+                        learnt.append(q)
+            while (self.trail[index] >> 1) not in seen:
+                index -= 1
+            lit = self.trail[index]
+            index -= 1
+            c = reason[lit >> 1]
+            pending -= 1
+            if pending == 0:
+                break
+        learnt[0] = lit ^ 1
+
+        # Drop literals implied by the rest of the clause
+        minimized = [learnt[0]]
+        for q in learnt[1:]:
+            r = reason[q >> 1]
+            if r is None or any((x >> 1) not in seen and level[x >> 1] > 0 for x in r.lits[1:]):
+                minimized.append(q)
+        if chain is not None:
+            removed = [reason[q >> 1] for q in learnt[1:] if q not in minimized]
+            self.hints = self._lrat_hints(chain, removed)
+        learnt = minimized
+
+        if len(learnt) == 1:
+            return learnt, 0
+        best = max(range(1, len(learnt)), key=lambda k: level[learnt[k] >> 1])
+        learnt[1], learnt[best] = learnt[best], learnt[1]
+        return learnt, level[learnt[1] >> 1]
+
+    def _analyze_final(self, p: int) -> list[int]:
+        # The assumptions whose decisions lead to ¬p, together with p itself
+        core = [p]
+        if not self.trail_lim:
+            return core
+        seen = {p >> 1}
+        for lit in reversed(self.trail[self.trail_lim[0]:]):
+            var = lit >> 1
+            if var not in seen:
+                continue
+            r = self.reason[var]
+            if r is None:
+                core.append(lit)
+            else:
+                seen.update(q >> 1 for q in r.lits[1:] if self.level[q >> 1] > 0)
+        return core
+
+    # -- proof logging --------------------------------------------------
+
+    def _unit_id(self, var: int) -> int:
+        # Proof id of the unit clause of a level-0 variable. Units implied by
+        # propagation are only written to the proof when a hint needs them.
+        stack = [var]
+        while stack:
+            v = stack[-1]
+            if v in self.unit_ids:
+                stack.pop()
+                continue
+            r = self.reason[v]
+            missing = [q >> 1 for q in r.lits[1:] if (q >> 1) not in self.unit_ids]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            hints = [self.unit_ids[q >> 1] for q in r.lits[1:]] + [r.id]
+            self.unit_ids[v] = self.proof.add([_decode(r.lits[0])], hints)
+        return self.unit_ids[var]
+
+    def _lrat_hints(self, chain: list[_Clause], removed: list[_Clause]) -> list[int]:
+        # Level-0 units first, then the reasons of minimized-away literals and
+        # of the resolved literals in trail order, and the conflict last: each
+        # is unit under the negated learnt clause and the ones before it.
+        if len(removed) > 1:
+            position = {lit >> 1: i for i, lit in enumerate(self.trail)}
+            removed.sort(key=lambda c: position[c.lits[0] >> 1])
+        clauses = removed + chain[::-1]
+        units = dict.fromkeys(q >> 1 for c in clauses for q in c.lits if self.level[q >> 1] == 0)
+        return [self._unit_id(var) for var in units] + [c.id for c in clauses]
+
+    def _refute(self, conflict: _Clause):
+        # A conflict at level 0: log the empty clause
+        if self.proof is None:
+            return
+        hints = []
+        if self.proof.hints:
+            hints = [self._unit_id(lit >> 1) for lit in conflict.lits] + [conflict.id]
+        self.proof.add([], hints)
+
+    # -- search ---------------------------------------------------------
+
+    def _decide(self) -> int | None:
+        heap, value, activity = self.heap, self.value, self.activity
+        while heap:
+            negative, var = heapq.heappop(heap)
+            if value[2 * var] == UNASSIGNED and -negative == activity[var]:
+                return 2 * var if self.phase[var] else 2 * var + 1
+        return None
+
+    def _reduce_db(self):
+        # Keep glue clauses (LBD <= 2) and the better half of the rest
+        self.reductions += 1
+        if self.stats is not None:
+            self.stats.peak("learnts", len(self.learnts))
+        locked = {id(self.reason[lit >> 1]) for lit in self.trail}
+        self.learnts.sort(key=lambda c: (c.lbd, -c.activity))
+        keep = len(self.learnts) // 2
+        kept = []
+        for i, c in enumerate(self.learnts):
+            if i < keep or c.lbd <= 2 or id(c) in locked:
+                kept.append(c)
+            else:
+                c.deleted = True
+                if self.proof is not None:
+                    self.proof.delete([_decode(lit) for lit in c.lits], c.id)
+        self.learnts = kept
+
+    def _search(self, max_conflicts: int) -> str | None:
+        conflicts = 0
+        fast = 0.0
+        while True:
+            conflict = self._propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                conflicts += 1
+                if self.conflicts > self.conflict_limit:
+                    self._check_budget()
+                if not self.trail_lim:
+                    self._refute(conflict)
+                    return "UNSAT"
+                if self.stats is not None:
+                    self.stats.peak("trail", len(self.trail))
+                    if self.conflicts % 1024 == 0:
+                        self.stats.tick("cdcl", **self.statistics())
+                learnt, back_level = self._analyze(conflict)
+                self._cancel_until(back_level)
+                clause_id = 0
+                if self.proof is not None:
+                    clause_id = self.proof.add([_decode(lit) for lit in learnt], self.hints)
+                if len(learnt) == 1:
+                    self._assign(learnt[0], None)
+                    if self.proof is not None:
+                        self.unit_ids[learnt[0] >> 1] = clause_id
+                else:
+                    lbd = len({self.level[lit >> 1] for lit in learnt})
+                    c = _Clause(learnt, learnt=True, lbd=lbd, clause_id=clause_id)
+                    self._bump_clause(c)
+                    self.learnts.append(c)
+                    self._watch(c)
+                    self._assign(learnt[0], c)
+                    # Glucose: restart when recent LBDs are worse than the long-run average
+                    fast += (lbd - fast) / 32
+                    self.lbd_slow += (lbd - self.lbd_slow) / 4096
+                if self.exchange is not None and len(learnt) <= self.exchange.max_len:
+                    self.exchange.export([_decode(lit) for lit in learnt])
+                    self.exported += 1
+                self.var_inc /= self.var_decay
+                self.clause_inc /= self.clause_decay
+                continue
+
+            if self.propagations >= self.next_check:
+                self._check_budget()
+            if self.restarts == "luby":
+                restart = conflicts >= max_conflicts
+            else:
+                restart = conflicts >= 50 and fast > 1.25 * self.lbd_slow
+            if restart:
+                self._cancel_until(0)
+                return None
+            if len(self.learnts) - len(self.trail) >= self.max_learnts:
+                self._reduce_db()
+                self.max_learnts = int(self.max_learnts * 1.1)
+
+            lit = None
+            while len(self.trail_lim) < len(self.assumptions):
+                # Assumptions are decided first, one per decision level
+                p = self.assumptions[len(self.trail_lim)]
+                if self.value[p] == TRUE:
+                    self.trail_lim.append(len(self.trail))
+                elif self.value[p] == FALSE:
+                    self.core = self._analyze_final(p)
+                    return "UNSAT"
+                else:
+                    lit = p
+                    break
+            if lit is None:
+                lit = self._decide()
+                if lit is None:
+                    return "SAT"
+            self.decisions += 1
+            self.trail_lim.append(len(self.trail))
+            self._assign(lit, None)
+
+    def _check_budget(self):
+        propagations, conflicts = self.budget_base
+        live = len(self.clauses) + len(self.learnts)
+        self.next_check = propagations + self.budget.check(self.propagations - propagations, live,
+                                                           self.conflicts - conflicts)
+
+    def _assume(self, lits: list[int]) -> bool:
+        # Opens a decision level with lits assigned and propagated; False on
+        # a conflict (the level stays open either way)
+        self.trail_lim.append(len(self.trail))
+        for lit in lits:
+            if self.value[lit] == FALSE:
+                return False
+            if self.value[lit] == UNASSIGNED:
+                self._assign(lit, None)
+                if self._propagate() is not None:
+                    return False
+        return True
+
+    def probe(self, lits: Iterable[int]) -> list[int] | None:
+        # The literals that assuming lits assigns by unit propagation on top
+        # of level 0 (lits included), or None if they lead to a conflict.
+        # Leaves the solver at level 0, as it was.
+        if not self.ok:
+            return None
+        self._cancel_until(0)
+        lits = [_encode(lit) for lit in lits]
+        self.reserve(max((lit >> 1 for lit in lits), default=0))
+        start = len(self.trail)
+        implied = [_decode(lit) for lit in self.trail[start:]] if self._assume(lits) else None
+        self._cancel_until(0)
+        return implied
+
+    def lookahead(self, cube: Iterable[int], lits: Iterable[int]) -> list[int | None] | None:
+        # For each of lits, how many literals assuming it on top of cube
+        # assigns by unit propagation (None if it conflicts); None if the
+        # cube itself does. The cube is propagated once for all of them.
+        if not self.ok:
+            return None
+        self._cancel_until(0)
+        cube, lits = [_encode(lit) for lit in cube], [_encode(lit) for lit in lits]
+        self.reserve(max((lit >> 1 for lit in cube + lits), default=0))
+        counts = None
+        if self._assume(cube):
+            counts = []
+            for lit in lits:
+                start = len(self.trail)
+                counts.append(len(self.trail) - start if self._assume([lit]) else None)
+                self._cancel_until(1)
+        self._cancel_until(0)
+        return counts
+
+    def _import(self) -> bool:
+        # At level 0 between restarts; the clauses follow from the formula,
+        # so an empty one means it is UNSAT
+        for lits in self.exchange.receive():
+            self.imported += 1
+            if not self.add_clause(lits, learnt=True):
+                return False
+        return True
+
+    def statistics(self) -> dict:
+        statistics = {
+            "conflicts": self.conflicts,
+            "decisions": self.decisions,
+            "propagations": self.propagations,
+            "restarts": self.restart_count,
+            "learnts": len(self.learnts),
+            "reductions": self.reductions,
+        }
+        if self.exchange is not None:
+            statistics.update(exported=self.exported, imported=self.imported)
+        return statistics
+
+    def solve(self, assumptions: Iterable[int] = (), budget: Budget | None = None) -> SolveResult:
+        if self.stats is None:
+            return self._solve(assumptions, budget)
+        before = self.statistics()
+        with self.stats.phase("solve"):
+            result = self._solve(assumptions, budget)
+        for name, value in result.stats.items():
+            if name != "learnts":
+                self.stats.add(name, value - before[name])
+        self.stats.peak("learnts", len(self.learnts))
+        self.stats.emit("done", engine="cdcl", status=result.status)
+        return result
+
+    def _solve(self, assumptions: Iterable[int], budget: Budget | None) -> SolveResult:
+        # Learnt clauses and level-0 facts are kept between calls, so
+        # repeated solving under different assumptions is incremental.
+        self.assumptions = [_encode(lit) for lit in assumptions]
+        self.reserve(max((lit >> 1 for lit in self.assumptions), default=0))
+        self.core = None
+        if not self.ok:
+            return SolveResult("UNSAT", stats=self.statistics(), core=[])
+        conflict = self._propagate()
+        if conflict is not None:
+            self.ok = False
+            self._refute(conflict)
+            return SolveResult("UNSAT", stats=self.statistics(), core=[])
+
+        self.max_learnts = max(len(self.clauses) // 3, 1000)
+        self.budget = budget
+        if budget is not None:
+            self.budget_base = self.propagations, self.conflicts
+            self.conflict_limit = self.conflicts + budget.conflict_limit()
+        status = None
+        try:
+            if budget is not None:
+                self._check_budget()
+            while status is None:
+                status = self._search(luby(self.restart_count) * self.restart_base)
+                if status is None:
+                    self.restart_count += 1
+                    if self.exchange is not None and not self._import():
+                        status = "UNSAT"
+        except BudgetExceeded as exceeded:
+            self._cancel_until(0)
+            return SolveResult("UNKNOWN", stats=self.statistics(), exhausted=exceeded.reason)
+        finally:
+            self.budget = None
+            self.next_check = self.conflict_limit = float("inf")
+
+        model = core = None
+        if status == "SAT":
+            model = [v if self.value[2 * v] == TRUE else -v for v in range(1, self.num_vars + 1)]
+        elif self.core is None:
+            self.ok = False  # UNSAT without assumptions
+            core = []
+        else:
+            core = [_decode(lit) for lit in self.core]
+        self._cancel_until(0)
+        return SolveResult(status, model, self.statistics(), core)
+
+
+def solve(db: ClauseDB, budget: Budget | None = None, **options) -> SolveResult:
+    return Solver(db, **options).solve(budget=budget)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+import itertools
+import os
+
+import pytest
+
+import cdcl
+from clausedb import ClauseDB
+from generators import flat_coloring, random_kcnf, renamed_horn
+from parser import parse_db
+
+
+def _satisfies(db: ClauseDB, model: list[int]) -> bool:
+    true = set(model)
+    return all(any(lit in true for lit in clause) for clause in db)
+
+
+def _brute_force(db: ClauseDB) -> bool:
+    clauses = [clause.tolist() for clause in db]
+    for values in itertools.product((False, True), repeat=db.num_vars):
+        if all(any(values[abs(lit) - 1] == (lit > 0) for lit in clause) for clause in clauses):
+            return True
+    return False
+
+
+# Small enough to enumerate, and around the threshold so both answers occur
+INSTANCES = ([random_kcnf(num_vars, ratio, seed=seed) for num_vars, ratio in [(8, 4.26), (12, 4.26), (12, 5.5)]
+              for seed in range(10)]
+             + [random_kcnf(12, ratio, k=2, seed=seed) for ratio in (0.8, 1.2) for seed in range(10)]
+             + [renamed_horn(12, ratio, seed=seed) for ratio in (2.0, 4.0) for seed in range(10)])
+
+
+@pytest.mark.parametrize("db", INSTANCES)
+def test_agrees_with_brute_force(db):
+    result = cdcl.solve(db)
+    assert result.status == ("SAT" if _brute_force(db) else "UNSAT")
+    if result.status == "SAT":
+        assert _satisfies(db, result.model)
+
+
+@pytest.mark.parametrize("name", ["tc1.cnf", "tc2.cnf", "flat30-1.cnf"])
+def test_bundled_models(name):
+    db = parse_db(os.path.join(os.path.dirname(os.path.abspath(__file__)), name))
+    result = cdcl.solve(db)
+    assert result.status == "SAT" and _satisfies(db, result.model)
+
+
+@pytest.mark.parametrize("num_vertices", [50, 100])
+def test_larger_models(num_vertices):
+    db = flat_coloring(num_vertices)
+    result = cdcl.solve(db)
+    assert result.status == "SAT" and _satisfies(db, result.model)
+
+
+def test_both_answers_occur():
+    statuses = {cdcl.solve(db).status for db in INSTANCES}
+    assert statuses == {"SAT", "UNSAT"}
+
+
+@pytest.mark.parametrize("db", INSTANCES)
+def test_assumptions(db):
+    solver = cdcl.Solver(db)
+    for assumptions in [[1], [-1, 2], [3, -4, 5]]:
+        result = solver.solve(assumptions)
+        extended = ClauseDB(db.symbols)
+        for clause in db:
+            extended.add_clause(clause.tolist())
+        for lit in assumptions:
+            extended.add_clause([lit])
+        assert result.status == ("SAT" if _brute_force(extended) else "UNSAT")
+        if result.status == "SAT":
+            assert _satisfies(extended, result.model)
+        else:
+            assert set(result.core) <= set(assumptions)
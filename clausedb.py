@@ -0,0 +1,140 @@
+from __future__ import annotations
+from array import array
+from typing import Iterable, Iterator
+
+import hadeh
+import model
+from logic import Expr, conjuncts, disjuncts, family_of, literal_key, make_literal
+
+
+class SymbolTable:
+    def __init__(self):
+        self.names = [None]  # variable 0 is unused, literals are ±var
+        self.ids = {}
+
+    def __len__(self) -> int:
+        return len(self.names) - 1
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def var(self, name: str) -> int:
+        var = self.ids.get(name)
+        if var is None:
+            var = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return var
+
+    def name(self, var: int) -> str:
+        return self.names[abs(var)]
+
+    def new_var(self, prefix: str = "_aux") -> int:
+        name = f"{prefix}{len(self.names)}"
+        while name in self.ids:
+            name += "'"
+        return self.var(name)
+
+
+class Clause:
+    # O(1) view of one clause inside the flat literal buffer
+    __slots__ = ("lits", "start", "end")
+
+    def __init__(self, lits: array, start: int, end: int):
+        self.lits = lits
+        self.start = start
+        self.end = end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, i: int) -> int:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("clause literal index out of range")
+        return self.lits[self.start + i]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.lits[self.start:self.end])
+
+    def tolist(self) -> list[int]:
+        return self.lits[self.start:self.end].tolist()
+
+    def __repr__(self):
+        return f"Clause({self.tolist()})"
+
+
+class ClauseDB:
+    def __init__(self, symbols: SymbolTable | None = None):
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.lits = array("i")
+        self.offsets = array("q", [0])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[Clause]:
+        for i in range(len(self)):
+            yield Clause(self.lits, self.offsets[i], self.offsets[i + 1])
+
+    @property
+    def num_vars(self) -> int:
+        return len(self.symbols)
+
+    def clause(self, i: int) -> Clause:
+        return Clause(self.lits, self.offsets[i], self.offsets[i + 1])
+
+    def add_clause(self, lits: Iterable[int]) -> int:
+        self.lits.extend(lits)
+        self.offsets.append(len(self.lits))
+        return len(self.offsets) - 2
+
+    def literal(self, expr: Expr) -> int:
+        key = literal_key(expr)
+        if key is None:
+            raise ValueError(f"Not a literal: {expr}")
+        var = self.symbols.var(key[0])
+        return var if key[1] else -var
+
+    def add_expr(self, expr: Expr):
+        for clause in conjuncts(_clausal(expr)):
+            lits = [self.literal(op) for op in disjuncts(clause)]
+            self.add_clause(dict.fromkeys(lits))
+
+    def to_expr(self, lits: Iterable[int], family=hadeh) -> Expr:
+        ops = [make_literal((self.symbols.name(lit), lit > 0), family) for lit in lits]
+        if len(ops) == 1:
+            return ops[0]
+        if family is model:
+            expr = ops[-1]
+            for op in reversed(ops[:-1]):
+                expr = model.Or(op, expr)
+            return expr
+        return family.Or(*ops)
+
+    def to_exprs(self, family=hadeh) -> list[Expr]:
+        return [self.to_expr(clause, family) for clause in self]
+
+    @classmethod
+    def from_exprs(cls, exprs: Iterable[Expr], symbols: SymbolTable | None = None) -> ClauseDB:
+        db = cls(symbols)
+        for expr in exprs:
+            db.add_expr(expr)
+        return db
+
+
+def _is_clause(expr: Expr) -> bool:
+    return all(literal_key(op) is not None for op in disjuncts(expr))
+
+
+def _clausal(expr: Expr) -> Expr:
+    if all(_is_clause(clause) for clause in conjuncts(expr)):
+        return expr
+    if family_of(expr) is hadeh:
+        return hadeh.convert_to_cnf(expr)
+    while not all(_is_clause(clause) for clause in conjuncts(expr)):
+        converted = expr.to_cnf()
+        if converted == expr:
+            raise ValueError(f"Cannot convert to clauses: {expr}")
+        expr = converted
+    return expr
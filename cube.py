@@ -0,0 +1,183 @@
+from __future__ import annotations
+import math
+import multiprocessing
+import signal
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from budget import Budget, BudgetExceeded
+from cdcl import SolveResult, Solver
+from clausedb import ClauseDB
+from stats import Stats
+
+# Cube and conquer: a lookahead cuber splits the formula into cubes, partial
+# assignments that together cover every assignment, and a pool of CDCL
+# workers solves the formula under each cube as assumptions. Any SAT cube
+# gives a model; the formula is UNSAT once every cube is.
+#
+# Every cube is first tried with a conflict limit. A cube that runs out
+# comes back to the parent, which splits it in two with another lookahead
+# and queues both halves, so idle workers take over part of the hard cubes
+# instead of waiting for the worker that drew them. Each split doubles the
+# limit, so a cube the lookahead cannot simplify is still solved eventually.
+# The parent adds up the conflicts and propagations the workers report and
+# checks them against the budget; every cube also runs under the time left
+# and a share of what is left of those limits, so none overshoots by much.
+
+
+class Cuber:
+    # Lookahead on unit propagation: for the most frequent free variables,
+    # propagate both values under the cube and branch on the variable whose
+    # two sides assign the most (product of the two counts, which prefers
+    # balanced splits). A value that fails is a failed literal: its negation
+    # joins the cube. Both values failing refutes the cube.
+    def __init__(self, db: ClauseDB, candidates: int = 24):
+        self.solver = Solver(db)
+        occurrences = Counter(abs(lit) for clause in db for lit in clause)
+        self.order = [var for var, _ in occurrences.most_common()]
+        self.fixed = {lit >> 1 for lit in self.solver.trail}  # decided by level-0 propagation
+        self.candidates = candidates
+        self.probes = self.refuted = 0
+
+    def lookahead(self, cube: list[int]) -> tuple[int | None, list[int]] | None:
+        # (branching variable or None if nothing is left to branch on, cube
+        # with its failed literals), or None if the cube is refuted
+        cube = list(cube)
+        while True:
+            assigned = self.solver.probe(cube)
+            if assigned is None:
+                return None
+            assigned = {abs(lit) for lit in assigned}
+            free = [var for var in self.order if var not in assigned and var not in self.fixed][:self.candidates]
+            counts = self.solver.lookahead(cube, [lit for var in free for lit in (var, -var)])
+            self.probes += 2 * len(free)
+            best, best_score, forced = None, -1, []
+            for var, positive, negative in zip(free, counts[::2], counts[1::2]):
+                if positive is None and negative is None:
+                    return None
+                if positive is None or negative is None:
+                    forced.append(-var if positive is None else var)
+                elif not forced and (positive + 1) * (negative + 1) > best_score:
+                    best, best_score = var, (positive + 1) * (negative + 1)
+            if not forced:
+                return best, cube
+            cube += forced
+
+    def cubes(self, depth: int, cube: list[int] = (), budget: Budget | None = None) -> list[list[int]]:
+        # The leaves of a lookahead tree of the given depth below cube,
+        # without the refuted ones; the budget's deadline and token are
+        # checked before every lookahead
+        out = []
+        stack = [(list(cube), depth)]
+        while stack:
+            if budget is not None:
+                budget.check()
+            cube, depth = stack.pop()
+            node = self.lookahead(cube)
+            if node is None:
+                self.refuted += 1
+                continue
+            var, cube = node
+            if depth == 0 or var is None:
+                out.append(cube)
+                continue
+            stack.append(([*cube, -var], depth - 1))
+            stack.append(([*cube, var], depth - 1))
+        return out
+
+
+_solver = None
+_stop = None
+
+
+def _start_worker(db: ClauseDB, stop):
+    # One solver per worker, reused for every cube it draws, so clauses
+    # learnt on one cube help with the next
+    global _solver, _stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent turns Ctrl-C into stop
+    _solver = Solver(db)
+    _stop = stop
+
+
+def _conquer(cube: list[int], conflicts: int, limits: dict) -> tuple:
+    before = _solver.statistics()
+    if limits["conflicts"] is not None:
+        conflicts = min(conflicts, limits["conflicts"])
+    result = _solver.solve(cube, budget=Budget(**{**limits, "conflicts": conflicts}, token=_stop))
+    counters = {name: value - before[name] for name, value in result.stats.items() if name != "learnts"}
+    return result.status, result.model, result.core, counters, result.exhausted
+
+
+def solve(db: ClauseDB, workers: int, stats: Stats | None = None, budget: Budget | None = None,
+          depth: int | None = None, conflicts: int = 2000) -> SolveResult:
+    # depth: of the initial lookahead tree, by default enough for four cubes
+    # per worker; conflicts: the limit a cube is first tried with
+    budget = Budget() if budget is None else budget
+    depth = math.ceil(math.log2(4 * workers)) if depth is None else depth
+    cuber = Cuber(db)
+    try:
+        if stats is not None:
+            with stats.phase("cube"):
+                initial = cuber.cubes(depth, budget=budget)
+        else:
+            initial = cuber.cubes(depth, budget=budget)
+    except BudgetExceeded as exceeded:
+        return SolveResult("UNKNOWN", route="cube-and-conquer", reason="the budget ran out while cubing",
+                           exhausted=exceeded.reason)
+    pending = deque((cube, conflicts) for cube in initial)
+
+    result = None
+    done = splits = 0
+    used = Counter()  # conflicts and propagations over all cubes
+    stop = multiprocessing.Event()
+    with ProcessPoolExecutor(workers, initializer=_start_worker, initargs=(db, stop)) as pool:
+        running = {}
+        try:
+            while (pending or running) and result is None:
+                # At most one cube per worker in flight, so a split half goes
+                # to the next worker that becomes idle
+                while pending and len(running) < workers:
+                    cube, limit = pending.popleft()
+                    limits = budget.split(workers, used["propagations"], used["conflicts"])
+                    running[pool.submit(_conquer, cube, limit, limits)] = cube, limit
+                finished, _ = wait(running, timeout=0.1, return_when=FIRST_COMPLETED)
+                budget.check(used["propagations"], 0, used["conflicts"])
+                for future in finished:
+                    cube, limit = running.pop(future)
+                    status, model, core, counters, exhausted = future.result()
+                    used.update(counters)
+                    if stats is not None:
+                        for name, value in counters.items():
+                            stats.add(name, value)
+                    if status == "SAT":
+                        done += 1
+                        result = SolveResult("SAT", model)
+                    elif status == "UNSAT":
+                        done += 1
+                        if core == [] and result is None:
+                            result = SolveResult("UNSAT")  # refuted without the cube's help
+                    elif exhausted in ("deadline", "live") and result is None:
+                        result = SolveResult("UNKNOWN", exhausted=exhausted)  # no split helps with these
+                    elif result is None:
+                        budget.check(used["propagations"], 0, used["conflicts"])
+                        halves = cuber.cubes(1, cube)
+                        splits += 1
+                        pending.extend((half, 2 * limit) for half in halves)
+                if stats is not None:
+                    stats.tick("cube", done=done, remaining=len(pending) + len(running), splits=splits)
+        except BudgetExceeded as exceeded:
+            result = SolveResult("UNKNOWN", exhausted=exceeded.reason)
+        finally:
+            stop.set()
+            pool.shutdown(cancel_futures=True)
+
+    if stats is not None:
+        stats.add("cubes.initial", len(initial))
+        stats.add("cubes.done", done)
+        stats.add("cubes.split", splits)
+        stats.add("cubes.refuted_by_lookahead", cuber.refuted)
+        stats.add("lookahead_probes", cuber.probes)
+    if result is None:
+        result = SolveResult("UNSAT")  # every cube, and so every assignment, refuted
+    result.route, result.reason = "cube-and-conquer", f"{len(initial)} cubes, {splits} split, {workers} workers"
+    return result
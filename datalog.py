@@ -0,0 +1,480 @@
+from __future__ import annotations
+import argparse
+import itertools
+import re
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Iterable, Iterator, Union
+
+from budget import Budget, BudgetExceeded
+from hadeh import Symbol
+from stats import Stats
+
+# First-order Horn rules over ground facts, evaluated bottom-up:
+#
+#   Girl(X) :- Child(X), Female(X).
+#   Child(alice).  Female(alice).
+#
+# Variables start with an uppercase letter or "_" ("_" alone is anonymous),
+# constants are lowercase identifiers, integers or "quoted strings".
+# Evaluation is semi-naive: in every round each rule is joined once per body
+# atom with that atom restricted to the facts derived in the previous round
+# (the delta), so a round only finds derivations that use a new fact and
+# the work grows with the facts, not with the ground instances of the
+# rules. Joins start from the delta, take the remaining atoms most-bound
+# and smallest relation first, and probe hash indexes on single arguments,
+# built per predicate and position the first time a join needs them.
+
+
+class DatalogError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Var:
+    name: str
+
+    def __str__(self):
+        return self.name
+
+
+Term = Union[Var, str, int]
+
+
+@dataclass(frozen=True)
+class Atom:
+    predicate: str
+    args: tuple[Term, ...]
+
+    def __str__(self):
+        return f"{self.predicate}({', '.join(map(_term_str, self.args))})"
+
+    def is_ground(self) -> bool:
+        return Var not in map(type, self.args)
+
+
+@dataclass(frozen=True)
+class Rule:
+    head: Atom
+    body: tuple[Atom, ...]
+
+    def __str__(self):
+        return f"{self.head} :- {', '.join(map(str, self.body))}." if self.body else f"{self.head}."
+
+
+class Predicate:
+    # Girl = Predicate("Girl"); Girl(X) is Atom("Girl", (X,))
+    def __init__(self, name: str):
+        self.name = name
+
+    def __call__(self, *args: Term) -> Atom:
+        return Atom(self.name, args)
+
+
+def _term_str(term: Term) -> str:
+    if isinstance(term, str) and not re.fullmatch(r"[a-z][A-Za-z0-9_]*", term):
+        return '"' + term.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return str(term)
+
+
+# -- text syntax ----------------------------------------------------------
+
+_TOKEN = re.compile(r'\s*(?:%[^\n]*|(:-|[(),.])|("(?:[^"\\]|\\.)*")|([A-Za-z_][A-Za-z0-9_]*)|(-?\d+)|(\S))')
+
+
+def _tokens(text: str) -> Iterator[tuple[str, str | int]]:
+    for match in _TOKEN.finditer(text):
+        punct, string, name, number, bad = match.groups()
+        if bad is not None:
+            raise DatalogError(f"unexpected character {bad!r} at offset {match.start(5)}")
+        if punct is not None:
+            yield "punct", punct
+        elif string is not None:
+            yield "const", re.sub(r"\\(.)", r"\1", string[1:-1])
+        elif name is not None:
+            yield "name", name
+        elif number is not None:
+            yield "const", int(number)
+
+
+def parse_program(text: str) -> tuple[list[Rule], list[Atom]]:
+    # Rules and ground facts, in the order they appear
+    rules, facts = [], []
+    tokens = list(_tokens(text))
+    tokens.append(("end", ""))
+    i = 0
+    anonymous = 0
+
+    def expect(value):
+        nonlocal i
+        if tokens[i] != ("punct", value):
+            raise DatalogError(f"expected {value!r}, found {tokens[i][1]!r}")
+        i += 1
+
+    def atom() -> Atom:
+        nonlocal i, anonymous
+        kind, name = tokens[i]
+        if kind != "name":
+            raise DatalogError(f"expected a predicate, found {name!r}")
+        i += 1
+        args = []
+        if tokens[i] == ("punct", "("):
+            i += 1
+            while True:
+                kind, value = tokens[i]
+                i += 1
+                if kind == "const":
+                    args.append(value)
+                elif kind == "name" and value == "_":
+                    anonymous += 1
+                    args.append(Var(f"_{anonymous}"))
+                elif kind == "name":
+                    args.append(Var(value) if value[0].isupper() or value[0] == "_" else value)
+                else:
+                    raise DatalogError(f"expected a term, found {value!r}")
+                if tokens[i] == ("punct", ")"):
+                    i += 1
+                    break
+                expect(",")
+        return Atom(name, tuple(args))
+
+    while tokens[i][0] != "end":
+        head = atom()
+        body = []
+        if tokens[i] == ("punct", ":-"):
+            i += 1
+            body.append(atom())
+            while tokens[i] == ("punct", ","):
+                i += 1
+                body.append(atom())
+        expect(".")
+        if body or not head.is_ground():
+            rules.append(Rule(head, tuple(body)))
+        else:
+            facts.append(head)
+    return rules, facts
+
+
+def parse_atom(text: str) -> Atom:
+    rules, facts = parse_program(text.strip().rstrip(".") + ".")
+    if len(rules) + len(facts) != 1 or (rules and rules[0].body):
+        raise DatalogError(f"not a single atom: {text!r}")
+    return facts[0] if facts else rules[0].head
+
+
+# -- evaluation -----------------------------------------------------------
+
+
+class Database:
+    # Ground facts as one set of argument tuples per predicate, with
+    # per-argument hash indexes (value -> tuples) kept up to date once built
+    def __init__(self):
+        self.relations = {}  # predicate -> set of tuples
+        self.arity = {}
+        self.indexes = defaultdict(dict)  # predicate -> position -> value -> tuples
+
+    def __len__(self) -> int:
+        return sum(len(relation) for relation in self.relations.values())
+
+    def __contains__(self, atom: Atom) -> bool:
+        return atom.args in self.relations.get(atom.predicate, ())
+
+    def relation(self, predicate: str) -> set[tuple]:
+        return self.relations.get(predicate, set())
+
+    def add(self, predicate: str, args: tuple) -> bool:
+        relation = self.relations.get(predicate)
+        if relation is None:
+            relation = self.relations[predicate] = set()
+            self.arity[predicate] = len(args)
+        elif self.arity[predicate] != len(args):
+            raise DatalogError(f"{predicate} has arity {self.arity[predicate]}, not {len(args)}")
+        if args in relation:
+            return False
+        relation.add(args)
+        for position, index in self.indexes[predicate].items():
+            index[args[position]].append(args)
+        return True
+
+    def update(self, predicate: str, tuples: Iterable[tuple]) -> set[tuple]:
+        # add() for many tuples of one predicate; returns the new ones
+        added = set(tuples)
+        relation = self.relations.get(predicate)
+        if relation is not None:
+            added -= relation
+        if not added:
+            return added
+        arities = {len(args) for args in added}
+        expected = self.arity.setdefault(predicate, len(next(iter(added))))
+        if arities != {expected}:
+            raise DatalogError(f"{predicate} has arity {expected}, not {max(arities - {expected})}")
+        if relation is None:
+            self.relations[predicate] = set(added)
+        else:
+            relation |= added
+        for position, index in self.indexes[predicate].items():
+            for args in added:
+                index[args[position]].append(args)
+        return added
+
+    def index(self, predicate: str, position: int) -> dict:
+        indexes = self.indexes[predicate]
+        index = indexes.get(position)
+        if index is None:
+            index = indexes[position] = defaultdict(list)
+            for args in self.relation(predicate):
+                index[args[position]].append(args)
+        return index
+
+    def query(self, atom: Atom) -> list[dict[str, Term]]:
+        # Variable bindings of every fact matching atom
+        rule = _CompiledRule(Rule(atom, (atom,)))
+        bindings, slot, _ = rule.join(self, 0, self.relation(atom.predicate))
+        variables = [(var.name, slot[var]) for var in dict.fromkeys(atom.args) if isinstance(var, Var)]
+        return [{name: binding[i] for name, i in variables} for binding in bindings]
+
+    def atoms(self) -> Iterator[Atom]:
+        for predicate, relation in self.relations.items():
+            for args in relation:
+                yield Atom(predicate, args)
+
+    def symbols(self) -> Iterator[Symbol]:
+        # Ground facts as propositional symbols, named like str(atom), for
+        # the propositional engines
+        for atom in self.atoms():
+            yield Symbol(str(atom))
+
+
+def _getter(positions: list[int]):
+    # Always a tuple, unlike itemgetter with a single position
+    if not positions:
+        return lambda args: ()
+    if len(positions) == 1:
+        position = positions[0]
+        return lambda args: (args[position],)
+    return itemgetter(*positions)
+
+
+class _CompiledRule:
+    # A partial binding is a tuple: the rule's constants, then the value of
+    # every variable in the order the join binds them, so joining an atom
+    # is a hash probe plus a tuple concatenation.
+    def __init__(self, rule: Rule):
+        self.rule = rule
+        self.variables = {arg for atom in rule.body for arg in atom.args if isinstance(arg, Var)}
+        unsafe = [arg for arg in rule.head.args if isinstance(arg, Var) and arg not in self.variables]
+        if unsafe:
+            raise DatalogError(f"head variable {unsafe[0]} does not occur in the body of {rule}")
+        self.constants = tuple(dict.fromkeys(arg for atom in (rule.head, *rule.body) for arg in atom.args
+                                             if not isinstance(arg, Var)))
+        self.plans = {}
+
+    def _order(self, db: Database, first: int) -> tuple[int, ...]:
+        # The delta atom first, then greedily the atom with the most bound
+        # arguments, smallest relation first among equals
+        body = self.rule.body
+        order = [first]
+        bound = set(body[first].args)
+        rest = [i for i in range(len(body)) if i != first]
+        while rest:
+            def cost(i):
+                joined = sum(1 for arg in body[i].args if not isinstance(arg, Var) or arg in bound)
+                return -joined, len(db.relation(body[i].predicate))
+            best = min(rest, key=cost)
+            rest.remove(best)
+            order.append(best)
+            bound.update(body[best].args)
+        return tuple(order)
+
+    def _plan(self, db: Database, order: tuple[int, ...]) -> tuple[list, dict, object]:
+        slot = {constant: i for i, constant in enumerate(self.constants)}  # binding position of every term
+        steps = []
+        for step, i in enumerate(order):
+            atom = self.rule.body[i]
+            checked, sources, bound, repeats = [], [], [], []
+            first_at = {}
+            for position, arg in enumerate(atom.args):
+                if arg in slot:
+                    checked.append(position)
+                    sources.append(slot[arg])
+                elif arg in first_at:
+                    repeats.append((first_at[arg], position))
+                else:
+                    first_at[arg] = position
+                    bound.append(position)
+            for arg in first_at:
+                slot[arg] = len(slot)
+            probe = None
+            if step > 0 and len(checked) == len(atom.args):
+                # Nothing left to bind: a set lookup of the whole tuple
+                steps.append((atom.predicate, "member", True, None, _getter(sources), repeats, None))
+                continue
+            if step > 0 and checked:
+                # Probe the index with the most distinct values
+                k = max(range(len(checked)), key=lambda k: len(db.index(atom.predicate, checked[k])))
+                probe = checked.pop(k), sources.pop(k)
+            plain = not checked and not repeats  # every candidate tuple matches
+            steps.append((atom.predicate, probe, plain, _getter(checked), _getter(sources), repeats, _getter(bound)))
+        return steps, slot, _getter([slot[arg] for arg in self.rule.head.args])
+
+    def join(self, db: Database, first: int, delta: set[tuple],
+             stats: Stats | None = None) -> tuple[list[tuple], dict, object]:
+        # Bindings of the body with atom first ranging over delta and the
+        # other atoms over the whole database, one atom at a time; with the
+        # binding position of every term and the getter of the head tuple
+        order = self._order(db, first)
+        plan = self.plans.get(order)
+        if plan is None:
+            plan = self.plans[order] = self._plan(db, order)
+        steps, slot, head = plan
+
+        bindings = [self.constants]
+        probed = 0
+        for step, (predicate, probe, plain, key, wanted, repeats, bind) in enumerate(steps):
+            extended = []
+            if probe == "member":
+                relation = db.relation(predicate)
+                probed += len(bindings)
+                extended = [binding for binding in bindings if wanted(binding) in relation]
+            elif step == 0 or probe is None:
+                candidates = delta if step == 0 else db.relation(predicate)
+                for binding in bindings:
+                    probed += len(candidates)
+                    if plain:
+                        extended += [binding + bind(args) for args in candidates]
+                        continue
+                    value = wanted(binding)
+                    for args in candidates:
+                        if key(args) == value and all(args[a] == args[b] for a, b in repeats):
+                            extended.append(binding + bind(args))
+            else:
+                index = db.index(predicate, probe[0])
+                source = probe[1]
+                for binding in bindings:
+                    bucket = index.get(binding[source])
+                    if not bucket:
+                        continue
+                    probed += len(bucket)
+                    if plain:
+                        extended += [binding + bind(args) for args in bucket]
+                        continue
+                    value = wanted(binding)
+                    for args in bucket:
+                        if key(args) == value and all(args[a] == args[b] for a, b in repeats):
+                            extended.append(binding + bind(args))
+            bindings = extended
+            if not bindings:
+                break
+        if stats is not None:
+            stats.add("tuples_probed", probed)
+        return bindings, slot, head
+
+
+def evaluate(rules: Iterable[Rule], facts: Iterable[Atom] = (), stats: Stats | None = None,
+             db: Database | None = None, budget: Budget | None = None) -> Database:
+    # The least model of rules and facts, added to db if one is given. The
+    # budget counts derived tuples as steps and is checked after every
+    # join; when it runs out, BudgetExceeded.partial is the database with
+    # the rounds completed so far, all of it entailed.
+    if stats is not None:
+        with stats.phase("datalog"):
+            db = _evaluate(rules, facts, stats, db, budget)
+        stats.peak("facts", len(db))
+        return db
+    return _evaluate(rules, facts, None, db, budget)
+
+
+def _evaluate(rules: Iterable[Rule], facts: Iterable[Atom], stats: Stats | None, db: Database | None,
+              budget: Budget | None) -> Database:
+    db = Database() if db is None else db
+    rules = list(rules)
+    grouped = defaultdict(list)
+    for atom in itertools.chain(facts, (rule.head for rule in rules if not rule.body)):
+        if not atom.is_ground():
+            raise DatalogError(f"fact with variables: {atom}")
+        grouped[atom.predicate].append(atom.args)
+    for predicate, tuples in grouped.items():
+        db.update(predicate, tuples)
+
+    arity = dict(db.arity)
+    compiled = []
+    for rule in rules:
+        for atom in (rule.head, *rule.body):
+            if arity.setdefault(atom.predicate, len(atom.args)) != len(atom.args):
+                raise DatalogError(f"{atom.predicate} has arity {arity[atom.predicate]}, not {len(atom.args)} in {rule}")
+        if rule.body:
+            compiled.append(_CompiledRule(rule))
+    # Everything is new in the first round, including facts db already had.
+    # Relations only change between rounds, so they can be the delta as is.
+    delta = {predicate: relation for predicate, relation in db.relations.items() if relation}
+
+    rounds = derived = 0
+    start = len(db) if budget is not None else 0
+    next_check = float("inf") if budget is None else budget.check(0, start)
+    try:
+        while delta:
+            rounds += 1
+            new = defaultdict(set)
+            pending = 0
+            for rule in compiled:
+                head = rule.rule.head.predicate
+                for first, atom in enumerate(rule.rule.body):
+                    if atom.predicate not in delta:
+                        continue
+                    bindings, _, head_args = rule.join(db, first, delta[atom.predicate], stats)
+                    relation = db.relation(head)
+                    before = len(new[head])
+                    new[head].update(args for args in map(head_args, bindings) if args not in relation)
+                    pending += len(new[head]) - before
+                    if derived + pending >= next_check:
+                        next_check = budget.check(derived + pending, start + derived + pending)
+            delta = {}
+            for predicate, tuples in new.items():
+                added = db.update(predicate, tuples)
+                if added:
+                    delta[predicate] = added
+                    derived += len(added)
+            if stats is not None:
+                stats.tick("datalog", rounds=rounds, derived=derived)
+    except BudgetExceeded as exceeded:
+        exceeded.partial = db
+        raise
+    finally:
+        if stats is not None:
+            stats.add("rounds", rounds)
+            stats.add("derived", derived)
+            stats.add("rules", len(compiled))
+    return db
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Bottom-up evaluation of a Datalog program")
+    arg_parser.add_argument("program", help="rules and facts, Prolog syntax")
+    arg_parser.add_argument("--query", action="append", default=[], metavar="ATOM", help="e.g. 'Girl(X)'")
+    arg_parser.add_argument("--stats", action="store_true", help="print statistics to stderr")
+    arg_parser.add_argument("--timeout", type=float, metavar="SECONDS", help="stop after SECONDS with the facts so far")
+    arg_parser.add_argument("--max-steps", type=int, metavar="N", help="stop after deriving N tuples")
+    args = arg_parser.parse_args()
+
+    with open(args.program) as file:
+        rules, facts = parse_program(file.read())
+    stats = Stats()
+    try:
+        db = evaluate(rules, facts, stats, budget=Budget(args.timeout, args.max_steps))
+    except BudgetExceeded as exceeded:
+        print(f"% budget exhausted ({exceeded.reason}), facts so far:", file=sys.stderr)
+        db = exceeded.partial
+    if not args.query:
+        for atom in db.atoms():
+            print(f"{atom}.")
+    for text in args.query:
+        atom = parse_atom(text)
+        answers = db.query(atom)
+        print(f"{atom}: {len(answers)} answer{'' if len(answers) == 1 else 's'}")
+        for answer in answers:
+            if answer:
+                print("  " + ", ".join(f"{name} = {_term_str(value)}" for name, value in answer.items()))
+    if args.stats:
+        print(stats, file=sys.stderr)
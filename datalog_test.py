@@ -0,0 +1,104 @@
+from __future__ import annotations
+import random
+
+import pytest
+
+from budget import Budget, BudgetExceeded
+from datalog import Atom, DatalogError, Var, evaluate, parse_atom, parse_program
+from generators import datalog_path
+
+PROGRAM = """
+Path(X, Y) :- Edge(X, Y).
+Path(X, Z) :- Path(X, Y), Edge(Y, Z).
+Loop(X) :- Path(X, X).
+SameStart(X, Y) :- Path(X, _), Start(X), Start(Y).
+FromZero(Y) :- Path(0, Y).
+Labelled(X, "a label") :- Start(X).
+"""
+
+
+def _naive(rules, facts) -> set[Atom]:
+    # Naive evaluation: every rule against every fact, until nothing changes
+    model = set(facts)
+    while True:
+        new = set()
+        for rule in rules:
+            for binding in _matches(rule.body, model, {}):
+                new.add(Atom(rule.head.predicate, tuple(binding.get(t, t) if isinstance(t, Var) else t
+                                                        for t in rule.head.args)))
+        if new <= model:
+            return model
+        model |= new
+
+
+def _matches(body, model, binding):
+    if not body:
+        yield binding
+        return
+    atom, rest = body[0], body[1:]
+    for fact in model:
+        if fact.predicate != atom.predicate or len(fact.args) != len(atom.args):
+            continue
+        extended = dict(binding)
+        for term, value in zip(atom.args, fact.args):
+            if isinstance(term, Var):
+                if extended.setdefault(term, value) != value:
+                    break
+            elif term != value:
+                break
+        else:
+            yield from _matches(rest, model, extended)
+
+
+def _random_facts(seed: int) -> list[Atom]:
+    rng = random.Random(seed)
+    edges = {(rng.randrange(8), rng.randrange(8)) for _ in range(12)}
+    return [Atom("Edge", edge) for edge in edges] + [Atom("Start", (rng.randrange(8),)) for _ in range(2)]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_naive_evaluation(seed):
+    rules, facts = parse_program(PROGRAM)
+    facts += _random_facts(seed)
+    assert set(evaluate(rules, facts).atoms()) == _naive(rules, facts)
+
+
+def test_transitive_closure_of_a_chain():
+    rules, facts = datalog_path(50)
+    db = evaluate(rules, facts)
+    assert len(db.relation("Path")) == 50 * 51 // 2
+
+
+def test_evaluate_into_an_existing_database():
+    rules, _ = parse_program(PROGRAM)
+    db = evaluate(rules, [Atom("Edge", (0, 1))])
+    evaluate(rules, [Atom("Edge", (1, 2)), Atom("Edge", (2, 0))], db=db)
+    assert Atom("Loop", (0,)) in db and Atom("FromZero", (2,)) in db
+
+
+def test_query_bindings():
+    rules, facts = parse_program(PROGRAM + "Edge(0, 1). Edge(1, 2). Edge(5, 5).")
+    db = evaluate(rules, facts)
+    assert sorted(b["Y"] for b in db.query(parse_atom("Path(0, Y)"))) == [1, 2]
+    assert db.query(parse_atom("Path(X, X)")) == [{"X": 5}]
+
+
+def test_parse_round_trip():
+    rules, facts = parse_program(PROGRAM + 'Name(alice, "Alice Smith"). Age(alice, 7).')
+    again = parse_program("\n".join(map(str, [*rules, *(f"{fact}." for fact in facts)])))
+    assert again == (rules, facts)
+
+
+def test_errors():
+    with pytest.raises(DatalogError, match="arity"):
+        evaluate(*parse_program("P(X) :- Q(X, Y). Q(1)."))
+    with pytest.raises(DatalogError):
+        parse_program("P(X) :- .")
+
+
+def test_budget_partial_is_entailed():
+    rules, facts = datalog_path(60)
+    with pytest.raises(BudgetExceeded) as exceeded:
+        evaluate(rules, facts, budget=Budget(steps=200))
+    partial = set(exceeded.value.partial.atoms())
+    assert set(facts) < partial < set(evaluate(rules, facts).atoms())
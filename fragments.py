@@ -0,0 +1,240 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+
+import cdcl
+from budget import Budget, BudgetExceeded
+from cdcl import SolveResult
+from clausedb import ClauseDB
+from stats import Stats
+
+# Clause sets in a tractable fragment are decided in linear time instead
+# of by search:
+#
+#   horn            every clause has at most one positive literal; unit
+#                   propagation from the positive units gives the least model
+#   2-sat           every clause has at most two literals; strongly connected
+#                   components of the implication graph
+#   renamable-horn  flipping the signs of some variables makes it Horn; the
+#                   flips are themselves a 2-SAT problem (at most one literal
+#                   of every clause may end up positive)
+#
+# Everything else goes to the CDCL solver.
+
+
+@dataclass
+class Fragment:
+    route: str  # "empty", "horn", "2-sat", "renamable-horn" or "cdcl"
+    reason: str
+    renaming: list[int] = field(default_factory=list)  # variables to flip for renamable-horn
+
+
+def _scc(graph: list[list[int]], budget: Budget | None = None) -> list[int]:
+    # Tarjan's algorithm with an explicit stack of edge iterators.
+    # Components are numbered in the order they are completed, which is a
+    # reverse topological order.
+    n = len(graph)
+    index = [-1] * n
+    low = [0] * n
+    component = [-1] * n
+    stack = []
+    counter = components = 0
+    next_check = float("inf") if budget is None else budget.check()
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, edges = work[-1]
+            for succ in edges:
+                if index[succ] == -1:
+                    index[succ] = low[succ] = counter
+                    counter += 1
+                    if counter >= next_check:
+                        next_check = budget.check(counter, len(stack))
+                    stack.append(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                if component[succ] == -1 and index[succ] < low[node]:
+                    low[node] = index[succ]  # still on the stack
+            else:
+                work.pop()
+                if work and low[node] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[node]
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        component[member] = components
+                        if member == node:
+                            break
+                    components += 1
+    return component
+
+
+def two_sat(clauses: list[list[int]], num_vars: int, budget: Budget | None = None) -> list[int] | None:
+    # Model of clauses with at most two literals each, or None if UNSAT.
+    # Literal ±v is node 2v / 2v + 1, a ∨ b is the edges ¬a → b and ¬b → a.
+    graph = [[] for _ in range(2 * num_vars + 2)]
+    for clause in clauses:
+        a, b = clause if len(clause) == 2 else (clause[0], clause[0])
+        a = 2 * a if a > 0 else -2 * a + 1
+        b = 2 * b if b > 0 else -2 * b + 1
+        graph[a ^ 1].append(b)
+        graph[b ^ 1].append(a)
+    component = _scc(graph, budget)
+    model = []
+    for var in range(1, num_vars + 1):
+        if component[2 * var] == component[2 * var + 1]:
+            return None
+        # The literal whose component comes later in topological order
+        model.append(var if component[2 * var] < component[2 * var + 1] else -var)
+    return model
+
+
+def horn_sat(clauses: list[list[int]], num_vars: int, flipped: set[int] = frozenset(),
+             stats: Stats | None = None, budget: Budget | None = None) -> list[int] | None:
+    # Least model of Horn clauses (after flipping the given variables), or
+    # None if UNSAT. Each clause counts its negative literals that are not
+    # yet false; when that reaches zero its positive literal is forced.
+    true = [False] * (num_vars + 1)
+    head = []
+    missing = []
+    watching = [[] for _ in range(num_vars + 1)]
+    queue = []
+    for clause in clauses:
+        lits = {-lit if abs(lit) in flipped else lit for lit in clause}
+        if any(-lit in lits for lit in lits):
+            continue  # tautology
+        negative = [-lit for lit in lits if lit < 0]
+        positive = [lit for lit in lits if lit > 0]
+        i = len(head)
+        head.append(positive[0] if positive else 0)
+        missing.append(len(negative))
+        for var in negative:
+            watching[var].append(i)
+        if not negative:
+            if not positive:
+                return None
+            queue.append(positive[0])
+
+    propagations = 0
+    next_check = float("inf") if budget is None else budget.check()
+    try:
+        while queue:
+            var = queue.pop()
+            if true[var]:
+                continue
+            true[var] = True
+            propagations += 1
+            if propagations >= next_check:
+                next_check = budget.check(propagations, len(queue))
+            for i in watching[var]:
+                missing[i] -= 1
+                if missing[i] == 0:
+                    if not head[i]:
+                        return None
+                    queue.append(head[i])
+    finally:
+        if stats is not None:
+            stats.add("propagations", propagations)
+    return [(var if true[var] else -var) * (-1 if var in flipped else 1) for var in range(1, num_vars + 1)]
+
+
+def horn_renaming(clauses: list[list[int]], num_vars: int, budget: Budget | None = None) -> list[int] | None:
+    # Variables whose flip makes every clause Horn, or None. With f_v true
+    # meaning "flip v", literal l is positive after renaming iff -l holds
+    # over the f variables, so each clause needs at-most-one over its
+    # negated literals: pairwise for short clauses, sequential with
+    # auxiliary variables for long ones, binary either way.
+    constraints = []
+    aux = num_vars
+    for clause in clauses:
+        xs = [-lit for lit in dict.fromkeys(clause)]
+        if len(xs) < 2 or any(-x in xs for x in xs):
+            continue
+        if len(xs) <= 5:
+            constraints += [[-a, -b] for i, a in enumerate(xs) for b in xs[i + 1:]]
+            continue
+        # Sequential encoding, s_i: one of x_1..x_i holds
+        previous = None
+        for x in xs[:-1]:
+            aux += 1
+            constraints.append([-x, aux])
+            if previous is not None:
+                constraints.append([-previous, aux])
+                constraints.append([-previous, -x])
+            previous = aux
+        constraints.append([-previous, -xs[-1]])
+    model = two_sat(constraints, aux, budget)
+    if model is None:
+        return None
+    return [lit for lit in model[:num_vars] if lit > 0]
+
+
+def analyze(db: ClauseDB, stats: Stats | None = None, budget: Budget | None = None) -> Fragment:
+    if stats is not None:
+        with stats.phase("analyze"):
+            return analyze(db, budget=budget)
+
+    non_horn = longest = 0
+    for clause in db:
+        if len(clause) == 0:
+            return Fragment("empty", "the formula contains the empty clause")
+        if len(clause) > longest:
+            longest = len(clause)
+        if sum(1 for lit in clause if lit > 0) > 1:
+            non_horn += 1
+
+    if not non_horn:
+        return Fragment("horn", "every clause has at most one positive literal")
+    if longest <= 2:
+        return Fragment("2-sat", "every clause has at most two literals")
+    renaming = horn_renaming([clause.tolist() for clause in db], db.num_vars, budget)
+    if renaming is not None:
+        return Fragment("renamable-horn", f"Horn after flipping {len(renaming)} variables", renaming)
+    return Fragment("cdcl", f"{non_horn} clauses with several positive literals, clauses up to {longest} literals,"
+                            " and no renaming makes it Horn")
+
+
+def solve(db: ClauseDB, stats: Stats | None = None, fragment: Fragment | None = None, budget: Budget | None = None,
+          **solver_options) -> SolveResult:
+    # Same answer as cdcl.solve, with the route taken and the reason in
+    # result.route and result.reason. Options that only the CDCL solver
+    # supports (a proof) send everything there. The budget's step limit
+    # applies to each linear pass on its own.
+    try:
+        if solver_options.get("proof") is not None:
+            fragment = Fragment("cdcl", "a proof was requested")
+        elif fragment is None:
+            fragment = analyze(db, stats, budget)
+    except BudgetExceeded as exceeded:
+        return SolveResult("UNKNOWN", route="analyze", reason="the budget ran out looking for a Horn renaming", exhausted=exceeded.reason)
+    if stats is not None:
+        stats.add(f"route.{fragment.route}")
+
+    if fragment.route == "cdcl":
+        result = cdcl.solve(db, budget, stats=stats, **solver_options)
+    elif fragment.route == "empty":
+        result = SolveResult("UNSAT")
+    else:
+        clauses = [clause.tolist() for clause in db]
+        try:
+            if stats is not None:
+                with stats.phase(fragment.route):
+                    model = _decide(fragment, clauses, db.num_vars, stats, budget)
+            else:
+                model = _decide(fragment, clauses, db.num_vars, None, budget)
+            result = SolveResult("UNSAT" if model is None else "SAT", model)
+        except BudgetExceeded as exceeded:
+            result = SolveResult("UNKNOWN", exhausted=exceeded.reason)
+    result.route, result.reason = fragment.route, fragment.reason
+    return result
+
+
+def _decide(fragment: Fragment, clauses: list[list[int]], num_vars: int, stats: Stats | None,
+            budget: Budget | None) -> list[int] | None:
+    if fragment.route == "2-sat":
+        return two_sat(clauses, num_vars, budget)
+    return horn_sat(clauses, num_vars, set(fragment.renaming), stats, budget)
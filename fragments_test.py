@@ -0,0 +1,50 @@
+from __future__ import annotations
+import random
+
+import pytest
+
+import fragments
+from cdcl_test import INSTANCES, _brute_force, _satisfies
+from clausedb import ClauseDB
+
+
+def _horn(seed: int, num_vars: int = 12) -> ClauseDB:
+    rng = random.Random(seed)
+    db = ClauseDB()
+    for var in range(1, num_vars + 1):
+        db.symbols.var(str(var))
+    db.add_clause([rng.randint(1, num_vars)])
+    for _ in range(3 * num_vars):
+        body = [-var for var in rng.sample(range(1, num_vars + 1), rng.randint(1, 3))]
+        head = rng.randint(1, num_vars)
+        db.add_clause(body if rng.random() < 0.2 or head in [-lit for lit in body] else [head, *body])
+    return db
+
+
+HORN = [_horn(seed) for seed in range(20)]
+
+
+@pytest.mark.parametrize("db", INSTANCES + HORN)
+def test_agrees_with_brute_force(db):
+    result = fragments.solve(db)
+    assert result.status == ("SAT" if _brute_force(db) else "UNSAT")
+    if result.status == "SAT":
+        assert _satisfies(db, result.model)
+
+
+def test_every_route_is_taken():
+    routes = {fragments.analyze(db).route for db in INSTANCES + HORN}
+    assert routes == {"horn", "2-sat", "renamable-horn", "cdcl"}
+    empty = ClauseDB()
+    empty.add_clause([])
+    assert fragments.solve(empty).status == "UNSAT" and fragments.analyze(empty).route == "empty"
+
+
+@pytest.mark.parametrize("db", INSTANCES)
+def test_renaming_makes_it_horn(db):
+    fragment = fragments.analyze(db)
+    if fragment.route != "renamable-horn":
+        return
+    flipped = set(fragment.renaming)
+    for clause in db:
+        assert sum(1 for lit in clause if (lit > 0) != (abs(lit) in flipped)) <= 1
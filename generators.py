@@ -0,0 +1,140 @@
+from __future__ import annotations
+import random
+
+import model
+from clausedb import ClauseDB
+from datalog import Atom, Rule, Var
+from hadeh import And, Iff, Implies, Not, Or, Symbol
+
+# Seeded instance generators for benchmarks. The same arguments always give
+# the same instance.
+
+
+def random_horn(num_rules: int, num_symbols: int, max_body: int = 3, num_facts: int = 10, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    symbols = [Symbol(f"p{i}") for i in range(num_symbols)]
+    knowledge_base = rng.sample(symbols, min(num_facts, num_symbols))
+    for _ in range(num_rules):
+        body = rng.sample(symbols, rng.randint(1, max_body))
+        head = rng.choice(symbols)
+        knowledge_base.append(Implies(And(*body) if len(body) > 1 else body[0], head))
+    return knowledge_base
+
+
+def chain(length: int) -> list:
+    # p0, p0 ⊃ p1, ..., p(n-1) ⊃ pn
+    symbols = [Symbol(f"p{i}") for i in range(length + 1)]
+    return [symbols[0]] + [Implies(symbols[i], symbols[i + 1]) for i in range(length)]
+
+
+def tree(depth: int, branching: int = 2) -> list:
+    # Every inner node needs all of its children; the leaves are facts
+    knowledge_base = []
+    level = [Symbol("t")]
+    for d in range(depth):
+        next_level = []
+        for parent in level:
+            children = [Symbol(f"{parent.name}.{i}") for i in range(branching)]
+            knowledge_base.append(Implies(And(*children), parent))
+            next_level.extend(children)
+        level = next_level
+    return knowledge_base + level
+
+
+def deep_implies(depth: int):
+    # p0 ⊃ (p1 ⊃ (... ⊃ pn)), one nesting level per symbol
+    expr = Symbol(f"p{depth}")
+    for i in reversed(range(depth)):
+        expr = Implies(Symbol(f"p{i}"), expr)
+    return expr
+
+
+def model_or_chain(length: int):
+    # model.Or is binary, so a clause is a right-deep chain
+    expr = model.Symbol(f"q{length - 1}")
+    for i in reversed(range(length - 1)):
+        expr = model.Or(model.Symbol(f"q{i}") if i % 2 else model.Not(model.Symbol(f"q{i}")), expr)
+    return expr
+
+
+def datalog_girls(num_individuals: int, seed: int = 0):
+    # Girl(X) :- Child(X), Female(X), each fact holding for half of them
+    rng = random.Random(seed)
+    X = Var("X")
+    rules = [Rule(Atom("Girl", (X,)), (Atom("Child", (X,)), Atom("Female", (X,))))]
+    facts = [Atom(predicate, (i,)) for predicate in ("Child", "Female") for i in range(num_individuals)
+             if rng.random() < 0.5]
+    return rules, facts
+
+
+def datalog_path(length: int):
+    # Transitive closure of a chain, length² / 2 derived facts
+    X, Y, Z = Var("X"), Var("Y"), Var("Z")
+    rules = [
+        Rule(Atom("Path", (X, Y)), (Atom("Edge", (X, Y)),)),
+        Rule(Atom("Path", (X, Z)), (Atom("Path", (X, Y)), Atom("Edge", (Y, Z)))),
+    ]
+    return rules, [Atom("Edge", (i, i + 1)) for i in range(length)]
+
+
+def random_kcnf(num_vars: int, ratio: float = 4.26, k: int = 3, seed: int = 0) -> ClauseDB:
+    rng = random.Random(seed)
+    db = ClauseDB()
+    for var in range(1, num_vars + 1):
+        db.symbols.var(str(var))
+    for _ in range(round(ratio * num_vars)):
+        db.add_clause(rng.choice((-1, 1)) * var for var in rng.sample(range(1, num_vars + 1), k))
+    return db
+
+
+def renamed_horn(num_vars: int, ratio: float = 2.0, seed: int = 0) -> ClauseDB:
+    # Random Horn 3-clauses with a random half of the variables flipped, so
+    # only a Horn renaming exposes the structure
+    rng = random.Random(seed)
+    flipped = {var for var in range(1, num_vars + 1) if rng.random() < 0.5}
+    db = ClauseDB()
+    for var in range(1, num_vars + 1):
+        db.symbols.var(str(var))
+    db.add_clause([1 if 1 not in flipped else -1])
+    for _ in range(round(ratio * num_vars)):
+        head, *body = rng.sample(range(1, num_vars + 1), 3)
+        db.add_clause((-lit if abs(lit) in flipped else lit) for lit in (head, *(-var for var in body)))
+    return db
+
+
+def flat_coloring(num_vertices: int, edge_ratio: float = 2.2, colors: int = 3, seed: int = 0) -> ClauseDB:
+    # Graph colouring in the encoding of the SATLIB flat instances such as
+    # flat30-1.cnf: a random graph with a planted colouring, so it is SAT;
+    # variable v * colors + c + 1 says vertex v has colour c
+    rng = random.Random(seed)
+    planted = [v % colors for v in range(num_vertices)]
+    rng.shuffle(planted)
+    edges = set()
+    while len(edges) < round(edge_ratio * num_vertices):
+        u, v = sorted(rng.sample(range(num_vertices), 2))
+        if planted[u] != planted[v]:
+            edges.add((u, v))
+    db = ClauseDB()
+    for var in range(1, num_vertices * colors + 1):
+        db.symbols.var(str(var))
+    for v in range(num_vertices):
+        db.add_clause(v * colors + c + 1 for c in range(colors))
+        for c in range(colors):
+            for d in range(c + 1, colors):
+                db.add_clause([-(v * colors + c + 1), -(v * colors + d + 1)])
+    for u, v in sorted(edges):
+        for c in range(colors):
+            db.add_clause([-(u * colors + c + 1), -(v * colors + c + 1)])
+    return db
+
+
+def nested_iff(depth: int, width: int = 3, seed: int = 0):
+    # A ≡ (B ∨ (C ≡ (D ∧ ...))), the shape that makes distributive CNF explode
+    rng = random.Random(seed)
+    symbols = [Symbol(f"x{i}") for i in range(depth * width + 1)]
+    expr = symbols[0]
+    for d in range(depth):
+        ops = [s if rng.random() < 0.5 else Not(s) for s in symbols[1 + d * width:1 + (d + 1) * width]]
+        connective = And if d % 2 else Or
+        expr = Iff(symbols[1 + d * width], connective(expr, *ops[1:]))
+    return expr
@@ -1,12 +1,104 @@
 from __future__ import annotations
-from dataclasses import dataclass
+import itertools
+import math
+import weakref
+from operator import attrgetter, methodcaller
 from typing import Union
 
+from budget import Budget, BudgetExceeded
+from stats import Stats
+from traversal import interleave, render, results, trampoline
+
 Expr = Union["Symbol", "And", "Or", "Not", "Implies", "Iff"]
 
-@dataclass(frozen=True)
-class Symbol:
-    name: str
+# Hash-consing: structurally equal formulas are always the same object, so
+# equality is identity and the hash is computed once per node.
+_interned = weakref.WeakValueDictionary()
+_serial = itertools.count()
+_order = attrgetter("_id")
+
+
+def _intern(cls, key: tuple, **fields):
+    node = _interned.get(key)
+    if node is None:
+        node = object.__new__(cls)
+        for name, value in fields.items():
+            object.__setattr__(node, name, value)
+        object.__setattr__(node, "_id", next(_serial))
+        object.__setattr__(node, "_hash", hash(key))
+        object.__setattr__(node, "_cnf", None)
+        node = _interned.setdefault(key, node)
+    return node
+
+
+def _flatten(cls, args: tuple[Expr, ...]) -> tuple[Expr, ...]:
+    flat = {}
+    for a in args:
+        if isinstance(a, cls):
+            flat.update(dict.fromkeys(a.operands))
+        else:
+            flat[a] = None
+    # Canonical operand order, so And(A, B) and And(B, A) intern to one node
+    return tuple(sorted(flat, key=_order))
+
+
+def _cnf_step(node):
+    # Trampoline step for to_cnf: the _to_cnf generators yield the
+    # subformulas they need converted instead of calling to_cnf on them
+    if isinstance(node, Symbol):
+        return node
+    if node._cnf is None:
+        object.__setattr__(node, "_cnf", (yield from node._to_cnf()))
+    return node._cnf
+
+
+def _repr_parts(node):
+    parts = [type(node).__name__, "("]
+    for i, name in enumerate(type(node).__slots__):
+        value = getattr(node, name)
+        parts.append(f"{', ' if i else ''}{name}=")
+        if isinstance(value, tuple):
+            parts += ["(", *interleave(", ", value), ",)" if len(value) == 1 else ")"]
+        else:
+            parts.append(value if isinstance(value, _Node) else repr(value))
+    parts.append(")")
+    return parts
+
+
+class _Node:
+    __slots__ = ("_id", "_hash", "_cnf", "__weakref__")
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"cannot delete field '{name}'")
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return type(self), self._args()
+
+    def __repr__(self):
+        return render(self, _repr_parts)
+
+    def __str__(self):
+        return render(self, methodcaller("_parts"))
+
+    def to_cnf(self):
+        # Memoized per node, shared subformulas are converted once
+        return trampoline(self, _cnf_step)
+
+
+class Symbol(_Node):
+    __slots__ = ("name",)
+
+    def __new__(cls, name: str):
+        return _intern(cls, (cls, name), name=name)
+
+    def _args(self):
+        return (self.name,)
 
     def __or__(self, other):
         return Or(self, other)
@@ -23,150 +115,135 @@ class Symbol:
     def __lshift__(self, other):
         return Implies(other, self)
 
-    def __eq__(self, other):
-        return isinstance(other, Symbol) and self.name == other.name
-
     def to_cnf(self):
         return self
 
     def __str__(self):
         return self.name
 
+    def _parts(self):
+        return (self.name,)
 
-@dataclass(frozen=True)
-class And:
-    operands: tuple[Expr, ...]
 
-    def __init__(self, *args: Expr):
-        flat = []
-        for a in args:
-            if isinstance(a, And):
-                flat.extend(a.operands)
-            else:
-                flat.append(a)
-        unique = list(set(flat))
-        object.__setattr__(self, "operands", tuple(unique))
+class And(_Node):
+    __slots__ = ("operands",)
 
-    def to_cnf(self):
-        return And(*(op.to_cnf() for op in self.operands))
+    def __new__(cls, *args: Expr):
+        operands = _flatten(cls, args)
+        return _intern(cls, (cls, operands), operands=operands)
 
-    def __str__(self):
-        return "(" + " ∧ ".join(str(op) for op in self.operands) + ")"
+    def _args(self):
+        return self.operands
 
-    def __eq__(self, other):
-        return isinstance(other, And) and set(self.operands) == set(other.operands)
+    def _to_cnf(self):
+        return And(*(yield from results(self.operands)))
 
+    def _parts(self):
+        return ["(", *interleave(" ∧ ", self.operands), ")"]
 
-@dataclass(frozen=True)
-class Or:
-    operands: tuple[Expr, ...]
 
-    def __init__(self, *args: Expr):
-        flat = []
-        for a in args:
-            if isinstance(a, Or):
-                flat.extend(a.operands)
-            else:
-                flat.append(a)
-        unique = list(set(flat))
-        object.__setattr__(self, "operands", tuple(unique))
+class Or(_Node):
+    __slots__ = ("operands",)
 
-    def to_cnf(self):
-        ops = [op.to_cnf() for op in self.operands]
+    def __new__(cls, *args: Expr):
+        operands = _flatten(cls, args)
+        return _intern(cls, (cls, operands), operands=operands)
+
+    def _args(self):
+        return self.operands
+
+    def _to_cnf(self):
+        ops = yield from results(self.operands)
 
         # Distribusi jika perlu
         for i, op in enumerate(ops):
             if isinstance(op, And):
                 rest = ops[:i] + ops[i+1:]
-                return And(*(Or(a, *rest).to_cnf() for a in op.operands)).to_cnf()
+                return (yield And(*(yield from results(Or(a, *rest) for a in op.operands))))
         return Or(*ops)
 
-    def __str__(self):
-        return "(" + " ∨ ".join(str(op) for op in self.operands) + ")"
+    def _parts(self):
+        return ["(", *interleave(" ∨ ", self.operands), ")"]
 
-    def __eq__(self, other):
-        return isinstance(other, Or) and set(self.operands) == set(other.operands)
 
+class Not(_Node):
+    __slots__ = ("expr",)
 
-@dataclass(frozen=True)
-class Not:
-    expr: Expr
+    def __new__(cls, expr: Expr):
+        return _intern(cls, (cls, expr), expr=expr)
 
-    def __eq__(self, other):
-        return isinstance(other, Not) and self.expr == other.expr
+    def _args(self):
+        return (self.expr,)
 
-    def to_cnf(self):
+    def _to_cnf(self):
         e = self.expr
         if isinstance(e, Symbol):
-            return Not(e)
+            return self
 
         elif isinstance(e, Not):
-            return e.expr.to_cnf()
+            return (yield e.expr)
 
         elif isinstance(e, And):
             # ¬(A ∧ B ∧ ...) → ¬A ∨ ¬B ∨ ...
-            return Or(*(Not(op).to_cnf() for op in e.operands))
+            return Or(*(yield from results(Not(op) for op in e.operands)))
 
         elif isinstance(e, Or):
             # ¬(A ∨ B ∨ ...) → ¬A ∧ ¬B ∧ ...
-            return And(*(Not(op).to_cnf() for op in e.operands))
+            return And(*(yield from results(Not(op) for op in e.operands)))
 
         elif isinstance(e, Implies):
             # ¬(A ⊃ B) → A ∧ ¬B
-            return And(e.premise.to_cnf(), Not(e.conclusion).to_cnf())
+            return And(*(yield from results((e.premise, Not(e.conclusion)))))
 
         elif isinstance(e, Iff):
             # ¬(A ≡ B) → ¬((A ⊃ B) ∧ (B ⊃ A))
-            return Not(e.to_cnf()).to_cnf()
+            return (yield Not((yield e)))
 
         else:
             raise Exception(f"Unknown NOT expression: {e}")
 
-    def __str__(self):
+    def _parts(self):
         if isinstance(self.expr, Symbol):
-            return f"¬{self.expr}"
-        return f"¬({self.expr})"
+            return ("¬", self.expr)
+        return ("¬(", self.expr, ")")
 
 
-@dataclass(frozen=True)
-class Implies:
-    premise: Expr
-    conclusion: Expr
-    
-    def __eq__(self, other):
-        return (
-            isinstance(other, Implies)
-            and self.premise == other.premise
-            and self.conclusion == other.conclusion
-        )
+class Implies(_Node):
+    __slots__ = ("premise", "conclusion")
 
+    def __new__(cls, premise: Expr, conclusion: Expr):
+        return _intern(cls, (cls, premise, conclusion), premise=premise, conclusion=conclusion)
 
-    def to_cnf(self):
-        return Or(Not(self.premise).to_cnf(), self.conclusion.to_cnf())
+    def _args(self):
+        return self.premise, self.conclusion
 
-    def __str__(self):
-        return f"({self.premise} ⊃ {self.conclusion})"
+    def _to_cnf(self):
+        return Or(*(yield from results((Not(self.premise), self.conclusion))))
 
+    def _parts(self):
+        return ("(", self.premise, " ⊃ ", self.conclusion, ")")
 
-@dataclass(frozen=True)
-class Iff:
-    left: Expr
-    right: Expr
 
-    def __eq__(self, other):
-        return isinstance(other, Iff) and (
-            (self.left == other.left and self.right == other.right)
-            or (self.left == other.right and self.right == other.left)
-        )
+class Iff(_Node):
+    __slots__ = ("left", "right")
 
-    def to_cnf(self):
-        return And(
-            Implies(self.left, self.right).to_cnf(),
-            Implies(self.right, self.left).to_cnf(),
-        )
+    def __new__(cls, left: Expr, right: Expr):
+        # A ≡ B and B ≡ A are the same formula
+        if right._id < left._id:
+            left, right = right, left
+        return _intern(cls, (cls, left, right), left=left, right=right)
 
-    def __str__(self):
-        return f"({self.left} ≡ {self.right})"
+    def _args(self):
+        return self.left, self.right
+
+    def _to_cnf(self):
+        return And(*(yield from results((
+            Implies(self.left, self.right),
+            Implies(self.right, self.left),
+        ))))
+
+    def _parts(self):
+        return ("(", self.left, " ≡ ", self.right, ")")
 
 def is_cnf(expr: Expr) -> bool:
     if not isinstance(expr, And):
@@ -177,13 +254,14 @@ def is_cnf(expr: Expr) -> bool:
             return False
         clause_set.add(clause)
         if isinstance(clause, Or):
+            # Nodes are interned, so identity is enough to spot duplicates
             seen = set()
             for literal in clause.operands:
                 if not is_literal(literal):
                     return False
-                if str(literal) in seen:
+                if literal in seen:
                     return False
-                seen.add(str(literal))
+                seen.add(literal)
         elif is_literal(clause):
             continue
         else:
@@ -193,10 +271,292 @@ def is_cnf(expr: Expr) -> bool:
 def is_literal(expr: Expr) -> bool:
     return isinstance(expr, Symbol) or (isinstance(expr, Not) and isinstance(expr.expr, Symbol))
 
-def convert_to_cnf(expr: Expr) -> Expr:
-    while not is_cnf(expr):
-        expr = expr.to_cnf()
-    return expr
+_POS, _NEG = 1, 2
+
+
+def _polarities(roots: list[Expr], symbols) -> dict[Expr, int]:
+    polarity = {}
+    stack = [(root, _POS) for root in roots]
+    while stack:
+        node, p = stack.pop()
+        seen = polarity.get(node, 0)
+        if seen & p == p:
+            continue
+        polarity[node] = seen | p
+        flipped = ((p & _POS) << 1) | ((p & _NEG) >> 1)
+        if isinstance(node, Symbol):
+            symbols.var(node.name)  # before any auxiliary name is handed out
+        elif isinstance(node, (And, Or)):
+            stack.extend((op, p) for op in node.operands)
+        elif isinstance(node, Not):
+            stack.append((node.expr, flipped))
+        elif isinstance(node, Implies):
+            stack.append((node.premise, flipped))
+            stack.append((node.conclusion, p))
+        elif isinstance(node, Iff):
+            stack.append((node.left, _POS | _NEG))
+            stack.append((node.right, _POS | _NEG))
+        else:
+            raise Exception(f"Unknown expression: {node}")
+    return polarity
+
+
+def tseitin(expr: Expr, sink, plaisted_greenbaum: bool = True, budget: Budget | None = None,
+            stats: Stats | None = None):
+    # Equisatisfiable CNF, linear in the size of expr: every compound
+    # subformula gets a fresh variable x and clauses defining x ⊃ node
+    # (and node ⊃ x, unless Plaisted–Greenbaum finds it only occurs one
+    # way). sink is a ClauseDB or anything with .symbols and add_clause().
+    symbols = sink.symbols
+    roots = []
+    for conjunct in (expr.operands if isinstance(expr, And) else (expr,)):
+        ops = conjunct.operands if isinstance(conjunct, Or) else (conjunct,)
+        if all(is_literal(op) for op in ops):
+            roots.append(None)
+        else:
+            roots.append(conjunct)
+    polarity = _polarities([r for r in roots if r is not None], symbols)
+    if not plaisted_greenbaum:
+        polarity = dict.fromkeys(polarity, _POS | _NEG)
+
+    lit = {}
+    next_check = budget.check() if budget is not None else Stats.interval if stats is not None else float("inf")
+
+    def literal(node):
+        if isinstance(node, Not):
+            return -lit[node.expr]
+        return lit[node]
+
+    for root in polarity:
+        if root in lit:
+            continue
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in lit:
+                continue
+            if isinstance(node, Symbol):
+                lit[node] = symbols.var(node.name)
+                continue
+            children = (
+                node.operands if isinstance(node, (And, Or))
+                else (node.expr,) if isinstance(node, Not)
+                else (node.premise, node.conclusion) if isinstance(node, Implies)
+                else (node.left, node.right)
+            )
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children if child not in lit)
+                continue
+            if isinstance(node, Not):
+                lit[node] = -lit[node.expr]
+                continue
+
+            x = lit[node] = symbols.new_var()
+            if len(lit) >= next_check:
+                if stats is not None:
+                    stats.tick("tseitin", subformulas=len(lit))
+                next_check = len(lit) + Stats.interval if budget is None else budget.check(len(lit), len(lit))
+            p = polarity[node]
+            ls = [literal(child) for child in children]
+            if isinstance(node, And):
+                if p & _POS:
+                    for l in ls:
+                        sink.add_clause([-x, l])
+                if p & _NEG:
+                    sink.add_clause([x, *(-l for l in ls)])
+            elif isinstance(node, Or):
+                if p & _POS:
+                    sink.add_clause([-x, *ls])
+                if p & _NEG:
+                    for l in ls:
+                        sink.add_clause([x, -l])
+            elif isinstance(node, Implies):
+                a, b = ls
+                if p & _POS:
+                    sink.add_clause([-x, -a, b])
+                if p & _NEG:
+                    sink.add_clause([x, a])
+                    sink.add_clause([x, -b])
+            else:
+                a, b = ls
+                if p & _POS:
+                    sink.add_clause([-x, -a, b])
+                    sink.add_clause([-x, a, -b])
+                if p & _NEG:
+                    sink.add_clause([x, a, b])
+                    sink.add_clause([x, -a, -b])
+
+    for conjunct, root in zip(expr.operands if isinstance(expr, And) else (expr,), roots):
+        if root is None:
+            ops = conjunct.operands if isinstance(conjunct, Or) else (conjunct,)
+            sink.add_clause([
+                -symbols.var(op.expr.name) if isinstance(op, Not) else symbols.var(op.name)
+                for op in ops
+            ])
+        else:
+            sink.add_clause([literal(root)])
+
+
+def _resolve(node: Expr, positive: bool) -> tuple[Expr, bool, str | None]:
+    # Push a negation through Not chains; the kind says how the node combines
+    # its operands once negations are at the leaves (NNF).
+    while isinstance(node, Not):
+        node, positive = node.expr, not positive
+    if isinstance(node, Symbol):
+        return node, positive, None
+    if isinstance(node, Iff):
+        return node, positive, "iff"
+    if not isinstance(node, (And, Or, Implies)):
+        raise Exception(f"Unknown expression: {node}")
+    # A ∧ B, ¬(A ∨ B) and ¬(A ⊃ B) are conjunctions, the rest disjunctions
+    return node, positive, "and" if isinstance(node, And) == positive else "or"
+
+
+def _children(node: Expr, positive: bool) -> list[tuple[Expr, bool]]:
+    if isinstance(node, Implies):
+        return [(node.premise, not positive), (node.conclusion, positive)]
+    if isinstance(node, Iff):
+        return [(node.left, True), (node.left, False), (node.right, True), (node.right, False)]
+    return [(op, positive) for op in node.operands]
+
+
+def _operands(node: Expr, positive: bool, kind: str) -> list[tuple[Expr, bool]]:
+    # Flatten nested connectives of the same kind without building nodes
+    if kind == "iff":
+        return [_resolve(child, p)[:2] for child, p in _children(node, positive)]
+    operands = []
+    stack = _children(node, positive)
+    stack.reverse()
+    while stack:
+        child, p, k = _resolve(*stack.pop())
+        if k == kind:
+            stack.extend(reversed(_children(child, p)))
+        else:
+            operands.append((child, p))
+    return operands
+
+
+def _product(parts: list[list[tuple]]) -> list[tuple]:
+    # (C1 ∧ ...) ∨ (D1 ∧ ...) ∨ ... → every Ci ∨ Dj ∨ ..., without tautologies
+    clauses = {}
+    for combination in itertools.product(*parts):
+        clause = tuple(dict.fromkeys(itertools.chain.from_iterable(combination)))
+        literals = set(clause)
+        if any(isinstance(l, Not) and l.expr in literals for l in clause):
+            continue
+        clauses.setdefault(frozenset(literals), clause)
+    return list(clauses.values())
+
+
+def _concat(parts: list[list[tuple]]) -> list[tuple]:
+    clauses = {}
+    for part in parts:
+        for clause in part:
+            clauses.setdefault(frozenset(clause), clause)
+    return list(clauses.values())
+
+
+def _clauses(expr: Expr, budget: Budget | None = None, stats: Stats | None = None) -> list[tuple]:
+    # Single post-order pass over NNF: Implies/Iff are eliminated and
+    # negations pushed down by _resolve, same-kind connectives flattened by
+    # _operands, and ∨ distributed over ∧ on the way up. Every (node,
+    # polarity) pair is converted once, using an explicit stack. The budget
+    # counts clauses built as steps and the clauses of the node being built
+    # as live, both before a distribution is expanded. BudgetExceeded.partial
+    # has the clauses of the top-level conjuncts converted so far, each of
+    # them entailed by expr.
+    steps = 0
+    next_check = budget.check() if budget is not None else Stats.interval if stats is not None else float("inf")
+    live = float("inf") if budget is None or budget.live is None else budget.live
+    done = {}
+    pending = {}
+    root = _resolve(expr, True)
+    stack = [root]
+    while stack:
+        node, positive, kind = stack[-1]
+        if (node, positive) in done:
+            stack.pop()
+            continue
+        if kind is None:
+            done[node, positive] = [(node if positive else Not(node),)]
+            stack.pop()
+            continue
+
+        operands = pending.get((node, positive))
+        if operands is None:
+            operands = pending[node, positive] = _operands(node, positive, kind)
+            stack.extend(_resolve(child, p) for child, p in operands if (child, p) not in done)
+            continue
+
+        stack.pop()
+        parts = [done[operand] for operand in operands]
+        if next_check != float("inf"):
+            # Upper bound on the clauses this node expands to
+            if kind == "and":
+                size = sum(map(len, parts))
+            elif kind == "or":
+                size = math.prod(map(len, parts))
+            else:
+                size = len(parts[0]) * len(parts[3]) + len(parts[1]) * len(parts[2])
+            steps += size
+            if steps >= next_check or size > live:
+                if stats is not None:
+                    stats.tick("cnf", clauses=steps, pending=len(pending))
+                try:
+                    next_check = steps + Stats.interval if budget is None else budget.check(steps, size)
+                except BudgetExceeded as exceeded:
+                    conjuncts = pending.get(root[:2], ()) if root[2] == "and" else ()
+                    exceeded.partial = _concat([done[op] for op in conjuncts if op in done])
+                    raise
+        # Only now, so a stop while combining the root still finds its conjuncts
+        del pending[node, positive]
+        if kind == "and":
+            done[node, positive] = _concat(parts)
+        elif kind == "or":
+            done[node, positive] = _product(parts)
+        else:
+            left, not_left, right, not_right = parts
+            if positive:
+                done[node, positive] = _concat([_product([not_left, right]), _product([left, not_right])])
+            else:
+                done[node, positive] = _concat([_product([left, right]), _product([not_left, not_right])])
+
+    return done[root[:2]]
+
+
+def convert_to_cnf(expr: Expr, mode: str = "equivalent", plaisted_greenbaum: bool = True, stats: Stats | None = None,
+                   budget: Budget | None = None) -> Expr:
+    # "equivalent": distributive expansion, same models, may grow exponentially
+    # "equisatisfiable": Tseitin encoding with fresh variables, linear size
+    # Raises BudgetExceeded if the budget runs out first; in "equivalent"
+    # mode its partial is the CNF of the top-level conjuncts converted so
+    # far, a Tseitin encoding cut short has nothing usable.
+    if stats is not None:
+        with stats.phase("cnf"):
+            cnf = _convert(expr, mode, plaisted_greenbaum, budget, stats)
+        stats.add("cnf_clauses", len(cnf.operands) if isinstance(cnf, And) else 1)
+        return cnf
+    return _convert(expr, mode, plaisted_greenbaum, budget)
+
+
+def _convert(expr: Expr, mode: str, plaisted_greenbaum: bool, budget: Budget | None,
+             stats: Stats | None = None) -> Expr:
+    if mode == "equisatisfiable":
+        from clausedb import ClauseDB
+        db = ClauseDB()
+        tseitin(expr, db, plaisted_greenbaum, budget, stats)
+        return And(*db.to_exprs())
+    if mode != "equivalent":
+        raise ValueError(f"Unknown CNF conversion mode: {mode}")
+
+    try:
+        clauses = _clauses(expr, budget, stats)
+    except BudgetExceeded as exceeded:
+        if exceeded.partial is not None:
+            exceeded.partial = And(*(Or(*clause) if len(clause) > 1 else clause[0] for clause in exceeded.partial))
+        raise
+    return And(*(Or(*clause) if len(clause) > 1 else clause[0] for clause in clauses))
 
 if __name__ == "__main__":
     A = Symbol("A")
@@ -214,3 +574,4 @@ if __name__ == "__main__":
     print("Before Convert", expr)
     expr = convert_to_cnf(expr)
     print("After Convert", expr)
+    print("Equisatisfiable", convert_to_cnf(Iff(A, Or(H, I, J, G, E, And(B, C, D))), mode="equisatisfiable"))
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import copy
+import itertools
+import pickle
+import random
+
+import pytest
+
+from budget import Budget, BudgetExceeded
+from cdcl import Solver
+from clausedb import ClauseDB
+from generators import deep_implies
+from hadeh import And, Iff, Implies, Not, Or, Symbol, convert_to_cnf, is_cnf, tseitin
+
+A, B, C, D = (Symbol(name) for name in "ABCD")
+
+
+def _random_formula(rng: random.Random, depth: int):
+    if depth == 0 or rng.random() < 0.2:
+        return rng.choice((A, B, C, D))
+    kind = rng.choice((And, Or, Not, Implies, Iff))
+    if kind is Not:
+        return Not(_random_formula(rng, depth - 1))
+    if kind in (And, Or):
+        return kind(*(_random_formula(rng, depth - 1) for _ in range(rng.randint(2, 3))))
+    return kind(_random_formula(rng, depth - 1), _random_formula(rng, depth - 1))
+
+
+def _value(expr, assignment: dict) -> bool:
+    if isinstance(expr, Symbol):
+        return assignment[expr.name]
+    if isinstance(expr, Not):
+        return not _value(expr.expr, assignment)
+    if isinstance(expr, And):
+        return all(_value(op, assignment) for op in expr.operands)
+    if isinstance(expr, Or):
+        return any(_value(op, assignment) for op in expr.operands)
+    if isinstance(expr, Implies):
+        return not _value(expr.premise, assignment) or _value(expr.conclusion, assignment)
+    return _value(expr.left, assignment) == _value(expr.right, assignment)
+
+
+def _assignments():
+    for values in itertools.product((False, True), repeat=4):
+        yield dict(zip("ABCD", values))
+
+
+FORMULAS = [_random_formula(random.Random(seed), 4) for seed in range(40)]
+
+
+def test_equal_formulas_are_one_object():
+    assert Symbol("A") is A
+    assert Implies(And(A, B), Not(C)) is Implies(And(A, B), Not(C))
+    assert Not(A) is not A and Implies(A, B) is not Implies(B, A)
+
+
+def test_canonical_order():
+    assert And(A, B) is And(B, A)
+    assert Or(A, Or(B, C)) is Or(C, B, A)
+    assert And(A, And(B, A), A).operands == And(B, A).operands
+    assert Iff(A, B) is Iff(B, A)
+    assert hash(Or(A, Not(B))) == hash(Or(Not(B), A))
+
+
+def test_immutable():
+    with pytest.raises(AttributeError):
+        A.name = "B"
+    with pytest.raises(AttributeError):
+        del And(A, B).operands
+
+
+def test_copies_are_interned():
+    formula = Iff(Or(A, And(B, C)), Not(D))
+    assert pickle.loads(pickle.dumps(formula)) is formula
+    assert copy.deepcopy(formula) is formula
+    assert copy.copy(formula) is formula
+
+
+def test_to_cnf_is_memoized_per_node():
+    formula = Implies(Or(A, B), And(C, D))
+    assert formula.to_cnf() is formula.to_cnf()
+    assert Implies(Or(A, B), And(C, D)).to_cnf() is formula.to_cnf()
+
+
+@pytest.mark.parametrize("plaisted_greenbaum", [True, False], ids=["pg", "full"])
+@pytest.mark.parametrize("seed", range(len(FORMULAS)))
+def test_tseitin_models_project_to_the_formula(seed, plaisted_greenbaum):
+    # Equisatisfiable, and more: an assignment of the original atoms extends
+    # to a model of the encoding exactly when it satisfies the formula
+    formula = FORMULAS[seed]
+    db = ClauseDB()
+    for name in "ABCD":
+        db.symbols.var(name)
+    tseitin(formula, db, plaisted_greenbaum)
+    solver = Solver(db)
+    for assignment in _assignments():
+        assumptions = [db.symbols.var(name) if value else -db.symbols.var(name) for name, value in assignment.items()]
+        assert (solver.solve(assumptions).status == "SAT") == _value(formula, assignment)
+
+
+def test_equisatisfiable_mode_is_linear():
+    formula = A
+    for i in range(200):
+        formula = Iff(formula, Symbol(f"x{i}"))
+    cnf = convert_to_cnf(formula, mode="equisatisfiable")
+    assert len(cnf.operands) <= 4 * 200 + 1
+
+
+@pytest.mark.parametrize("seed", range(len(FORMULAS)))
+def test_equivalent_mode_has_the_same_truth_table(seed):
+    formula = FORMULAS[seed]
+    cnf = convert_to_cnf(formula)
+    assert is_cnf(cnf)
+    for assignment in _assignments():
+        assert _value(cnf, assignment) == _value(formula, assignment)
+
+
+def test_equivalent_mode_on_deep_formulas():
+    # One clause with a literal per nesting level, built without recursion
+    (clause,) = convert_to_cnf(deep_implies(20000)).operands
+    assert len(clause.operands) == 20001
+
+
+@pytest.mark.parametrize("limits", [{"steps": 4}, {"live": 2}], ids=["steps", "live"])
+def test_budget_stop_at_the_root_reports_every_conjunct(limits):
+    # The three clauses are done and the stop comes while the root And
+    # combines them, so all of them are in the partial result
+    formula = And(Or(A, B), Or(C, D), Or(A, Not(D)))
+    with pytest.raises(BudgetExceeded) as exceeded:
+        convert_to_cnf(formula, budget=Budget(**limits))
+    assert exceeded.value.partial is convert_to_cnf(formula)
+
+
+def test_budget_partial_is_entailed():
+    formula = And(*(Iff(Symbol(f"x{i}"), Or(A, And(B, Symbol(f"y{i}")))) for i in range(30)))
+    with pytest.raises(BudgetExceeded) as exceeded:
+        convert_to_cnf(formula, budget=Budget(steps=40))
+    partial = exceeded.value.partial
+    assert 0 < len(partial.operands) < len(convert_to_cnf(formula).operands)
+    assert set(partial.operands) <= set(convert_to_cnf(formula).operands)
@@ -0,0 +1,177 @@
+from __future__ import annotations
+from collections import defaultdict, deque
+from typing import Iterable, Iterator
+
+from budget import Budget, BudgetExceeded
+from logic import Expr, Key, Rule, compile_rules, literal_key, make_literal
+from stats import Stats
+
+
+class MaterializedClosure:
+    # The Horn closure of a changing knowledge base, kept up to date instead
+    # of recomputed. Every rule keeps the Dowling–Gallier counter of its body
+    # literals that are not in the closure, so additions only propagate their
+    # own consequences. Deletions use DRed: over-delete everything whose
+    # derivation may have used the removed rule, then re-derive the part
+    # that still has another derivation. Plain support counting would keep
+    # literals that only support each other through a cycle.
+    #
+    # A budget passed to an update counts the literals it derives as steps.
+    # When it runs out the update is made but its consequences are only
+    # partly derived; the rest stay on the agenda, which resume() and every
+    # later update work off.
+    def __init__(self, knowledge_base: Iterable[Expr] = (), stats: Stats | None = None):
+        self.rules = {}  # rule id -> Rule
+        self.missing = {}  # rule id -> body literals not in the closure
+        self.watching = defaultdict(set)  # body literal -> rule ids
+        self.by_head = defaultdict(set)  # head -> rule ids
+        self.sources = defaultdict(list)  # added expression -> its rule ids, per add
+        self.asserted = {}  # fact key -> rule id
+        self.literals = {}
+        self.inferred = {}
+        self.agenda = deque()  # derived, not yet propagated
+        self.stats = stats
+        self._next_id = 0
+        for expr in knowledge_base:
+            self.add_rule(expr)
+
+    def __contains__(self, literal: Expr) -> bool:
+        return literal_key(literal) in self.inferred
+
+    def __len__(self) -> int:
+        return len(self.inferred)
+
+    def __iter__(self) -> Iterator[Expr]:
+        for key in self.inferred:
+            if key not in self.literals:
+                self.literals[key] = make_literal(key)
+            yield self.literals[key]
+
+    # -- updates ----------------------------------------------------------
+
+    def assert_fact(self, literal: Expr, budget: Budget | None = None):
+        key = self._key(literal)
+        if key not in self.asserted:
+            self.literals.setdefault(key, literal)
+            self.asserted[key] = self._insert(Rule((), key))
+            self._propagate(budget)
+
+    def retract_fact(self, literal: Expr, budget: Budget | None = None):
+        key = self._key(literal)
+        if key in self.asserted:
+            self._delete([self.asserted.pop(key)], budget)
+
+    def add_rule(self, rule: Expr | Rule, budget: Budget | None = None):
+        if isinstance(rule, Rule):
+            rules = [rule]
+        else:
+            rules, literals = compile_rules([rule])
+            for key, literal in literals.items():
+                self.literals.setdefault(key, literal)
+        self.sources[rule].append([self._insert(r) for r in rules])
+        self._propagate(budget)
+
+    def remove_rule(self, rule: Expr | Rule, budget: Budget | None = None):
+        # Undoes one add_rule of the same expression
+        added = self.sources.get(rule)
+        if not added:
+            raise KeyError(f"Rule was not added: {rule}")
+        ids = added.pop()
+        if not added:
+            del self.sources[rule]
+        self._delete(ids, budget)
+
+    def resume(self, budget: Budget | None = None):
+        # Finishes the derivations an update ran out of budget for
+        self._propagate(budget)
+
+    # -- maintenance ------------------------------------------------------
+
+    @staticmethod
+    def _key(literal: Expr) -> Key:
+        key = literal_key(literal)
+        if key is None:
+            raise ValueError(f"Fact is not a literal: {literal}")
+        return key
+
+    def _insert(self, rule: Rule) -> int:
+        i = self._next_id
+        self._next_id += 1
+        body = tuple(dict.fromkeys(rule.body))
+        self.rules[i] = Rule(body, rule.head)
+        self.missing[i] = sum(1 for key in body if key not in self.inferred)
+        for key in body:
+            self.watching[key].add(i)
+        self.by_head[rule.head].add(i)
+        if self.missing[i] == 0 and rule.head not in self.inferred:
+            self.agenda.append(rule.head)
+        return i
+
+    def _propagate(self, budget: Budget | None = None) -> int:
+        # Checked before a literal is taken off the agenda, so stopping
+        # never leaves a derived literal with its rules not updated
+        agenda = self.agenda
+        derived = 0
+        next_check = float("inf") if budget is None else budget.check()
+        try:
+            while agenda:
+                if derived >= next_check:
+                    next_check = budget.check(derived, len(self.inferred))
+                key = agenda.popleft()
+                if key in self.inferred:
+                    continue
+                self.inferred[key] = None
+                derived += 1
+                for i in self.watching.get(key, ()):
+                    self.missing[i] -= 1
+                    if self.missing[i] == 0:
+                        agenda.append(self.rules[i].head)
+        except BudgetExceeded as exceeded:
+            exceeded.partial = self
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.add("derived", derived)
+        return derived
+
+    def _delete(self, ids: list[int], budget: Budget | None = None):
+        # Over-delete: heads of firing rules being removed, and transitively
+        # the heads of firing rules whose body contains a deleted literal
+        deleted = {}
+        queue = deque()
+        for i in ids:
+            rule = self.rules.pop(i)
+            fired = self.missing.pop(i) == 0
+            for key in rule.body:
+                self.watching[key].discard(i)
+            self.by_head[rule.head].discard(i)
+            if fired and rule.head in self.inferred and rule.head not in deleted:
+                deleted[rule.head] = None
+                queue.append(rule.head)
+        while queue:
+            key = queue.popleft()
+            for i in self.watching.get(key, ()):
+                head = self.rules[i].head
+                if self.missing[i] == 0 and head in self.inferred and head not in deleted:
+                    deleted[head] = None
+                    queue.append(head)
+
+        for key in deleted:
+            del self.inferred[key]
+        for key in deleted:
+            for i in self.watching.get(key, ()):
+                self.missing[i] += 1
+
+        # Re-derive: deleted literals that still have a rule with its whole
+        # body in what survived, and everything that follows from them. Left
+        # over from an update that ran out of budget, the agenda may hold
+        # heads of rules just removed: only those with a rule that still
+        # fires stay (the others come back if another rule fires later).
+        firing = lambda key: any(self.missing[i] == 0 for i in self.by_head.get(key, ()))
+        self.agenda = deque(key for key in self.agenda if firing(key))
+        self.agenda.extend(key for key in deleted if firing(key))
+        if self.stats is not None:
+            self.stats.add("overdeleted", len(deleted))
+        rederived = self._propagate(budget)
+        if self.stats is not None:
+            self.stats.add("rederived", rederived)
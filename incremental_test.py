@@ -0,0 +1,82 @@
+from __future__ import annotations
+import random
+
+import pytest
+
+from budget import Budget, BudgetExceeded
+from generators import random_horn
+from hadeh import Symbol
+from incremental import MaterializedClosure
+from logic import literal_key
+from main import forward_chaining
+
+
+def _keys(literals) -> set:
+    return {literal_key(literal) for literal in literals}
+
+
+def _updates(seed: int, count: int = 60):
+    # Random fact and rule assertions and retractions, each retraction of
+    # something currently asserted
+    rng = random.Random(seed)
+    symbols = [Symbol(f"p{i}") for i in range(20)]
+    spare = random_horn(40, 20, num_facts=0, seed=seed + 1000)
+    facts, rules = [], []
+    for _ in range(count):
+        choice = rng.random()
+        if choice < 0.35:
+            fact = rng.choice(symbols)
+            if fact not in facts:
+                facts.append(fact)
+                yield "assert_fact", fact
+        elif choice < 0.55 and facts:
+            yield "retract_fact", facts.pop(rng.randrange(len(facts)))
+        elif choice < 0.8:
+            rule = rng.choice(spare)
+            rules.append(rule)
+            yield "add_rule", rule
+        elif rules:
+            yield "remove_rule", rules.pop(rng.randrange(len(rules)))
+
+
+def _current(knowledge_base: list, updates: list) -> list:
+    facts, rules = [], list(knowledge_base)
+    for op, expr in updates:
+        if op == "assert_fact":
+            facts.append(expr)
+        elif op == "retract_fact":
+            facts.remove(expr)
+        elif op == "add_rule":
+            rules.append(expr)
+        else:
+            rules.remove(expr)
+    return rules + facts
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_updates_match_recomputed_closure(seed):
+    knowledge_base = random_horn(30, 20, num_facts=0, seed=seed)
+    closure = MaterializedClosure(knowledge_base)
+    done = []
+    for op, expr in _updates(seed):
+        getattr(closure, op)(expr)
+        done.append((op, expr))
+        assert _keys(closure) == _keys(forward_chaining(_current(knowledge_base, done)))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_updates_out_of_budget_then_resume(seed):
+    knowledge_base = random_horn(30, 20, num_facts=0, seed=seed)
+    closure = MaterializedClosure(knowledge_base)
+    done = []
+    for op, expr in _updates(seed):
+        try:
+            getattr(closure, op)(expr, Budget(steps=2))
+        except BudgetExceeded as exceeded:
+            assert exceeded.partial is closure
+        done.append((op, expr))
+        if len(done) % 3 == 0:
+            closure.resume()
+            assert _keys(closure) == _keys(forward_chaining(_current(knowledge_base, done)))
+    closure.resume()
+    assert _keys(closure) == _keys(forward_chaining(_current(knowledge_base, done)))
@@ -0,0 +1,118 @@
+from __future__ import annotations
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from typing import Iterable
+
+from clausedb import ClauseDB
+from parser import parse_db
+from stats import Stats
+
+# Bump whenever parse_db or the ClauseDB layout changes what a file turns
+# into; every entry written by an older version then misses.
+VERSION = 1
+
+# magic, version, strict, source sha256, num_clauses, num_lits, names bytes
+_HEADER = struct.Struct("<8sII32sqqq")
+_MAGIC = b"KBCACHE\0"
+
+
+class MappedClauseDB(ClauseDB):
+    # A ClauseDB whose literal and offset buffers are read-only views into
+    # the mapped cache file. Reads need no copy; the first added clause
+    # copies both buffers into ordinary arrays.
+    def add_clause(self, lits: Iterable[int]) -> int:
+        if isinstance(self.lits, memoryview):
+            buffers = array("i"), array("q")
+            buffers[0].frombytes(self.lits.cast("B"))
+            buffers[1].frombytes(self.offsets.cast("B"))
+            self.lits, self.offsets = buffers
+        return super().add_clause(lits)
+
+
+def default_dir() -> str:
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "krr-kb")
+
+
+def source_hash(file_name: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return digest.digest()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            digest.update(data)
+    return digest.digest()
+
+
+def cache_path(file_name: str, cache_dir: str | None = None, strict: bool = True) -> tuple[str, bytes]:
+    content = source_hash(file_name)
+    key = hashlib.sha256(content + b"%d:%d" % (VERSION, strict)).hexdigest()
+    return os.path.join(cache_dir or default_dir(), key + ".kbc"), content
+
+
+def save(db: ClauseDB, path: str, content: bytes, strict: bool = True):
+    if any("\0" in name for name in db.symbols.names[1:]):
+        raise ValueError("symbol names with NUL bytes cannot be cached")
+    names = "\0".join(db.symbols.names[1:]).encode()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Written next to the target and renamed, so readers never see half a file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(_HEADER.pack(_MAGIC, VERSION, strict, content, len(db), len(db.lits), len(names)))
+            file.write(array("q", db.offsets).tobytes())
+            file.write(array("i", db.lits).tobytes())
+            file.write(names)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load(path: str, content: bytes | None = None) -> MappedClauseDB | None:
+    # None when the entry is missing, truncated or from another version
+    try:
+        file = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with file:
+        size = os.fstat(file.fileno()).st_size
+        if size < _HEADER.size:
+            return None
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, stored, num_clauses, num_lits, names_size = _HEADER.unpack_from(data)
+    offsets_end = _HEADER.size + 8 * (num_clauses + 1)
+    lits_end = offsets_end + 4 * num_lits
+    if magic != _MAGIC or version != VERSION or (content is not None and stored != content) \
+            or size != lits_end + names_size:
+        data.close()
+        return None
+
+    view = memoryview(data)
+    db = MappedClauseDB()
+    db.offsets = view[_HEADER.size:offsets_end].cast("q")
+    db.lits = view[offsets_end:lits_end].cast("i")
+    symbols = db.symbols
+    if names_size:
+        symbols.names += bytes(view[lits_end:]).decode().split("\0")
+        symbols.ids = dict(zip(symbols.names[1:], range(1, len(symbols.names))))
+    return db
+
+
+def load_db(file_name: str, cache_dir: str | None = None, strict: bool = True, stats: Stats | None = None) -> ClauseDB:
+    # parse_db through the cache: a warm start only hashes the source and
+    # maps the cached arrays
+    path, content = cache_path(file_name, cache_dir, strict)
+    if stats is None:
+        db = load(path, content)
+    else:
+        with stats.phase("cache"):
+            db = load(path, content)
+        stats.add("cache_hits" if db is not None else "cache_misses")
+    if db is None:
+        db = parse_db(file_name, strict, stats)
+        save(db, path, content, strict)
+    return db
@@ -0,0 +1,79 @@
+from __future__ import annotations
+import os
+
+import pytest
+
+import kbcache
+from kbcache import MappedClauseDB, cache_path, load_db
+from main import forward_chaining
+from parser import parse_db
+from stats import Stats
+
+CNF = b"p cnf 4 4\n1 0\n-1 2 0\n-2 -3 4 0\n-4 0\n"
+
+
+def _clauses(db) -> list[list[int]]:
+    return [clause.tolist() for clause in db]
+
+
+@pytest.fixture
+def cnf(tmp_path) -> str:
+    path = tmp_path / "kb.cnf"
+    path.write_bytes(CNF)
+    return str(path)
+
+
+def _load(cnf: str, cache_dir: str, **options):
+    stats = Stats()
+    db = load_db(cnf, cache_dir, stats=stats, **options)
+    return db, stats.counters
+
+
+def test_miss_then_hit(cnf, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cold, counters = _load(cnf, cache_dir)
+    assert counters["cache_misses"] == 1 and not isinstance(cold, MappedClauseDB)
+    warm, counters = _load(cnf, cache_dir)
+    assert counters["cache_hits"] == 1 and isinstance(warm, MappedClauseDB)
+    assert _clauses(warm) == _clauses(cold) == _clauses(parse_db(cnf))
+    assert warm.symbols.names == cold.symbols.names and warm.symbols.ids == cold.symbols.ids
+    assert {str(literal) for literal in forward_chaining(warm)} == {"1", "2", "¬4"}
+
+
+def test_changed_content_misses(cnf, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    _load(cnf, cache_dir)
+    with open(cnf, "ab") as file:
+        file.write(b"c trailing comment\n")
+    assert _load(cnf, cache_dir)[1]["cache_misses"] == 1
+    with open(cnf, "wb") as file:
+        file.write(CNF)
+    assert _load(cnf, cache_dir)[1]["cache_hits"] == 1  # keyed by content, not by name or time
+
+
+def test_strictness_and_version_are_part_of_the_key(cnf, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    _load(cnf, cache_dir)
+    assert _load(cnf, cache_dir, strict=False)[1]["cache_misses"] == 1
+    monkeypatch.setattr(kbcache, "VERSION", kbcache.VERSION + 1)
+    assert _load(cnf, cache_dir)[1]["cache_misses"] == 1
+
+
+def test_corrupt_entries_miss(cnf, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    _load(cnf, cache_dir)
+    path, _ = cache_path(cnf, cache_dir)
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - 1)
+    db, counters = _load(cnf, cache_dir)
+    assert counters["cache_misses"] == 1 and _clauses(db) == _clauses(parse_db(cnf))
+    assert _load(cnf, cache_dir)[1]["cache_hits"] == 1  # rewritten by the miss
+
+
+def test_mapped_db_copies_on_write(cnf, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    _load(cnf, cache_dir)
+    warm, _ = _load(cnf, cache_dir)
+    warm.add_clause([3])
+    assert _clauses(warm)[-1] == [3] and len(warm) == 5
+    assert len(_load(cnf, cache_dir)[0]) == 4
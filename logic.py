@@ -0,0 +1,241 @@
+from __future__ import annotations
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Union
+
+from budget import Budget, BudgetExceeded
+import hadeh
+import model
+from stats import Stats
+from traversal import fold, walk
+
+# Both expression families (hadeh: n-ary, model: binary) are accepted everywhere.
+SYMBOL = (hadeh.Symbol, model.Symbol)
+NOT = (hadeh.Not, model.Not)
+AND = (hadeh.And, model.And)
+OR = (hadeh.Or, model.Or)
+IMPLIES = (hadeh.Implies, model.Implies)
+
+Expr = Union[
+    hadeh.Symbol, hadeh.And, hadeh.Or, hadeh.Not, hadeh.Implies, hadeh.Iff,
+    model.Symbol, model.And, model.Or, model.Not, model.Implies,
+]
+
+# A literal is keyed by (symbol name, polarity), independent of the family.
+Key = tuple[str, bool]
+
+
+@dataclass(frozen=True)
+class Rule:
+    body: tuple[Key, ...]
+    head: Key
+
+
+def family_of(expr: Expr):
+    return model if type(expr).__module__ == model.__name__ else hadeh
+
+
+def negated(expr: Expr) -> Expr:
+    return expr.expr if isinstance(expr, hadeh.Not) else expr.symbol
+
+
+def operands(expr: Expr) -> tuple[Expr, ...]:
+    if isinstance(expr, (hadeh.And, hadeh.Or)):
+        return expr.operands
+
+    # model's And/Or are binary, flatten chains of the same connective
+    kind = type(expr)
+    flat = []
+    stack = [expr]
+    while stack:
+        e = stack.pop()
+        if type(e) is kind:
+            stack.append(e.op2)
+            stack.append(e.op1)
+        else:
+            flat.append(e)
+    return tuple(flat)
+
+
+def children(expr: Expr) -> tuple[Expr, ...]:
+    if isinstance(expr, SYMBOL):
+        return ()
+    if isinstance(expr, (hadeh.And, hadeh.Or)):
+        return expr.operands
+    if isinstance(expr, (model.And, model.Or)):
+        return expr.op1, expr.op2
+    if isinstance(expr, NOT):
+        return (negated(expr),)
+    if isinstance(expr, IMPLIES):
+        return expr.premise, expr.conclusion
+    if isinstance(expr, hadeh.Iff):
+        return expr.left, expr.right
+    raise ValueError(f"Unknown expression: {expr}")
+
+
+def literal_key(expr: Expr) -> Key | None:
+    positive = True
+    while isinstance(expr, NOT):
+        expr = negated(expr)
+        positive = not positive
+    if isinstance(expr, SYMBOL):
+        return expr.name, positive
+    return None
+
+
+def make_literal(key: Key, family=hadeh) -> Expr:
+    name, positive = key
+    symbol = family.Symbol(name)
+    return symbol if positive else family.Not(symbol)
+
+
+def literals(expr: Expr) -> dict[Key, Expr]:
+    # Every literal occurring in expr, by key, first occurrence first
+    found = {}
+    for node in walk(expr, lambda e: () if literal_key(e) is not None else children(e)):
+        key = literal_key(node)
+        if key is not None:
+            found.setdefault(key, node)
+    return found
+
+
+def _truth(assignment: Mapping[str, bool]):
+    def combine(expr, values):
+        if isinstance(expr, SYMBOL):
+            return assignment[expr.name]
+        if isinstance(expr, NOT):
+            return not values[0]
+        if isinstance(expr, AND):
+            return all(values)
+        if isinstance(expr, OR):
+            return any(values)
+        if isinstance(expr, IMPLIES):
+            return not values[0] or values[1]
+        if isinstance(expr, hadeh.Iff):
+            return values[0] == values[1]
+        raise ValueError(f"Unknown expression: {expr}")
+    return combine
+
+
+def evaluate(expr: Expr, assignment: Mapping[str, bool]) -> bool:
+    # Truth value under a total assignment of symbol names; a missing
+    # symbol raises KeyError
+    return fold(expr, children, _truth(assignment))
+
+
+def conjuncts(expr: Expr) -> tuple[Expr, ...]:
+    return operands(expr) if isinstance(expr, AND) else (expr,)
+
+
+def disjuncts(expr: Expr) -> tuple[Expr, ...]:
+    return operands(expr) if isinstance(expr, OR) else (expr,)
+
+
+def _bodies(premise: Expr) -> list[tuple[Key, ...]] | None:
+    # (a ∧ b) ∨ c ⊃ x is the same as the two rules a ∧ b ⊃ x and c ⊃ x
+    bodies = []
+    for alternative in disjuncts(premise):
+        body = []
+        for literal in conjuncts(alternative):
+            key = literal_key(literal)
+            if key is None:
+                return None
+            body.append(key)
+        bodies.append(tuple(dict.fromkeys(body)))
+    return bodies
+
+
+def compile_rules(knowledge_base: Iterable[Expr]) -> tuple[list[Rule], dict[Key, Expr]]:
+    rules = []
+    literals = {}
+
+    def remember(key, expr):
+        if key not in literals:
+            literals[key] = make_literal(key, family_of(expr))
+
+    stack = list(knowledge_base)
+    stack.reverse()
+    while stack:
+        rule = stack.pop()
+
+        key = literal_key(rule)
+        if key is not None:
+            remember(key, rule)
+            rules.append(Rule((), key))
+
+        elif isinstance(rule, AND):
+            stack.extend(reversed(operands(rule)))
+
+        elif isinstance(rule, IMPLIES):
+            bodies = _bodies(rule.premise)
+            heads = [literal_key(c) for c in conjuncts(rule.conclusion)]
+            if bodies is None or None in heads:
+                continue  # not a Horn rule
+            for body in bodies:
+                for head in heads:
+                    remember(head, rule)
+                    rules.append(Rule(body, head))
+
+        elif isinstance(rule, hadeh.Iff):
+            stack.append(hadeh.Implies(rule.right, rule.left))
+            stack.append(hadeh.Implies(rule.left, rule.right))
+
+        elif isinstance(rule, OR):
+            # Clause [p, -p1, ..., -pn] is the rule p1 ∧ ... ∧ pn ⊃ p
+            keys = [literal_key(op) for op in operands(rule)]
+            if None in keys:
+                continue
+            heads = [k for k in keys if k[1]]
+            if len(heads) != 1:
+                continue  # goal clause or not Horn
+            body = tuple(dict.fromkeys((name, True) for name, positive in keys if not positive))
+            remember(heads[0], rule)
+            rules.append(Rule(body, heads[0]))
+
+    return rules, literals
+
+
+def horn_closure(rules: list[Rule], stats: Stats | None = None, budget: Budget | None = None) -> dict[Key, None]:
+    # Dowling–Gallier: every rule counts its unsatisfied body literals and is
+    # only touched when one of them becomes true, so closure is O(|KB|).
+    # A budget counts inferred literals as steps; when it runs out,
+    # BudgetExceeded carries the literals inferred so far.
+    watching = defaultdict(list)
+    missing = []
+    agenda = deque()
+    for i, rule in enumerate(rules):
+        missing.append(len(rule.body))
+        if not rule.body:
+            agenda.append(rule.head)
+        for key in rule.body:
+            watching[key].append(i)
+
+    inferred = {}
+    next_check = budget.check() if budget is not None else Stats.interval if stats is not None else float("inf")
+    try:
+        while agenda:
+            key = agenda.popleft()
+            if key in inferred:
+                continue
+            inferred[key] = None
+            if len(inferred) >= next_check:
+                if stats is not None:
+                    stats.tick("forward", inferred=len(inferred), agenda=len(agenda))
+                next_check = (len(inferred) + Stats.interval if budget is None
+                              else budget.check(len(inferred), len(inferred)))
+            for i in watching.get(key, ()):
+                missing[i] -= 1
+                if missing[i] == 0:
+                    agenda.append(rules[i].head)
+    except BudgetExceeded as exceeded:
+        exceeded.partial = inferred
+        raise
+    finally:
+        if stats is not None:
+            # Recovered from the counters afterwards instead of counted in the loop
+            stats.add("rules", len(rules))
+            stats.add("rules_fired", missing.count(0))
+            stats.add("body_literals_matched", sum(len(rule.body) - left for rule, left in zip(rules, missing)))
+            stats.add("inferred", len(inferred))
+            stats.peak("inferred", len(inferred))
+    return inferred
@@ -1,130 +1,347 @@
-from hadeh import Symbol, Or, And, Not, Implies
-from typing import List, Union
-from parser import parse
-
-def forward_chaining(knowledge_base: List[Union[Symbol, Implies, And, Or, Not]]) -> List[Symbol]:
-    inferred = set()
-    new_facts = True
-
-    while new_facts:
-        new_facts = False
-        for rule in knowledge_base:
-            if isinstance(rule, Implies):
-                premise = rule.premise
-                conclusion = rule.conclusion
-                if premise in inferred and conclusion not in inferred:
-                    inferred.add(conclusion)
-                    new_facts = True
-            elif isinstance(rule, And):
-                if rule.op1 in inferred and rule.op2 in inferred:
-                    inferred.add(rule)
-                    new_facts = True
-            elif isinstance(rule, Symbol):
-                if rule not in inferred:
-                    inferred.add(rule)
-                    new_facts = True
-
-    return list(inferred)
-
-def is_solved(solved: List[Union[Symbol, Implies, And, Or, Not]], query: Union[Symbol, Or, Not]) -> bool:
-    if isinstance(query, Symbol):
-        return query in solved
-
-    if isinstance(query, Not):
-        return query.symbol in solved
-
-    return is_solved(solved, query.op1) and is_solved(solved, query.op2)
-
-def sld_resolution(knowledge_base: List[Union[Symbol, Implies, And, Or, Not]], goals: List[Symbol]) -> str:
-    solved = []
-
-    while True:
-        # Step 1: If all goals are solved, return YES
-        print(solved)
-        if all(goal in solved for goal in goals):
-            return "YES"
-
-        # Step 2: Find a clause [p, -p1, ..., -pn] where all -pi are solved and p is not solved
-        found_clause = False
-        for clause in knowledge_base:
-            if isinstance(clause, Implies):
-                # Convert implication to CNF: A → B ≡ ¬A ∨ B
-                premise = clause.premise
-                conclusion = clause.conclusion
-                if isinstance(premise, Symbol) and premise in solved and conclusion not in solved:
-                    solved.append(conclusion)
-                    found_clause = True
-                    break
-            elif isinstance(clause, And):
-                # Handle AND clauses (if needed)
-                pass
-            elif isinstance(clause, Or):
-                # Handle OR clauses (if needed)
-                found_solved = False
-                pos = None
-                for op in clause.operands:
-                    if not isinstance(op, Not):
-                        pos = clause
-                    else:
-                        if op.expr not in solved:
-                            break
-                    found_solved = True
-
-                if found_solved and pos is not None:
-                    solved.append(pos)
-                else:
-                    continue
-
-
-                # if is_solved(solved, clause.op1) and isinstance(clause.op2, Symbol) and clause.op2 not in solved:
-                #     solved.append(clause.op2)
-                #     found_clause = True
-                #     break
-            elif isinstance(clause, Symbol):
-                # Handle atomic symbols
-                if clause not in solved:
-                    solved.append(clause)
-                    found_clause = True
-                    break
-
-        # Step 4: If no such clause is found, return NO
-        if not found_clause:
-            return "NO"
-
-if __name__ == "__main__":
-    knowledge_base = list(parse("tc1.cnf")[0])
-
-    goals = [Symbol("4")]
-
-    # first_grade = Symbol("FirstGrade")
-    # child = Symbol("Child")
-    # male = Symbol("Male")
-    # boy = Symbol("Boy")
-    # kindergarten = Symbol("Kindergarten")
-    # female = Symbol("Female")
-    # girl = Symbol("Girl")
-    #
-    # # Define knowledge base
-    # knowledge_base = [
-    #     first_grade,
-    #     Implies(first_grade, child),
-    #     Implies(And(child, male), boy),
-    #     Implies(kindergarten, child),
-    #     Implies(And(child, female), girl),
-    #     female
-    # ]
-
-    # Define goals
-    # goals = [girl]
-
-    for i, rule in enumerate(knowledge_base):
-        if isinstance(rule, Implies):
-            knowledge_base[i] = rule.to_cnf()
-    for k in knowledge_base:
-        print(k)
-    # print("ZCCZCZC")
-    # for k in knowledge_base:
-    #     print(k)
-    # Perform SLD resolution
-    result = sld_resolution(knowledge_base, goals)
-    print("Result:", result)  # Output: "YES" or "NO"
+from __future__ import annotations
+import argparse
+import signal
+import sys
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from hadeh import Symbol, Or, And, Not, Implies
+from typing import Dict, List, Set, Union
+from parser import parse_db
+from budget import Budget, BudgetExceeded
+import cdcl
+import cube
+import fragments
+import portfolio
+from preprocess import preprocess
+from proof import proof_writer
+from clausedb import ClauseDB
+from kbcache import load_db
+from logic import AND, OR, Key, Rule, compile_rules, conjuncts, horn_closure, literal_key, operands
+from stats import Stats
+
+def compile_db(db: ClauseDB) -> tuple[List[Rule], Dict[Key, Union[Symbol, Not]]]:
+    # compile_rules over a ClauseDB (one mapped from the cache, say) without
+    # building an expression per clause first: clauses with exactly one
+    # positive literal are rules, negative unit clauses negative facts
+    names = db.symbols.names
+    positive = [(name, True) for name in names]  # one key per atom, shared by every rule
+    lits, offsets = db.lits.tolist(), db.offsets.tolist()
+    rules = []
+    literals = {}
+    for start, end in zip(offsets, offsets[1:]):
+        clause = lits[start:end]
+        heads = [lit for lit in clause if lit > 0]
+        if len(heads) == 1:
+            head = positive[heads[0]]
+            body = tuple([positive[-lit] for lit in clause if lit < 0])
+        elif end - start == 1:
+            head, body = (names[-clause[0]], False), ()
+        else:
+            continue  # goal clause or not Horn
+        if head not in literals:
+            literals[head] = Symbol(head[0]) if head[1] else Not(Symbol(head[0]))
+        rules.append(Rule(body, head))
+    return rules, literals
+
+def _compile(knowledge_base, stats: Stats | None):
+    # Every engine below takes either expressions or a ClauseDB
+    compile = compile_db if isinstance(knowledge_base, ClauseDB) else compile_rules
+    if stats is None:
+        return compile(knowledge_base)
+    with stats.phase("compile"):
+        return compile(knowledge_base)
+
+def forward_chaining(knowledge_base: List[Union[Symbol, Implies, And, Or, Not]], stats: Stats | None = None,
+                     budget: Budget | None = None) -> List[Union[Symbol, Not]]:
+    # When the budget runs out, BudgetExceeded.partial has the literals
+    # inferred so far, every one of them entailed
+    rules, literals = _compile(knowledge_base, stats)
+    try:
+        if stats is None:
+            return [literals[key] for key in horn_closure(rules, budget=budget)]
+        with stats.phase("closure"):
+            inferred = horn_closure(rules, stats, budget)
+    except BudgetExceeded as exceeded:
+        exceeded.partial = [literals[key] for key in exceeded.partial]
+        if stats is not None:
+            stats.emit("done", engine="forward", inferred=len(exceeded.partial), exhausted=exceeded.reason)
+        raise
+    stats.emit("done", engine="forward", inferred=len(inferred))
+    return [literals[key] for key in inferred]
+
+def _holds(facts, goal) -> bool:
+    # Post-order over the goal with an explicit stack: literals are hashed
+    # lookups into the facts, And/Or combine their operands' values.
+    values = []
+    stack = [(goal, None)]
+    while stack:
+        expr, arity = stack.pop()
+        if arity is not None:
+            args = values[len(values) - arity:]
+            del values[len(values) - arity:]
+            values.append(all(args) if isinstance(expr, AND) else any(args))
+            continue
+        key = literal_key(expr)
+        if key is not None:
+            values.append(key in facts)
+        elif isinstance(expr, AND + OR):
+            ops = operands(expr)
+            stack.append((expr, len(ops)))
+            stack.extend((op, None) for op in ops)
+        else:
+            raise ValueError(f"Goal is not a literal, conjunction or disjunction: {expr}")
+    return values[0]
+
+def is_solved(solved: List[Union[Symbol, Implies, And, Or, Not]], query: Union[Symbol, Or, Not]) -> bool:
+    return _holds({literal_key(literal) for literal in solved}, query)
+
+class Closure:
+    # The KB's closure, computed once; every goal is then answered in time
+    # linear in the size of the goal, independent of the size of the KB.
+    def __init__(self, knowledge_base: List[Union[Symbol, Implies, And, Or, Not]], stats: Stats | None = None,
+                 budget: Budget | None = None):
+        rules, _ = _compile(knowledge_base, stats)
+        if stats is None:
+            self.facts = horn_closure(rules, budget=budget)
+        else:
+            with stats.phase("closure"):
+                self.facts = horn_closure(rules, stats, budget)
+
+    def __contains__(self, goal) -> bool:
+        return _holds(self.facts, goal)
+
+    def holds(self, goal) -> bool:
+        return _holds(self.facts, goal)
+
+    def holds_all(self, goals) -> List[bool]:
+        facts = self.facts
+        return [_holds(facts, goal) for goal in goals]
+
+def evaluate_goals(knowledge_base: List[Union[Symbol, Implies, And, Or, Not]], goals, stats: Stats | None = None,
+                   budget: Budget | None = None) -> List[bool]:
+    closure = Closure(knowledge_base, stats, budget)
+    if stats is None:
+        return closure.holds_all(goals)
+    with stats.phase("goals"):
+        results = closure.holds_all(goals)
+    stats.add("goals", len(results))
+    return results
+
+@dataclass
+class Proof:
+    goal: Union[Symbol, Not]
+    premises: List[Proof] = field(default_factory=list)
+
+
+def _prove(goals: List[Key], rules: List[Rule], index: Dict[Key, List[int]], proven: Dict[Key, int], failed: Set[Key],
+           stats: Stats | None = None, budget: Budget | None = None):
+    # Subgoals reachable from the goals through the head index, found with
+    # an explicit goal stack. Loops just revisit a subgoal that is already
+    # tabled, and only the part of the KB the goals depend on is visited.
+    # Steps for the budget are subgoals visited plus subgoals proven.
+    next_check = budget.check() if budget is not None else Stats.interval if stats is not None else float("inf")
+    relevant = {}
+    missing = {}
+    try:
+        stack = [goal for goal in goals if goal not in proven and goal not in failed]
+        while stack:
+            key = stack.pop()
+            if key in relevant or key in proven or key in failed:
+                continue
+            relevant[key] = None
+            if len(relevant) >= next_check:
+                if stats is not None:
+                    stats.tick("sld", subgoals=len(relevant), open=len(stack))
+                next_check = len(relevant) + Stats.interval if budget is None else budget.check(len(relevant), len(stack))
+            for i in index.get(key, []):
+                stack.extend(rules[i].body)
+
+        # Completion: counter-based propagation over just those clauses. A
+        # subgoal that is still unproven afterwards cannot be proven at all.
+        watching = defaultdict(list)
+        agenda = deque()
+        for key in relevant:
+            for i in index.get(key, []):
+                body = [literal for literal in rules[i].body if literal not in proven]
+                if any(literal in failed for literal in body):
+                    continue
+                missing[i] = len(body)
+                if not body:
+                    agenda.append(i)
+                for literal in body:
+                    watching[literal].append(i)
+
+        steps = len(relevant)
+        while agenda:
+            i = agenda.popleft()
+            head = rules[i].head
+            if head in proven:
+                continue
+            proven[head] = i
+            steps += 1
+            if steps >= next_check:
+                if stats is not None:
+                    stats.tick("sld", subgoals=len(relevant), proven=len(proven))
+                next_check = steps + Stats.interval if budget is None else budget.check(steps, len(agenda))
+            for j in watching.get(head, []):
+                missing[j] -= 1
+                if missing[j] == 0:
+                    agenda.append(j)
+
+        failed.update(key for key in relevant if key not in proven)
+    finally:
+        if stats is not None:
+            stats.add("subgoals", len(relevant))
+            stats.add("index_hits", sum(len(index.get(key, ())) for key in relevant))
+            stats.add("clauses_visited", len(missing))
+            stats.add("subgoals_proven", sum(1 for key in relevant if key in proven))
+            stats.add("failed_subgoals", sum(1 for key in relevant if key in failed))
+            stats.peak("subgoals", len(relevant))
+
+
+def _proof_tree(goal: Key, rules: List[Rule], proven: Dict[Key, int], literals: Dict[Key, Union[Symbol, Not]]) -> Proof:
+    # Shared subgoals share one node, so the tree is really a DAG
+    nodes = {goal: Proof(literals[goal])}
+    stack = [goal]
+    while stack:
+        key = stack.pop()
+        for premise in rules[proven[key]].body:
+            if premise not in nodes:
+                nodes[premise] = Proof(literals[premise])
+                stack.append(premise)
+            nodes[key].premises.append(nodes[premise])
+    return nodes[goal]
+
+
+def sld_resolution(knowledge_base: List[Union[Symbol, Implies, And, Or, Not]], goals: List[Symbol], proof: bool = False,
+                   stats: Stats | None = None, budget: Budget | None = None):
+    # "YES", "NO", or "UNKNOWN" when the budget runs out first
+    rules, literals = _compile(knowledge_base, stats)
+
+    index = defaultdict(list)
+    for i, rule in enumerate(rules):
+        index[rule.head].append(i)
+
+    keys = []
+    for goal in goals:
+        for literal in conjuncts(goal):
+            key = literal_key(literal)
+            if key is None:
+                raise ValueError(f"Goal is not a literal: {literal}")
+            keys.append(key)
+
+    proven = {}
+    failed = set()
+    exhausted = None
+    try:
+        if stats is None:
+            _prove(keys, rules, index, proven, failed, budget=budget)
+        else:
+            with stats.phase("prove"):
+                _prove(keys, rules, index, proven, failed, stats, budget)
+    except BudgetExceeded as exceeded:
+        exhausted = exceeded.reason
+    # Whatever was proven before the budget ran out is proven
+    result = "YES" if all(key in proven for key in keys) else "NO" if exhausted is None else "UNKNOWN"
+    if stats is not None:
+        stats.emit("done", engine="sld", result=result)
+
+    if not proof:
+        return result
+    return result, [_proof_tree(key, rules, proven, literals) for key in keys if key in proven]
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Horn inference and SAT solving over DIMACS files")
+    arg_parser.add_argument("file", nargs="?", default="tc1.cnf")
+    arg_parser.add_argument("--goal", action="append", help="goal literal for SLD resolution, e.g. 4 or -4 (repeatable)")
+    arg_parser.add_argument("--sat", action="store_true", help="decide satisfiability with the CDCL solver")
+    arg_parser.add_argument("--preprocess", action="store_true", help="simplify the CNF before solving (with --sat)")
+    arg_parser.add_argument("--engine", choices=("auto", "cdcl"), default="auto",
+                            help="auto: linear-time Horn/2-SAT procedures when the CNF is in their fragment (with --sat)")
+    arg_parser.add_argument("--portfolio", type=int, metavar="N",
+                            help="race N differently configured CDCL workers that share short learnt clauses (with --sat)")
+    arg_parser.add_argument("--cube", type=int, metavar="N",
+                            help="cube and conquer: split the CNF by lookahead and solve the cubes on N workers (with --sat)")
+    arg_parser.add_argument("--proof", metavar="FILE", help="write a DRAT/LRAT proof when UNSAT (with --sat)")
+    arg_parser.add_argument("--proof-format", choices=("drat", "drat-binary", "lrat"), default="drat")
+    arg_parser.add_argument("--cache", nargs="?", const="", metavar="DIR",
+                            help="load the parsed KB from an on-disk cache (default dir: ~/.cache/krr-kb)")
+    arg_parser.add_argument("--stats", action="store_true", help="print counters, phase times and peak sizes to stderr")
+    arg_parser.add_argument("--progress", type=float, metavar="SECONDS", help="print a progress line every SECONDS")
+    arg_parser.add_argument("--verbose", action="store_true", help="print the knowledge base before solving")
+    arg_parser.add_argument("--timeout", type=float, metavar="SECONDS", help="answer UNKNOWN after SECONDS")
+    arg_parser.add_argument("--max-steps", type=int, metavar="N", help="answer UNKNOWN after N propagations or subgoals")
+    arg_parser.add_argument("--max-conflicts", type=int, metavar="N", help="answer UNKNOWN after N conflicts (with --sat)")
+    arg_parser.add_argument("--max-live", type=int, metavar="N", help="answer UNKNOWN when holding more than N clauses")
+    args = arg_parser.parse_args()
+    if args.proof and args.preprocess:
+        arg_parser.error("--proof refers to the input clauses and cannot be combined with --preprocess")
+    if args.proof and args.portfolio:
+        arg_parser.error("--proof cannot be combined with --portfolio: shared clauses have no proof")
+    if args.proof and args.cube:
+        arg_parser.error("--proof cannot be combined with --cube: every cube is refuted by a different worker")
+    if args.portfolio and args.cube:
+        arg_parser.error("--portfolio and --cube are alternative ways to use several cores")
+
+    stats = Stats(progress=args.progress) if args.stats or args.progress else None
+    budget = Budget(args.timeout, args.max_steps, args.max_conflicts, args.max_live)
+
+    def interrupt(signum, frame):
+        # The first Ctrl-C stops the engine at its next check with UNKNOWN
+        # and the statistics so far, a second one interrupts for real
+        budget.cancel()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, interrupt)
+
+    if args.sat:
+        db = parse_db(args.file, stats=stats) if args.cache is None else load_db(args.file, args.cache or None, stats=stats)
+        simplified = None
+        if args.preprocess:
+            try:
+                simplified = preprocess(db, stats=stats, budget=budget)
+            except BudgetExceeded as exceeded:
+                simplified = exceeded.partial  # simplified less, still sound; the solver checks the budget again
+        proof = proof_writer(args.proof, args.proof_format) if args.proof else None
+        if args.cube:
+            result = cube.solve(simplified.db if simplified else db, args.cube, stats=stats, budget=budget)
+        elif args.portfolio:
+            result = portfolio.solve(simplified.db if simplified else db, args.portfolio, stats=stats, budget=budget)
+        elif args.engine == "cdcl":
+            result = cdcl.solve(simplified.db if simplified else db, budget, stats=stats, proof=proof)
+        else:
+            result = fragments.solve(simplified.db if simplified else db, stats=stats, budget=budget, proof=proof)
+        if proof is not None:
+            proof.close()
+        print("Result:", result.status)  # Output: "SAT", "UNSAT" or "UNKNOWN"
+        if result.exhausted:
+            print("Budget exhausted:", result.exhausted)
+        if args.portfolio and result.reason:
+            print("Winner:", result.reason)
+        if args.cube and result.reason:
+            print("Cubes:", result.reason)
+        if args.verbose:
+            print("Route:", result.route + (f" ({result.reason})" if result.reason else ""))
+        if result.model is not None:
+            model = simplified.extend(result.model) if simplified else result.model
+            print("Model:", " ".join(("-" if lit < 0 else "") + db.symbols.name(lit) for lit in model))
+        if args.stats:
+            print(stats, file=sys.stderr)
+        raise SystemExit
+
+    # Rules are compiled straight from the clauses, so a warm cache skips
+    # parsing altogether
+    db = parse_db(args.file, stats=stats) if args.cache is None else load_db(args.file, args.cache or None, stats=stats)
+
+    goals = [Not(Symbol(goal[1:])) if goal.startswith("-") else Symbol(goal) for goal in args.goal or ["4"]]
+
+    if args.verbose:
+        for k in db.to_exprs():
+            print(k)
+    # Perform SLD resolution
+    result = sld_resolution(db, goals, stats=stats, budget=budget)
+    print("Result:", result)  # Output: "YES", "NO" or "UNKNOWN"
+    if budget.exhausted:
+        print("Budget exhausted:", budget.exhausted)
+    if args.stats:
+        print(stats, file=sys.stderr)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+import random
+
+from budget import Budget
+from generators import chain
+from hadeh import And, Implies, Not, Symbol
+from main import sld_resolution
+
+p = [Symbol(f"p{i}") for i in range(40)]
+
+
+def _dense_cycles(seed: int, facts: list) -> list:
+    # Every symbol is the head of several rules whose bodies use other
+    # symbols, so any failed subgoal is reachable along exponentially many
+    # paths
+    rng = random.Random(seed)
+    knowledge_base = list(facts)
+    for head in p:
+        for _ in range(4):
+            knowledge_base.append(Implies(And(*rng.sample(p, 2)), head))
+    return knowledge_base
+
+
+def test_cyclic_kb_without_answers_is_linear():
+    # The depth-first prover re-explored failures that depended on an open
+    # ancestor along every path; tabling them keeps the work to one visit
+    # and one propagation per subgoal
+    for seed in range(10):
+        assert sld_resolution(_dense_cycles(seed, []), [p[0]], budget=Budget(steps=2 * len(p))) == "NO"
+
+
+def test_cyclic_kb_with_answers():
+    knowledge_base = _dense_cycles(0, []) + [Implies(p[1], p[0]), p[1]]
+    result, proofs = sld_resolution(knowledge_base, [p[0]], proof=True)
+    assert result == "YES"
+    assert proofs[0].goal == p[0] and proofs[0].premises[0].goal == p[1]
+
+
+def test_loop_through_an_ancestor():
+    # q fails through p while p is still open, but q is proven through r
+    q, r = Symbol("q"), Symbol("r")
+    assert sld_resolution([Implies(q, p[0]), Implies(p[0], q), Implies(r, q), r], [p[0]]) == "YES"
+    assert sld_resolution([Implies(q, p[0]), Implies(p[0], q), Implies(r, q)], [p[0]]) == "NO"
+
+
+def test_negative_goals_and_conjunctions():
+    knowledge_base = [Implies(p[0], Not(p[1])), p[0]]
+    assert sld_resolution(knowledge_base, [Not(p[1])]) == "YES"
+    assert sld_resolution(knowledge_base, [And(p[0], Not(p[1]))]) == "YES"
+    assert sld_resolution(knowledge_base, [p[1]]) == "NO"
+
+
+def test_long_chain_does_not_recurse():
+    assert sld_resolution(chain(100000), [Symbol("p100000")]) == "YES"
@@ -1,114 +1,212 @@
-from __future__ import annotations
-from dataclasses import dataclass
-from typing import Union
-
-@dataclass
-class Symbol:
-    name: str
-
-    def __hash__(self):
-        return hash(self.name)
-
-    def __eq__(self, other: Symbol) -> bool:
-        if not isinstance(other, Symbol):
-            return False
-        return self.name == other.name
-
-    def __or__(self, other: Symbol) -> Or:
-        return Or(self, other)
-
-    def __and__(self, other: Symbol) -> And:
-        return And(self, other)
-
-    def __invert__(self) -> Not:
-        return Not(self)
-
-    def __rshift__(self, other: Symbol) -> Implies:
-        return Implies(self, other)
-
-    def __lshift__(self, other: Symbol) -> Implies:
-        return Implies(other, self)
-
-    def to_cnf(self):
-        return self
-
-@dataclass
-class And:
-    op1: Union[Symbol, Or, And, Not, Implies]
-    op2: Union[Symbol, Or, And, Not, Implies]
-
-    def __eq__(self, other: And) -> bool:
-        if not isinstance(other, And):
-            return False
-        return (
-            (self.op1 == other.op1 and self.op2 == other.op2)
-            or (self.op1 == other.op2 and self.op2 == other.op1)
-        ) # because AND is commutative
-
-    def __hash__(self):
-        return hash((self.op1, self.op2))
-
-    def to_cnf(self):
-        return And(self.op1.to_cnf(), self.op2.to_cnf())
-
-@dataclass
-class Or:
-    op1: Union[Symbol, Or, And, Not, Implies]
-    op2: Union[Symbol, Or, And, Not, Implies]
-
-    def __eq__(self, other: Or) -> bool:
-        if not isinstance(other, Or):
-            return False
-        return (
-            (self.op1 == other.op1 and self.op2 == other.op2)
-            or (self.op1 == other.op2 and self.op2 == other.op1)
-        ) # because OR is commutative
-
-    def __hash__(self):
-        return hash((self.op1, self.op2))
-
-    def to_cnf(self):
-        if isinstance(self.op1, And):
-            return And(Or(self.op1.op1, self.op2), Or(self.op1.op2, self.op2)).to_cnf()
-        elif isinstance(self.op2, And):
-            return And(Or(self.op1, self.op2.op1), Or(self.op1, self.op2.op2)).to_cnf()
-        else:
-            return Or(self.op1.to_cnf(), self.op2.to_cnf())
-
-@dataclass
-class Not:
-    symbol: Union[Symbol, Or, And, Not, Implies]
-
-    def __eq__(self, other: Not) -> bool:
-        if not isinstance(other, Not):
-            return False
-        return self.symbol == other.symbol
-
-    def __hash__(self):
-        return hash(self.symbol)
-
-    def to_cnf(self):
-        if isinstance(self.symbol, Not):
-            return self.symbol.symbol.to_cnf()
-        elif isinstance(self.symbol, And):
-            return Or(Not(self.symbol.op1), Not(self.symbol.op2)).to_cnf()
-        elif isinstance(self.symbol, Or):
-            return And(Not(self.symbol.op1).to_cnf(), Not(self.symbol.op2).to_cnf())
-        else:
-            return Not(self.symbol)
-
-@dataclass
-class Implies:
-    premise: Union[Symbol, Or, And, Not, Implies]
-    conclusion: Union[Symbol, Or, And, Not, Implies]
-
-    def __eq__(self, other: Implies) -> bool:
-        if not isinstance(other, Implies):
-            return False
-        return self.premise == other.premise and self.conclusion == other.conclusion
-
-    def __hash__(self):
-        return hash((self.premise, self.conclusion))
-
-    def to_cnf(self):
-        return Or(Not(self.premise), self.conclusion).to_cnf()
\ No newline at end of file
+from __future__ import annotations
+from dataclasses import dataclass, fields
+from typing import Union
+
+from traversal import fold, render, results, trampoline
+
+
+def _cnf_step(expr):
+    # The _to_cnf generators yield what they need converted, so deep
+    # binary chains don't recurse (see traversal.trampoline)
+    if isinstance(expr, Symbol):
+        return expr
+    return (yield from expr._to_cnf())
+
+# The dataclasses below nest one level per binary connective, so a parsed
+# clause is a chain as deep as it is long: printing, hashing and comparing
+# go through the explicit-stack traversals instead of recursing.
+
+def _children(node) -> tuple:
+    if isinstance(node, (And, Or)):
+        return node.op1, node.op2
+    if isinstance(node, Not):
+        return (node.symbol,)
+    if isinstance(node, Implies):
+        return node.premise, node.conclusion
+    return ()
+
+def _hash(node) -> int:
+    def combine(node, kids):
+        if isinstance(node, Symbol):
+            return hash(node.name)
+        if isinstance(node, (And, Or)):
+            kids.sort()  # commutative, like __eq__
+        return hash((type(node).__name__, *kids)) if kids else hash(node)
+    return fold(node, _children, combine)
+
+def _equal(a, b) -> bool:
+    # Numbers every distinct structure in both formulas, And and Or with
+    # their operands in either order; equal formulas get the same number
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+    table = {}
+    def combine(node, kids):
+        if isinstance(node, Symbol):
+            key = Symbol, node.name
+        elif isinstance(node, (And, Or)):
+            key = type(node), *sorted(kids)
+        else:
+            key = (type(node), *kids) if kids else (type(node), node)
+        return table.setdefault(key, len(table))
+    memo = {}
+    return fold(a, _children, combine, memo) == fold(b, _children, combine, memo)
+
+def _repr_parts(node):
+    if not isinstance(node, (And, Or, Not, Implies)):
+        return (repr(node),)
+    parts = [type(node).__name__, "("]
+    for i, field in enumerate(fields(node)):
+        parts += [f"{', ' if i else ''}{field.name}=", getattr(node, field.name)]
+    parts.append(")")
+    return parts
+
+def _str_parts(node):
+    if isinstance(node, Symbol):
+        return (node.name,)
+    if isinstance(node, And):
+        return ("(", node.op1, " ∧ ", node.op2, ")")
+    if isinstance(node, Or):
+        return ("(", node.op1, " ∨ ", node.op2, ")")
+    if isinstance(node, Not):
+        return ("¬", node.symbol) if isinstance(node.symbol, Symbol) else ("¬(", node.symbol, ")")
+    if isinstance(node, Implies):
+        return ("(", node.premise, " ⊃ ", node.conclusion, ")")
+    return (str(node),)
+
+@dataclass
+class Symbol:
+    name: str
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __eq__(self, other: Symbol) -> bool:
+        if not isinstance(other, Symbol):
+            return False
+        return self.name == other.name
+
+    def __or__(self, other: Symbol) -> Or:
+        return Or(self, other)
+
+    def __and__(self, other: Symbol) -> And:
+        return And(self, other)
+
+    def __invert__(self) -> Not:
+        return Not(self)
+
+    def __rshift__(self, other: Symbol) -> Implies:
+        return Implies(self, other)
+
+    def __lshift__(self, other: Symbol) -> Implies:
+        return Implies(other, self)
+
+    def __str__(self):
+        return self.name
+
+    def to_cnf(self):
+        return self
+
+@dataclass
+class And:
+    op1: Union[Symbol, Or, And, Not, Implies]
+    op2: Union[Symbol, Or, And, Not, Implies]
+
+    def __eq__(self, other: And) -> bool:
+        return _equal(self, other)  # And is commutative
+
+    def __hash__(self):
+        return _hash(self)
+
+    def __repr__(self):
+        return render(self, _repr_parts)
+
+    def __str__(self):
+        return render(self, _str_parts)
+
+    def to_cnf(self):
+        return trampoline(self, _cnf_step)
+
+    def _to_cnf(self):
+        return And(*(yield from results((self.op1, self.op2))))
+
+@dataclass
+class Or:
+    op1: Union[Symbol, Or, And, Not, Implies]
+    op2: Union[Symbol, Or, And, Not, Implies]
+
+    def __eq__(self, other: Or) -> bool:
+        return _equal(self, other)  # Or is commutative
+
+    def __hash__(self):
+        return _hash(self)
+
+    def __repr__(self):
+        return render(self, _repr_parts)
+
+    def __str__(self):
+        return render(self, _str_parts)
+
+    def to_cnf(self):
+        return trampoline(self, _cnf_step)
+
+    def _to_cnf(self):
+        if isinstance(self.op1, And):
+            return (yield And(Or(self.op1.op1, self.op2), Or(self.op1.op2, self.op2)))
+        elif isinstance(self.op2, And):
+            return (yield And(Or(self.op1, self.op2.op1), Or(self.op1, self.op2.op2)))
+        else:
+            return Or(*(yield from results((self.op1, self.op2))))
+
+@dataclass
+class Not:
+    symbol: Union[Symbol, Or, And, Not, Implies]
+
+    def __eq__(self, other: Not) -> bool:
+        return _equal(self, other)
+
+    def __hash__(self):
+        return _hash(self)
+
+    def __repr__(self):
+        return render(self, _repr_parts)
+
+    def __str__(self):
+        return render(self, _str_parts)
+
+    def to_cnf(self):
+        return trampoline(self, _cnf_step)
+
+    def _to_cnf(self):
+        if isinstance(self.symbol, Not):
+            return (yield self.symbol.symbol)
+        elif isinstance(self.symbol, And):
+            return (yield Or(Not(self.symbol.op1), Not(self.symbol.op2)))
+        elif isinstance(self.symbol, Or):
+            return And(*(yield from results((Not(self.symbol.op1), Not(self.symbol.op2)))))
+        else:
+            return Not(self.symbol)
+
+@dataclass
+class Implies:
+    premise: Union[Symbol, Or, And, Not, Implies]
+    conclusion: Union[Symbol, Or, And, Not, Implies]
+
+    def __eq__(self, other: Implies) -> bool:
+        return _equal(self, other)
+
+    def __hash__(self):
+        return _hash(self)
+
+    def __repr__(self):
+        return render(self, _repr_parts)
+
+    def __str__(self):
+        return render(self, _str_parts)
+
+    def to_cnf(self):
+        return trampoline(self, _cnf_step)
+
+    def _to_cnf(self):
+        return (yield Or(Not(self.premise), self.conclusion))
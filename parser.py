@@ -1,39 +1,217 @@
+import bz2
+import gzip
+import lzma
+import mmap
+import os
+import shutil
+import tempfile
+from typing import Iterable, Iterator, TextIO
+
 from hadeh import Symbol, Or, Not
+from clausedb import ClauseDB, SymbolTable
+from stats import Stats
 
-def build_disjunction(op1: Symbol, op2: set[Symbol] | Symbol) -> Or:
+def build_disjunction(literals: list[Symbol | Not]) -> Or | Symbol | Not:
 
-    if op2 == set():
-        return op1
+    if not literals:
+        raise ValueError("an empty clause has no disjunction: it is just false")
 
-    if isinstance(op2, set):
-        return Or(op1, build_disjunction(op2.pop(), op2))
+    if len(literals) == 1:
+        return literals[0]
 
-    return Or(op1, op2)
+    return Or(*literals)
 
 
-def parse(file_name: str) -> tuple[set, set]:
-    knowledge_base = set()
-    all_symbols = set()
+class DimacsError(ValueError):
+    pass
+
+
+_OPENERS = {".gz": gzip.open, ".xz": lzma.open, ".lzma": lzma.open, ".bz2": bz2.open}
+
+
+def _lines(file_name: str) -> Iterator[bytes]:
+    opener = _OPENERS.get(os.path.splitext(file_name)[1].lower())
+    if opener is not None:
+        # Decompressed in buffered chunks, never as a whole
+        with opener(file_name, "rb") as file:
+            yield from file
+        return
+
+    with open(file_name, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from iter(data.readline, b"")
+
 
-    with open(file_name, "r") as file:
-        lines = file.readlines()
+class DimacsReader:
+    def __init__(self, file_name: str, strict: bool = True):
+        self.file_name = file_name
+        self.strict = strict
+        self.num_vars = None
+        self.num_clauses = None
+        self.max_var = 0
+        self.clauses_seen = 0
 
-        for line in lines:
-            if line.startswith("c") or line.startswith("p"):
+    def _header(self, line: bytes):
+        fields = line.split()
+        if self.num_vars is not None or len(fields) != 4 or fields[1] != b"cnf":
+            raise DimacsError(f"{self.file_name}: bad problem line {line.strip()!r}")
+        self.num_vars, self.num_clauses = int(fields[2]), int(fields[3])
+
+    def _check(self):
+        if not self.strict:
+            return
+        if self.num_vars is None:
+            raise DimacsError(f"{self.file_name}: missing 'p cnf' header")
+        if self.clauses_seen != self.num_clauses:
+            raise DimacsError(f"{self.file_name}: header declares {self.num_clauses} clauses, found {self.clauses_seen}")
+        if self.max_var > self.num_vars:
+            raise DimacsError(f"{self.file_name}: variable {self.max_var} exceeds declared {self.num_vars}")
+
+    def __iter__(self) -> Iterator[list[int]]:
+        # Clauses are 0-terminated and may span lines
+        clause = []
+        for line in _lines(self.file_name):
+            first = line.lstrip()[:1]
+            if not first or first == b"c":
                 continue
+            if first == b"p":
+                self._header(line)
+                continue
+            if first == b"%":
+                break  # SATLIB end marker
+
+            for token in line.split():
+                try:
+                    lit = int(token)
+                except ValueError:
+                    raise DimacsError(f"{self.file_name}: bad literal {token!r}") from None
+                if lit == 0:
+                    self.clauses_seen += 1
+                    yield clause
+                    clause = []
+                else:
+                    clause.append(lit)
+                    if abs(lit) > self.max_var:
+                        self.max_var = abs(lit)
+
+        if clause:
+            self.clauses_seen += 1
+            yield clause
+        self._check()
+
+
+class DimacsWriter:
+    # Clause sink that streams DIMACS as clauses arrive. The header counts are
+    # only known at the end, so on seekable streams a fixed-width header is
+    # reserved up front and filled in by close(). A pipe cannot go back to
+    # its header: clauses wait in a spool file, in memory until it grows
+    # past spool_size, and close() writes the header and then them.
+    _HEADER_WIDTH = 48
+
+    def __init__(self, stream: TextIO, symbols: SymbolTable | None = None, spool_size: int = 1 << 24):
+        self.stream = stream
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.num_clauses = 0
+        self._header_at = None
+        self._spool = None
+        if stream.seekable():
+            self._header_at = stream.tell()
+            stream.write(" " * (self._HEADER_WIDTH - 1) + "\n")
+        else:
+            self._spool = tempfile.SpooledTemporaryFile(spool_size, "w+")
+        self._out = stream if self._spool is None else self._spool
 
-            symbols = line.strip().split()[:-1]
+    def add_clause(self, lits: Iterable[int]) -> int:
+        self._out.write(" ".join(map(str, lits)) + " 0\n")
+        self.num_clauses += 1
+        return self.num_clauses - 1
+
+    def close(self):
+        header = f"p cnf {len(self.symbols)} {self.num_clauses}"
+        if self._header_at is not None:
+            end = self.stream.tell()
+            self.stream.seek(self._header_at)
+            self.stream.write(header.ljust(self._HEADER_WIDTH - 1))
+            self.stream.seek(end)
+            self._header_at = None
+        elif self._spool is not None:
+            self.stream.write(header + "\n")
+            self._spool.seek(0)
+            shutil.copyfileobj(self._spool, self.stream)
+            self._spool.close()
+            self._spool = None
+            self._out = self.stream
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_dimacs(db: ClauseDB, stream: TextIO):
+    stream.write(f"p cnf {db.num_vars} {len(db)}\n")
+    for clause in db:
+        stream.write(" ".join(map(str, clause)) + " 0\n")
+
+
+def parse_db(file_name: str, strict: bool = True, stats: Stats | None = None) -> ClauseDB:
+    if stats is not None:
+        with stats.phase("parse"):
+            db = _parse_db(file_name, strict, stats)
+        stats.add("clauses", len(db))
+        stats.add("literals", len(db.lits))
+        stats.peak("variables", db.num_vars)
+        return db
+    return _parse_db(file_name, strict)
+
+
+def _parse_db(file_name: str, strict: bool, stats: Stats | None = None) -> ClauseDB:
+    db = ClauseDB()
+    symbols = db.symbols
+    reader = DimacsReader(file_name, strict)
+    next_tick = Stats.interval if stats is not None else float("inf")
+
+    for clause in reader:
+        # Keep variable k at index k so models and proofs use DIMACS numbering
+        while len(symbols) < reader.max_var:
+            symbols.var(str(len(symbols) + 1))
+        db.add_clause(dict.fromkeys(clause))
+        if reader.clauses_seen >= next_tick:
+            stats.tick("parse", clauses=reader.clauses_seen, variables=reader.max_var)
+            next_tick += Stats.interval
+
+    while len(symbols) < (reader.num_vars or 0):
+        symbols.var(str(len(symbols) + 1))
+
+    return db
+
+
+def parse(file_name: str, stats: Stats | None = None, cache_dir: str | None = None) -> tuple[set, set]:
+    if cache_dir is None:
+        db = parse_db(file_name, stats=stats)
+    else:
+        from kbcache import load_db
+        db = load_db(file_name, cache_dir or None, stats=stats)
+    knowledge_base = set()
+    names = db.symbols.names
+    literals = {}  # each literal's expression, interned once rather than once per occurrence
+    lits, offsets = db.lits.tolist(), db.offsets.tolist()
 
-            symbols = set(
-                [
-                    Not(Symbol(symbol.removeprefix("-")))
-                    if symbol.startswith("-")
-                    else Symbol(symbol)
-                    for symbol in symbols
-                ]
-            )
+    for i, (start, end) in enumerate(zip(offsets, offsets[1:])):
+        if start == end:
+            raise DimacsError(f"{file_name}: clause {i + 1} is empty, which makes the knowledge base "
+                              f"unsatisfiable; parse_db keeps it for the SAT solver")
+        symbols = []
+        for lit in lits[start:end]:
+            symbol = literals.get(lit)
+            if symbol is None:
+                symbol = literals[lit] = Not(Symbol(names[-lit])) if lit < 0 else Symbol(names[lit])
+            symbols.append(symbol)
 
-            all_symbols |= symbols
-            knowledge_base.add(build_disjunction(symbols.pop(), symbols))
+        knowledge_base.add(build_disjunction(symbols))
 
-    return knowledge_base, all_symbols
+    return knowledge_base, set(literals.values())
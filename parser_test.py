@@ -0,0 +1,106 @@
+from __future__ import annotations
+import bz2
+import gzip
+import io
+import lzma
+
+import pytest
+
+from hadeh import Not, Or, Symbol
+from parser import DimacsError, DimacsReader, DimacsWriter, parse, parse_db
+
+SAMPLE = b"""c a comment
+c another one
+p cnf 4 3
+1 -2
+  3 0
+-4 0 2
+ 4 0
+%
+0
+this is not DIMACS
+"""
+
+
+def _write(tmp_path, name: str, data: bytes, opener=open) -> str:
+    path = str(tmp_path / name)
+    with opener(path, "wb") as file:
+        file.write(data)
+    return path
+
+
+def test_clauses_span_lines_and_stop_at_percent(tmp_path):
+    assert list(DimacsReader(_write(tmp_path, "sample.cnf", SAMPLE))) == [[1, -2, 3], [-4], [2, 4]]
+
+
+@pytest.mark.parametrize("suffix, opener", [(".gz", gzip.open), (".xz", lzma.open), (".bz2", bz2.open)])
+def test_compressed_input(tmp_path, suffix, opener):
+    db = parse_db(_write(tmp_path, "sample.cnf" + suffix, SAMPLE, opener))
+    assert [clause.tolist() for clause in db] == [[1, -2, 3], [-4], [2, 4]]
+    assert db.num_vars == 4
+
+
+def test_variables_keep_their_dimacs_numbers(tmp_path):
+    db = parse_db(_write(tmp_path, "gap.cnf", b"p cnf 6 1\n5 -3 0\n"))
+    assert db.num_vars == 6
+    assert [db.symbols.name(lit) for lit in db.clause(0).tolist()] == ["5", "3"]
+
+
+def test_duplicate_literals_are_dropped(tmp_path):
+    db = parse_db(_write(tmp_path, "dup.cnf", b"p cnf 2 1\n1 2 1 0\n"))
+    assert db.clause(0).tolist() == [1, 2]
+
+
+def test_empty_file(tmp_path):
+    assert len(parse_db(_write(tmp_path, "empty.cnf", b""), strict=False)) == 0
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"1 2 0\n", "missing 'p cnf' header"),
+    (b"p cnf 2 2\n1 2 0\n", "header declares 2 clauses, found 1"),
+    (b"p cnf 2 1\n1 3 0\n", "variable 3 exceeds declared 2"),
+    (b"p cnf 2 1\n1 x 0\n", "bad literal"),
+    (b"p dnf 2 1\n1 0\n", "bad problem line"),
+    (b"p cnf 2 1\np cnf 2 1\n1 0\n", "bad problem line"),
+])
+def test_errors(tmp_path, data, message):
+    with pytest.raises(DimacsError, match=message):
+        parse_db(_write(tmp_path, "bad.cnf", data))
+
+
+def test_not_strict(tmp_path):
+    db = parse_db(_write(tmp_path, "loose.cnf", b"p cnf 2 5\n1 3 0\n-2"), strict=False)
+    assert [clause.tolist() for clause in db] == [[1, 3], [-2]]
+
+
+def test_parse_expressions(tmp_path):
+    knowledge_base, symbols = parse(_write(tmp_path, "sample.cnf", SAMPLE))
+    one, two, three, four = (Symbol(name) for name in "1234")
+    assert knowledge_base == {Or(one, Not(two), three), Not(four), Or(two, four)}
+    assert symbols == {one, Not(two), three, Not(four), two, four}
+
+
+def test_parse_rejects_empty_clauses(tmp_path):
+    path = _write(tmp_path, "empty-clause.cnf", b"p cnf 2 2\n1 2 0\n0\n")
+    with pytest.raises(DimacsError, match="clause 2 is empty"):
+        parse(path)
+    assert [clause.tolist() for clause in parse_db(path)] == [[1, 2], []]
+
+
+class _Pipe(io.StringIO):
+    def seekable(self):
+        return False
+
+
+@pytest.mark.parametrize("stream", [io.StringIO, _Pipe], ids=["file", "pipe"])
+def test_writer_header(tmp_path, stream):
+    out = stream()
+    with DimacsWriter(out) as writer:
+        for name in "abc":
+            writer.symbols.var(name)
+        writer.add_clause([1, -2])
+        writer.add_clause([3])
+    path = _write(tmp_path, "written.cnf", out.getvalue().encode())
+    reader = DimacsReader(path)
+    assert list(reader) == [[1, -2], [3]]
+    assert (reader.num_vars, reader.num_clauses) == (3, 2)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+import multiprocessing
+import queue
+import signal
+from array import array
+from multiprocessing.shared_memory import SharedMemory
+
+from budget import Budget, BudgetExceeded
+from cdcl import SolveResult, Solver
+from clausedb import ClauseDB
+from stats import Stats
+
+# Portfolio solving: N CDCL workers with different seeds, restart policies,
+# decay factors and initial phases race on the same formula in separate
+# processes. Short learnt clauses are shared through a ring buffer in
+# shared memory, and the first SAT or UNSAT answer stops the others
+# through the cancellation token of their budgets. Each worker gets the
+# time left and an even share of the steps and conflicts.
+
+BASE_CONFIGS = [
+    {"restarts": "luby"},
+    {"restarts": "glucose"},
+    {"restarts": "luby", "seed": 1, "initial_phase": True},
+    {"restarts": "glucose", "seed": 2, "initial_phase": True},
+    {"restarts": "luby", "seed": 3, "restart_base": 50, "var_decay": 0.9},
+    {"restarts": "glucose", "seed": 4, "var_decay": 0.99},
+    {"restarts": "luby", "seed": 5, "restart_base": 300, "clause_decay": 0.99},
+    {"restarts": "glucose", "seed": 6, "var_decay": 0.85, "initial_phase": True},
+]
+
+
+def configs(n: int) -> list[dict]:
+    # The base table first, then fresh seeds over the same variations
+    return [{**BASE_CONFIGS[i % len(BASE_CONFIGS)], "seed": i} if i >= len(BASE_CONFIGS) else BASE_CONFIGS[i]
+            for i in range(n)]
+
+
+def describe(config: dict) -> str:
+    return " ".join(f"{name}={value}" for name, value in config.items())
+
+
+class ClauseRing:
+    # Fixed-size slots in shared memory, written round-robin by every
+    # worker: [writer, length, lit_1 .. lit_max_len], after a header with
+    # the number of clauses ever written. A reader remembers how far it has
+    # read; clauses it was lapped on are lost, which is fine for sharing.
+    # Writes happen on conflicts and reads on restarts, so one lock over
+    # the whole buffer is cheap enough.
+    def __init__(self, capacity: int = 4096, max_len: int = 8, lock=None, name: str | None = None,
+                 writer: int = -1):
+        self.capacity = capacity
+        self.max_len = max_len
+        self.slot = max_len + 2
+        size = (1 + capacity * self.slot) * 8
+        self.memory = SharedMemory(name, create=name is None, size=size)
+        self.cells = self.memory.buf.cast("q")
+        if name is None:
+            self.cells[0] = 0
+        self.lock = multiprocessing.Lock() if lock is None else lock
+        self.writer = writer
+        self.position = 0
+
+    def attach(self, writer: int) -> tuple:
+        # Arguments for ClauseRing(*args) in a worker process
+        return self.capacity, self.max_len, self.lock, self.memory.name, writer
+
+    def export(self, lits: list[int]):
+        cells, slot = self.cells, self.slot
+        with self.lock:
+            head = cells[0]
+            base = 1 + (head % self.capacity) * slot
+            cells[base] = self.writer
+            cells[base + 1] = len(lits)
+            cells[base + 2:base + 2 + len(lits)] = memoryview(array("q", lits))
+            cells[0] = head + 1
+
+    def receive(self) -> list[list[int]]:
+        cells, slot = self.cells, self.slot
+        clauses = []
+        with self.lock:
+            head = cells[0]
+            position = max(self.position, head - self.capacity)
+            for i in range(position, head):
+                base = 1 + (i % self.capacity) * slot
+                if cells[base] != self.writer:
+                    clauses.append(cells[base + 2:base + 2 + cells[base + 1]].tolist())
+            self.position = head
+        return clauses
+
+    def close(self, unlink: bool = False):
+        self.cells.release()
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def _worker(index: int, config: dict, db: ClauseDB, ring: tuple | None, limits: dict, stop, results):
+    # Ctrl-C reaches the whole process group; the parent turns it into stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    exchange = ClauseRing(*ring) if ring is not None else None
+    try:
+        result = Solver(db, exchange=exchange, **config).solve(budget=Budget(**limits, token=stop))
+        results.put((index, result.status, result.model, result.stats, result.exhausted))
+    finally:
+        if exchange is not None:
+            exchange.close()
+
+
+def solve(db: ClauseDB, workers: int, stats: Stats | None = None, budget: Budget | None = None,
+          share: int = 8) -> SolveResult:
+    # result.reason names the configuration that answered first; share is
+    # the longest learnt clause passed between workers (0 for none)
+    budget = Budget() if budget is None else budget
+    portfolio = configs(workers)
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    ring = ClauseRing(max_len=share) if share else None
+    limits = budget.split(workers)
+    processes = [multiprocessing.Process(target=_worker, args=(i, config, db, ring and ring.attach(i), limits, stop,
+                                                               results), daemon=True)
+                 for i, config in enumerate(portfolio)]
+    for process in processes:
+        process.start()
+
+    winner = None
+    finished = {}
+    exhausted = None
+    try:
+        while len(finished) < len(processes):
+            try:
+                index, status, model, solver_stats, reason = results.get(timeout=0.05)
+            except queue.Empty:
+                if winner is None and not stop.is_set():
+                    try:
+                        budget.check()
+                    except BudgetExceeded as exceeded:
+                        exhausted = exceeded.reason
+                        stop.set()
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    break  # a worker died without answering
+                continue
+            finished[index] = status, solver_stats
+            if status == "UNKNOWN" and exhausted is None and reason != "cancelled":
+                exhausted = reason  # its share ran out
+            if winner is None and status != "UNKNOWN":
+                winner = SolveResult(status, model, solver_stats)
+                winner.route, winner.reason = "portfolio", f"worker {index}: {describe(portfolio[index])}"
+                stop.set()
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        if ring is not None:
+            ring.close(unlink=True)
+
+    if stats is not None:
+        stats.add("portfolio.workers", len(processes))
+        for _, solver_stats in finished.values():
+            for name, value in solver_stats.items():
+                if name != "learnts":
+                    stats.add(name, value)
+    if winner is not None:
+        return winner
+    return SolveResult("UNKNOWN", route="portfolio", exhausted=exhausted)
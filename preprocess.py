@@ -0,0 +1,339 @@
+from __future__ import annotations
+from collections import defaultdict, deque
+from typing import Iterable
+
+from budget import Budget, BudgetExceeded
+from clausedb import ClauseDB
+from stats import Stats
+
+
+class Preprocessor:
+    # Simplifies a ClauseDB before solving. Clauses are ordered dicts of
+    # literals (O(1) membership, stable order) and every literal has an
+    # occurrence list of the clauses containing it, so each technique only
+    # looks at clauses that share a literal with the one being processed.
+    #
+    # Steps that change the set of models (units, pure literals, variable
+    # elimination) push (witness, clause) pairs on a reconstruction stack;
+    # extend() replays it backwards and makes the witness true wherever its
+    # clause is falsified, which turns a model of the result into a model of
+    # the input.
+    def __init__(
+        self,
+        db: ClauseDB,
+        frozen: Iterable[int] = (),
+        max_occurrences: int = 16,
+        max_resolvent: int = 20,
+        probe_budget: int | None = None,
+        stats: Stats | None = None,
+    ):
+        self.symbols = db.symbols
+        self.frozen = {abs(lit) for lit in frozen}  # must keep their meaning, e.g. assumptions
+        self.max_occurrences = max_occurrences
+        self.max_resolvent = max_resolvent
+        self.probe_budget = probe_budget if probe_budget is not None else 10 * len(db.lits) + 1000
+        self.stats = stats
+
+        self.clauses = []
+        self.occurs = defaultdict(set)
+        self.units = deque()
+        self.fixed = set()
+        self.eliminated = set()
+        self.stack = []
+        self.touched = []
+        self.ok = True
+        self.counts = defaultdict(int)
+        self.budget = None
+        self.steps = 0
+        self.next_check = float("inf")
+
+        for clause in db:
+            self._add(clause)
+
+    # -- clause store -----------------------------------------------------
+
+    def _add(self, lits: Iterable[int]):
+        clause = dict.fromkeys(lits)
+        if any(-lit in clause for lit in clause):
+            self.counts["tautologies"] += 1
+            return
+        if not clause:
+            self.ok = False
+            return
+        i = len(self.clauses)
+        self.clauses.append(clause)
+        for lit in clause:
+            self.occurs[lit].add(i)
+        if len(clause) == 1:
+            self.units.append(next(iter(clause)))
+        self.touched.append(i)
+
+    def _remove(self, i: int):
+        for lit in self.clauses[i]:
+            self.occurs[lit].discard(i)
+        self.clauses[i] = None
+
+    def _strengthen(self, i: int, lit: int):
+        clause = self.clauses[i]
+        del clause[lit]
+        self.occurs[lit].discard(i)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self.units.append(next(iter(clause)))
+        self.touched.append(i)
+
+    # -- techniques -------------------------------------------------------
+
+    def _propagate(self):
+        while self.units and self.ok:
+            lit = self.units.popleft()
+            if -lit in self.fixed:
+                self.ok = False
+                return
+            if lit in self.fixed:
+                continue
+            self.fixed.add(lit)
+            self.stack.append((lit, (lit,)))
+            self.counts["units"] += 1
+            for i in list(self.occurs[lit]):
+                self._remove(i)
+            for i in list(self.occurs[-lit]):
+                self._strengthen(i, -lit)
+
+    def _tick(self):
+        # One step per clause or variable a technique starts on; called only
+        # where the clauses are consistent, so stopping there is safe
+        self.steps += 1
+        if self.steps >= self.next_check:
+            self.next_check = self.budget.check(self.steps)
+
+    def _active(self, var: int) -> bool:
+        return var not in self.frozen and var not in self.eliminated and var not in self.fixed and -var not in self.fixed
+
+    def _pure_literals(self):
+        queue = [var for var in range(1, len(self.symbols) + 1)]
+        while queue:
+            var = queue.pop()
+            if not self._active(var) or (self.occurs[var] and self.occurs[-var]):
+                continue
+            lit = var if self.occurs[var] else -var
+            if not self.occurs[lit]:
+                continue
+            self.eliminated.add(var)
+            self.stack.append((lit, (lit,)))
+            self.counts["pure_literals"] += 1
+            for i in list(self.occurs[lit]):
+                queue.extend(abs(other) for other in self.clauses[i])
+                self._remove(i)
+
+    def _subsume(self):
+        # Backward subsumption and self-subsuming resolution: C removes every
+        # D ⊇ C, and strengthens every D ⊇ C[l := ¬l] by dropping ¬l. Any such
+        # D contains l or ¬l for each l in C, so only the clauses in the
+        # shortest of those occurrence lists are candidates.
+        queue = deque(sorted(set(self.touched), key=lambda i: len(self.clauses[i] or ())))
+        self.touched = []
+        while queue and self.ok:
+            self._tick()
+            i = queue.popleft()
+            clause = self.clauses[i]
+            if clause is None:
+                continue
+            pivot = min(clause, key=lambda lit: len(self.occurs[lit]) + len(self.occurs[-lit]))
+            for j in list(self.occurs[pivot] | self.occurs[-pivot]):
+                other = self.clauses[j]
+                if j == i or other is None or len(other) < len(clause):
+                    continue
+                flipped = None
+                for lit in clause:
+                    if lit in other:
+                        continue
+                    if -lit in other and flipped is None:
+                        flipped = lit
+                        continue
+                    break
+                else:
+                    if flipped is None:
+                        self._remove(j)
+                        self.counts["subsumed"] += 1
+                    else:
+                        self._strengthen(j, -flipped)
+                        self.counts["strengthened"] += 1
+            queue.extend(self.touched)
+            self.touched = []
+            self._propagate()
+
+    def _resolvents(self, var: int) -> list[list[int]] | None:
+        positive, negative = self.occurs[var], self.occurs[-var]
+        resolvents = []
+        for i in positive:
+            for j in negative:
+                resolvent = dict.fromkeys(self.clauses[i])
+                del resolvent[var]
+                tautology = False
+                for lit in self.clauses[j]:
+                    if lit == -var:
+                        continue
+                    if -lit in resolvent:
+                        tautology = True
+                        break
+                    resolvent[lit] = None
+                if tautology:
+                    continue
+                if len(resolvent) > self.max_resolvent or len(resolvents) == len(positive) + len(negative):
+                    return None  # the formula would grow
+                resolvents.append(list(resolvent))
+        return resolvents
+
+    def _eliminate(self) -> bool:
+        # Bounded variable elimination: replace the clauses of x by all their
+        # non-tautological resolvents on x whenever that does not add clauses.
+        order = sorted(
+            (var for var in range(1, len(self.symbols) + 1) if self._active(var)),
+            key=lambda var: len(self.occurs[var]) * len(self.occurs[-var]),
+        )
+        changed = False
+        for var in order:
+            if not self.ok:
+                break
+            self._tick()
+            if not self._active(var):
+                continue
+            positive, negative = self.occurs[var], self.occurs[-var]
+            if not positive and not negative:
+                continue
+            if len(positive) > self.max_occurrences and len(negative) > self.max_occurrences:
+                continue
+            resolvents = self._resolvents(var)
+            if resolvents is None:
+                continue
+            # Reconstruction: x = false satisfies the negative clauses, and if
+            # a positive clause is falsified, x = true cannot falsify a negative
+            # one because their resolvent holds.
+            for i in list(positive):
+                self.stack.append((var, tuple(self.clauses[i])))
+                self._remove(i)
+            self.stack.append((-var, (-var,)))
+            for i in list(negative):
+                self._remove(i)
+            self.eliminated.add(var)
+            self.counts["eliminated"] += 1
+            changed = True
+            for resolvent in resolvents:
+                self._add(resolvent)
+            self._propagate()
+        return changed
+
+    def _fails(self, lit: int, budget: list[int]) -> bool:
+        # Unit propagation from lit over the current clauses
+        assigned = {lit}
+        queue = deque([lit])
+        while queue:
+            for i in self.occurs[-queue.popleft()]:
+                budget[0] -= 1
+                unassigned = None
+                for other in self.clauses[i]:
+                    if other in assigned:
+                        break
+                    if -other in assigned:
+                        continue
+                    if unassigned is not None:
+                        break
+                    unassigned = other
+                else:
+                    if unassigned is None:
+                        return True
+                    assigned.add(unassigned)
+                    queue.append(unassigned)
+        return False
+
+    def _probe(self):
+        # Failed-literal probing: if assuming l propagates to a conflict,
+        # ¬l holds. Probes roots of the binary implication graph first.
+        budget = [self.probe_budget]
+        binary = defaultdict(int)
+        for clause in self.clauses:
+            if clause is not None and len(clause) == 2:
+                for lit in clause:
+                    binary[-lit] += 1
+        for lit in sorted(binary, key=lambda lit: -binary[lit]):
+            if budget[0] <= 0 or not self.ok:
+                break
+            self._tick()
+            if abs(lit) in self.eliminated or lit in self.fixed or -lit in self.fixed:
+                continue
+            if self._fails(lit, budget):
+                self.counts["failed_literals"] += 1
+                self.units.append(-lit)
+                self._propagate()
+
+    # -- driver -----------------------------------------------------------
+
+    def run(self, rounds: int = 3, budget: Budget | None = None) -> Preprocessor:
+        # When the budget runs out, BudgetExceeded.partial is this
+        # preprocessor as far as it got: db and extend() are as valid as
+        # after a full run, the formula is just simplified less
+        self.budget = budget
+        self.next_check = float("inf") if budget is None else budget.check(self.steps)
+        try:
+            if self.stats is None:
+                return self._run(rounds)
+            with self.stats.phase("preprocess"):
+                self._run(rounds)
+        except BudgetExceeded as exceeded:
+            exceeded.partial = self
+            raise
+        finally:
+            self.budget = None
+            self.next_check = float("inf")
+            if self.stats is not None:
+                for name, count in self.counts.items():
+                    self.stats.add(name, count)
+        return self
+
+    def _run(self, rounds: int) -> Preprocessor:
+        self._propagate()
+        for _ in range(rounds):
+            if not self.ok:
+                break
+            self._subsume()
+            self._pure_literals()
+            changed = self._eliminate()
+            self._subsume()
+            fixed = len(self.fixed)
+            self._probe()
+            if not changed and len(self.fixed) == fixed:
+                break
+        return self
+
+    @property
+    def db(self) -> ClauseDB:
+        # Same symbol table, so variable numbers and names are unchanged
+        db = ClauseDB(self.symbols)
+        if not self.ok:
+            db.add_clause([])
+            return db
+        for clause in self.clauses:
+            if clause is not None:
+                db.add_clause(clause)
+        # Fixed frozen variables keep their unit, or assuming the opposite
+        # value would no longer conflict
+        for lit in self.fixed:
+            if abs(lit) in self.frozen:
+                db.add_clause([lit])
+        return db
+
+    def extend(self, model: Iterable[int]) -> list[int]:
+        # Model of the simplified formula -> model of the original one
+        value = [False] * (len(self.symbols) + 1)
+        for lit in model:
+            value[abs(lit)] = lit > 0
+        for witness, clause in reversed(self.stack):
+            if not any(value[abs(lit)] == (lit > 0) for lit in clause):
+                value[abs(witness)] = witness > 0
+        return [var if value[var] else -var for var in range(1, len(self.symbols) + 1)]
+
+
+def preprocess(db: ClauseDB, rounds: int = 3, budget: Budget | None = None, **options) -> Preprocessor:
+    return Preprocessor(db, **options).run(rounds, budget)
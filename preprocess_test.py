@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import pytest
+
+import cdcl
+from budget import Budget, BudgetExceeded
+from cdcl_test import INSTANCES, _brute_force, _satisfies
+from clausedb import ClauseDB
+from generators import flat_coloring
+from preprocess import Preprocessor, preprocess
+
+
+@pytest.mark.parametrize("db", INSTANCES)
+def test_extend_gives_a_model_of_the_input(db):
+    preprocessor = preprocess(db)
+    result = cdcl.solve(preprocessor.db)
+    assert result.status == ("SAT" if _brute_force(db) else "UNSAT")
+    if result.status == "SAT":
+        assert _satisfies(db, preprocessor.extend(result.model))
+
+
+@pytest.mark.parametrize("db", INSTANCES[:30])
+def test_frozen_variables_keep_their_meaning(db):
+    # Assumptions on frozen variables answer the same before and after
+    assumptions = [1, -2]
+    preprocessor = preprocess(db, frozen=assumptions)
+    before, after = cdcl.Solver(db).solve(assumptions), cdcl.Solver(preprocessor.db).solve(assumptions)
+    assert before.status == after.status
+    if after.status == "SAT":
+        assert _satisfies(db, preprocessor.extend(after.model))
+
+
+def test_simplifies():
+    db = ClauseDB()
+    for name in "abcd":
+        db.symbols.var(name)
+    for clause in [[1, 2], [1, 2, 3], [-1, 2], [3, -3, 4], [-2, 3, 4]]:
+        db.add_clause(clause)
+    preprocessor = preprocess(db)
+    assert len(preprocessor.db) < len(db)
+    assert preprocessor.counts["tautologies"] == 1
+    result = cdcl.solve(preprocessor.db)
+    assert result.status == "SAT" and _satisfies(db, preprocessor.extend(result.model))
+
+
+def test_unsat_by_preprocessing():
+    db = ClauseDB()
+    db.symbols.var("a"), db.symbols.var("b")
+    for clause in [[1, 2], [1, -2], [-1, 2], [-1, -2]]:
+        db.add_clause(clause)
+    assert [clause.tolist() for clause in preprocess(db).db] == [[]]
+
+
+def test_budget_leaves_a_usable_preprocessor():
+    db = flat_coloring(100)
+    with pytest.raises(BudgetExceeded) as exceeded:
+        Preprocessor(db).run(budget=Budget(steps=50))
+    partial = exceeded.value.partial
+    result = cdcl.solve(partial.db)
+    assert result.status == "SAT" and _satisfies(db, partial.extend(result.model))
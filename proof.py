@@ -0,0 +1,122 @@
+from __future__ import annotations
+from typing import BinaryIO, Iterable
+
+# Clausal proofs streamed while the solver runs. Nothing is kept in
+# memory except a small write buffer, so proof size is only bounded by the
+# output file. DRAT is checked with drat-trim, LRAT with lrat-check or
+# cake_lpr:
+#
+#   drat-trim input.cnf proof.drat        (add -f for binary DRAT)
+#   lrat-check input.cnf proof.lrat
+
+BUFFER = 1 << 16
+
+
+class ProofWriter:
+    hints = False  # whether add() needs the antecedent clause ids
+
+    def __init__(self, output: str | BinaryIO):
+        self._owned = isinstance(output, str)
+        self.stream = open(output, "wb") if self._owned else output
+        self.buffer = bytearray()
+        self.last_id = 0
+        self.inputs = 0
+        self.reserved = 0
+
+    def reserve(self, count: int):
+        # The next count input clauses are numbered consecutively, as in the
+        # CNF file the checker reads, and derived clauses come after them
+        self.inputs = self.last_id
+        self.reserved = self.last_id = self.last_id + count
+
+    def original(self) -> int:
+        # Every input clause takes an id, even if the solver drops it
+        if self.inputs < self.reserved:
+            self.inputs += 1
+            return self.inputs
+        self.last_id += 1
+        return self.last_id
+
+    def add(self, lits: Iterable[int], hints: Iterable[int] = ()) -> int:
+        self.last_id += 1
+        self._add(self.last_id, lits, hints)
+        if len(self.buffer) >= BUFFER:
+            self.flush()
+        return self.last_id
+
+    def delete(self, lits: Iterable[int], clause_id: int):
+        self._delete(lits, clause_id)
+        if len(self.buffer) >= BUFFER:
+            self.flush()
+
+    def flush(self):
+        self.stream.write(self.buffer)
+        self.buffer.clear()
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _add(self, clause_id: int, lits: Iterable[int], hints: Iterable[int]):
+        raise NotImplementedError
+
+    def _delete(self, lits: Iterable[int], clause_id: int):
+        raise NotImplementedError
+
+
+class DratWriter(ProofWriter):
+    def __init__(self, output: str | BinaryIO, binary: bool = False):
+        super().__init__(output)
+        self.binary = binary
+
+    def _clause(self, tag: bytes, lits: Iterable[int]):
+        if not self.binary:
+            self.buffer += tag + b"".join(b"%d " % lit for lit in lits) + b"0\n"
+            return
+        # 'a'/'d', then each literal as 2*var + sign in 7-bit little-endian groups
+        self.buffer += b"a" if tag == b"" else b"d"
+        for lit in lits:
+            code = 2 * lit if lit > 0 else -2 * lit + 1
+            while code > 127:
+                self.buffer.append(code & 127 | 128)
+                code >>= 7
+            self.buffer.append(code)
+        self.buffer.append(0)
+
+    def _add(self, clause_id: int, lits: Iterable[int], hints: Iterable[int]):
+        self._clause(b"", lits)
+
+    def _delete(self, lits: Iterable[int], clause_id: int):
+        self._clause(b"d ", lits)
+
+
+class LratWriter(ProofWriter):
+    # <id> <literals> 0 <hint ids> 0, where unit propagation over the hints
+    # in order, starting from the negated clause, must end in a conflict
+    hints = True
+
+    def _add(self, clause_id: int, lits: Iterable[int], hints: Iterable[int]):
+        self.buffer += b"%d " % clause_id
+        self.buffer += b"".join(b"%d " % lit for lit in lits)
+        self.buffer += b"0 " + b"".join(b"%d " % hint for hint in hints) + b"0\n"
+
+    def _delete(self, lits: Iterable[int], clause_id: int):
+        self.buffer += b"%d d %d 0\n" % (self.last_id, clause_id)
+
+
+def proof_writer(output: str | BinaryIO, proof_format: str = "drat") -> ProofWriter:
+    if proof_format == "drat":
+        return DratWriter(output)
+    if proof_format == "drat-binary":
+        return DratWriter(output, binary=True)
+    if proof_format == "lrat":
+        return LratWriter(output)
+    raise ValueError(f"Unknown proof format: {proof_format}")
@@ -0,0 +1,138 @@
+from __future__ import annotations
+import io
+from collections import Counter
+
+import pytest
+
+import cdcl
+from generators import random_kcnf
+from proof import proof_writer
+
+# Small independent checkers: every added DRAT clause must be RUP (unit
+# propagation on its negation over the clauses so far conflicts), and every
+# LRAT clause must reach a conflict by propagating over exactly its hints.
+
+
+def _propagates_to_conflict(clauses, assignment: set) -> bool:
+    changed = True
+    while changed:
+        changed = False
+        for clause in clauses:
+            unassigned = [lit for lit in clause if -lit not in assignment]
+            if any(lit in assignment for lit in unassigned):
+                continue
+            if not unassigned:
+                return True
+            if len(unassigned) == 1:
+                assignment.add(unassigned[0])
+                changed = True
+    return False
+
+
+def _check_drat(db, steps: list[tuple[bool, tuple]]):
+    clauses = Counter(tuple(clause.tolist()) for clause in db)
+    for added, clause in steps:
+        if not added:
+            assert clauses[clause] > 0, f"deleted clause {clause} is not there"
+            clauses[clause] -= 1
+            continue
+        assert _propagates_to_conflict([c for c, n in clauses.items() if n], {-lit for lit in clause}), \
+            f"clause {clause} is not RUP"
+        if not clause:
+            return
+        clauses[clause] += 1
+    pytest.fail("the proof never derives the empty clause")
+
+
+def _drat_text(data: bytes) -> list[tuple[bool, tuple]]:
+    steps = []
+    for line in data.decode().splitlines():
+        fields = line.split()
+        deleted = fields[0] == "d"
+        lits = [int(field) for field in fields[deleted:]]
+        assert lits[-1] == 0
+        steps.append((not deleted, tuple(lits[:-1])))
+    return steps
+
+
+def _drat_binary(data: bytes) -> list[tuple[bool, tuple]]:
+    steps = []
+    i = 0
+    while i < len(data):
+        tag = data[i:i + 1]
+        assert tag in (b"a", b"d")
+        i += 1
+        lits = []
+        while True:
+            code = shift = 0
+            while True:
+                byte = data[i]
+                i += 1
+                code |= (byte & 127) << shift
+                shift += 7
+                if byte < 128:
+                    break
+            if code == 0:
+                break
+            lits.append(code >> 1 if code % 2 == 0 else -(code >> 1))
+        steps.append((tag == b"a", tuple(lits)))
+    return steps
+
+
+def _check_lrat(db, data: bytes):
+    clauses = {i + 1: clause.tolist() for i, clause in enumerate(db)}
+    for line in data.decode().splitlines():
+        fields = [int(field) if field != "d" else field for field in line.split()]
+        if fields[1] == "d":
+            for clause_id in fields[2:-1]:
+                del clauses[clause_id]
+            continue
+        clause_id, rest = fields[0], fields[1:]
+        end = rest.index(0)
+        lits, hints = rest[:end], rest[end + 1:-1]
+        assert clause_id not in clauses
+        assignment = {-lit for lit in lits}
+        for n, hint in enumerate(hints):
+            unassigned = [lit for lit in clauses[hint] if -lit not in assignment]
+            assert not any(lit in assignment for lit in unassigned), f"hint {hint} of {clause_id} is satisfied"
+            if not unassigned:
+                assert n == len(hints) - 1, f"hints of {clause_id} go on after the conflict"
+                break
+            assert len(unassigned) == 1, f"hint {hint} of {clause_id} is not unit"
+            assignment.add(unassigned[0])
+        else:
+            pytest.fail(f"hints of {clause_id} do not end in a conflict")
+        if not lits:
+            return
+        clauses[clause_id] = lits
+    pytest.fail("the proof never derives the empty clause")
+
+
+UNSAT = [db for db in (random_kcnf(40, 5.0, seed=seed) for seed in range(40)) if cdcl.solve(db).status == "UNSAT"][:12]
+
+
+def _proof(db, proof_format: str) -> bytes:
+    output = io.BytesIO()
+    writer = proof_writer(output, proof_format)
+    assert cdcl.solve(db, proof=writer).status == "UNSAT"
+    writer.close()
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("db", UNSAT)
+def test_drat(db):
+    _check_drat(db, _drat_text(_proof(db, "drat")))
+
+
+@pytest.mark.parametrize("db", UNSAT)
+def test_binary_drat(db):
+    _check_drat(db, _drat_binary(_proof(db, "drat-binary")))
+
+
+@pytest.mark.parametrize("db", UNSAT)
+def test_lrat(db):
+    _check_lrat(db, _proof(db, "lrat"))
+
+
+def test_enough_unsat_instances():
+    assert len(UNSAT) >= 10
@@ -0,0 +1,313 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from batch import solve_file
+from budget import Budget, BudgetExceeded
+from clausedb import ClauseDB
+from hadeh import And, Not, Or, Symbol
+from kbcache import load_db
+from main import Closure
+from parser import parse_db
+from session import Session
+from stats import Stats
+
+# Newline-delimited JSON over a Unix or TCP socket. Every request is an
+# object with an "op" and an optional "id" that is echoed in the response:
+#
+#   {"op": "load", "kb": "family", "file": "family.cnf"}
+#   {"op": "query", "kb": "family", "goal": "4"}         Horn closure lookup
+#   {"op": "entails", "kb": "family", "goal": ["4", "-2"]}  CDCL, any KB
+#   {"op": "solve", "kb": "family", "timeout": 10}
+#
+# load, entails and solve take an optional "timeout" in seconds, counted
+# from when the request arrives; entails then answers "UNKNOWN", solve
+# "TIMEOUT" and load fails.
+#   {"op": "unload", "kb": "family"}, {"op": "list"}, {"op": "metrics"}
+#
+# A goal is a literal ("4", "-4"), a list (conjunction) or {"or": [...]}.
+# Queries against the same KB that arrive in the same event-loop turn are
+# answered together: closure lookups in one pass on the loop, entailment
+# and solving in the worker pool.
+
+
+def goal_expr(goal):
+    if isinstance(goal, str):
+        return Not(Symbol(goal[1:])) if goal.startswith("-") else Symbol(goal)
+    if isinstance(goal, list):
+        ops = [goal_expr(g) for g in goal]
+        return ops[0] if len(ops) == 1 else And(*ops)
+    if isinstance(goal, dict) and len(goal) == 1 and ("or" in goal or "and" in goal):
+        connective, operands = next(iter(goal.items()))
+        ops = [goal_expr(g) for g in operands]
+        return ops[0] if len(ops) == 1 else (Or if connective == "or" else And)(*ops)
+    raise ValueError(f"Bad goal: {goal!r}")
+
+
+# Worker side: every pool process keeps the KBs it has answered for, keyed by
+# (name, generation), so only its first request against a KB parses the
+# file and later entailment batches reuse the Session with its learnt
+# clauses. Loading a KB again under the same name gives it a new generation,
+# and the first request for it drops the old entry.
+_worker_kbs = {}
+_worker_cache_dir = None
+
+
+def _start_worker(cache_dir: str | None):
+    global _worker_cache_dir
+    _worker_kbs.clear()
+    _worker_cache_dir = cache_dir
+
+
+def _worker_kb(key: tuple[str, int], file_name: str) -> dict:
+    entry = _worker_kbs.get(key)
+    if entry is None:
+        for stale in [other for other in _worker_kbs if other[0] == key[0]]:
+            del _worker_kbs[stale]
+        cache_dir = _worker_cache_dir
+        db = parse_db(file_name) if cache_dir is None else load_db(file_name, cache_dir or None)
+        entry = _worker_kbs[key] = {"db": db, "session": None}
+    return entry
+
+
+def _entails_all(key: tuple[str, int], file_name: str, goals: list, deadlines: list) -> list[str]:
+    # A deadline is on the time.monotonic() clock, which on the platforms
+    # with fork is system-wide, so it means the same in every process
+    entry = _worker_kb(key, file_name)
+    if entry["session"] is None:
+        # Same clause buffers, own symbol table: atoms that only occur in
+        # goals get variables there, not in the formula the solve op sees
+        db = ClauseDB()
+        db.symbols.names, db.symbols.ids = list(entry["db"].symbols.names), dict(entry["db"].symbols.ids)
+        db.lits, db.offsets = entry["db"].lits, entry["db"].offsets
+        entry["session"] = Session(db)
+    answers = []
+    for goal, deadline in zip(goals, deadlines):
+        try:
+            budget = None if deadline is None else Budget(deadline - time.monotonic())
+            answers.append("YES" if entry["session"].entails(goal_expr(goal), budget) else "NO")
+        except BudgetExceeded:
+            answers.append("UNKNOWN")
+    return answers
+
+
+def _solve(key: tuple[str, int], file_name: str, timeout: float | None) -> dict:
+    return solve_file(file_name, timeout, db=_worker_kb(key, file_name)["db"])
+
+
+class KnowledgeBase:
+    def __init__(self, name: str, file_name: str, closure: Closure, generation: int = 0):
+        self.name = name
+        self.file_name = file_name
+        self.closure = closure
+        self.key = name, generation  # names it in the workers' caches
+        self.queries = []  # (goal, future) waiting for the next batch
+        self.entailments = []
+
+
+class Metrics:
+    def __init__(self, window: int = 10000):
+        self.latency = defaultdict(lambda: deque(maxlen=window))  # op -> recent seconds
+        self.stats = Stats()
+
+    def record(self, op: str, seconds: float):
+        self.latency[op].append(seconds)
+        self.stats.add(f"requests.{op}")
+
+    def summary(self) -> dict:
+        ops = {}
+        for op, samples in self.latency.items():
+            ordered = sorted(samples)
+            percentile = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+            ops[op] = {
+                "count": self.stats.counters[f"requests.{op}"],
+                "mean_ms": sum(ordered) / len(ordered) * 1000,
+                "p50_ms": percentile(0.50),
+                "p95_ms": percentile(0.95),
+                "p99_ms": percentile(0.99),
+                "max_ms": ordered[-1] * 1000,
+            }
+        return {"latency": ops, "counters": dict(self.stats.counters)}
+
+
+class Server:
+    def __init__(self, workers: int | None = None, cache_dir: str | None = None):
+        self.kbs = {}
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.pool = self._start_pool()
+        self.metrics = Metrics()
+        self.generations = itertools.count()
+        self.tasks = set()  # batches being answered, referenced until done
+
+    # -- connections ----------------------------------------------------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Requests on one connection are served concurrently, so responses
+        # can come back out of order; clients match them by "id"
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(self._respond(line, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def _respond(self, line: bytes, writer: asyncio.StreamWriter):
+        start = time.perf_counter()
+        request = {}
+        try:
+            request = json.loads(line)
+            response = {"ok": True, "result": await self.dispatch(request)}
+        except Exception as error:
+            response = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        self.metrics.record(request.get("op", "invalid") if isinstance(request, dict) else "invalid",
+                            time.perf_counter() - start)
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+    async def dispatch(self, request: dict):
+        if not isinstance(request, dict):
+            raise ValueError(f"a request is a JSON object, not {request!r}")
+        op = request.get("op")
+        timeout = request.get("timeout")
+        if op == "load":
+            return await self.load(request["kb"], request["file"], timeout)
+        if op == "unload":
+            return self.kbs.pop(request["kb"], None) is not None
+        if op == "list":
+            return {name: kb.file_name for name, kb in self.kbs.items()}
+        if op == "metrics":
+            return self.metrics.summary()
+        kb = self.kbs.get(request.get("kb"))
+        if kb is None:
+            raise KeyError(f"no knowledge base named {request.get('kb')!r}")
+        if op == "query":
+            return await self._enqueue(kb, kb.queries, goal_expr(request["goal"]), self._answer_queries)
+        if op == "entails":
+            goal_expr(request["goal"])  # reject bad goals before they reach a worker
+            deadline = None if timeout is None else time.monotonic() + timeout
+            return await self._enqueue(kb, kb.entailments, (request["goal"], deadline), self._answer_entailments)
+        if op == "solve":
+            record = await self._in_pool(_solve, kb.key, kb.file_name, timeout)
+            return {key: record[key] for key in ("status", "route", "seconds", "model_hash", "stats")}
+        raise ValueError(f"unknown op {op!r}")
+
+    # -- knowledge bases and batching -----------------------------------
+
+    async def load(self, name: str, file_name: str, timeout: float | None = None) -> dict:
+        # Parsing and the closure run off the event loop; the budget stops
+        # the closure, parsing is only ever as long as the file
+        budget = Budget(timeout)
+
+        def build():
+            cache_dir = self.cache_dir
+            db = parse_db(file_name) if cache_dir is None else load_db(file_name, cache_dir or None)
+            return Closure(db, budget=budget)
+        closure = await asyncio.to_thread(build)
+        self.kbs[name] = KnowledgeBase(name, os.path.abspath(file_name), closure, next(self.generations))
+        return {"kb": name, "facts": len(closure.facts)}
+
+    async def _enqueue(self, kb: KnowledgeBase, pending: list, goal, answer):
+        future = asyncio.get_running_loop().create_future()
+        pending.append((goal, future))
+        if len(pending) == 1:
+            # Everything queued before this callback runs joins the batch
+            asyncio.get_running_loop().call_soon(self._start_batch, answer, kb)
+        return await future
+
+    def _start_batch(self, answer, kb: KnowledgeBase):
+        task = asyncio.ensure_future(answer(kb))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _answer_queries(self, kb: KnowledgeBase):
+        batch, kb.queries = kb.queries, []
+        self.metrics.stats.add("batches.query")
+        self.metrics.stats.peak("batch_size.query", len(batch))
+        results = kb.closure.holds_all(goal for goal, _ in batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result("YES" if result else "NO")
+
+    async def _answer_entailments(self, kb: KnowledgeBase):
+        batch, kb.entailments = kb.entailments, []
+        self.metrics.stats.add("batches.entails")
+        self.metrics.stats.peak("batch_size.entails", len(batch))
+        try:
+            results = await self._in_pool(_entails_all, kb.key, kb.file_name, [goal for (goal, _), _ in batch],
+                                          [deadline for (_, deadline), _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.workers, initializer=_start_worker, initargs=(self.cache_dir,))
+
+    async def _in_pool(self, function, *args):
+        pool = self.pool
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, function, *args)
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory, CPU limit): this request
+            # fails, later ones get a fresh pool
+            if self.pool is pool:
+                self.metrics.stats.add("pool_restarts")
+                self.pool = self._start_pool()
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def serve(server: Server, unix: str | None = None, host: str = "127.0.0.1", port: int = 7433):
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle, path=unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Resident reasoning server answering JSON queries over a socket")
+    arg_parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=7433)
+    arg_parser.add_argument("--kb", action="append", default=[], metavar="NAME=FILE", help="knowledge base to preload")
+    arg_parser.add_argument("--workers", type=int, help="worker processes for solving (default: one per core)")
+    arg_parser.add_argument("--cache", nargs="?", const="", metavar="DIR", help="on-disk cache for parsed KBs")
+    args = arg_parser.parse_args()
+
+    async def main():
+        server = Server(args.workers, args.cache)
+        try:
+            for spec in args.kb:
+                name, _, file_name = spec.partition("=")
+                await server.load(name, file_name)
+            await serve(server, args.unix, args.host, args.port)
+        finally:
+            server.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
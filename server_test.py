@@ -0,0 +1,63 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+
+from server import Server, serve
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _session(tmp_path, lines: list[bytes]) -> list[dict]:
+    # Sends the lines on one connection and returns the responses in the
+    # order of the requests' ids (or of arrival, for requests without one)
+    async def main():
+        server = Server(1)
+        path = str(tmp_path / "server.sock")
+        listener = asyncio.create_task(serve(server, unix=path))
+        try:
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            reader, writer = await asyncio.open_unix_connection(path)
+            responses = []
+            for line in lines:
+                writer.write(line + b"\n")
+                await writer.drain()
+                responses.append(json.loads(await asyncio.wait_for(reader.readline(), 60)))
+            writer.close()
+            return responses
+        finally:
+            listener.cancel()
+            server.close()
+    return asyncio.run(main())
+
+
+def test_bad_requests_get_errors(tmp_path):
+    responses = _session(tmp_path, [b"42", b"null", b"[1]", b"\"load\"", b"{not json", b'{"op": "nope", "id": 7}'])
+    assert all(not response["ok"] for response in responses)
+    assert "id" not in responses[0] and responses[-1]["id"] == 7
+
+
+def test_unload_unknown_kb(tmp_path):
+    (response,) = _session(tmp_path, [b'{"op": "unload", "kb": "missing"}'])
+    assert response == {"ok": True, "result": False}
+
+
+def test_load_query_entails_solve(tmp_path):
+    requests = [
+        {"op": "load", "kb": "tc", "file": os.path.join(HERE, "tc1.cnf")},
+        {"op": "list"},
+        {"op": "query", "kb": "tc", "goal": "1"},
+        {"op": "entails", "kb": "tc", "goal": {"or": ["1", "-1"]}},
+        {"op": "solve", "kb": "tc"},
+        {"op": "unload", "kb": "tc"},
+        {"op": "query", "kb": "tc", "goal": "1"},
+    ]
+    responses = _session(tmp_path, [json.dumps({**request, "id": i}).encode() for i, request in enumerate(requests)])
+    assert [response["id"] for response in responses] == list(range(len(requests)))
+    assert responses[0]["ok"] and responses[1]["result"] == {"tc": os.path.join(HERE, "tc1.cnf")}
+    assert responses[2]["result"] in ("YES", "NO")
+    assert responses[3]["result"] == "YES"
+    assert responses[4]["result"]["status"] == "SAT"
+    assert responses[5]["result"] is True
+    assert not responses[6]["ok"]
@@ -0,0 +1,93 @@
+from __future__ import annotations
+from typing import Iterable
+
+from budget import Budget, BudgetExceeded
+from cdcl import SolveResult, Solver
+from clausedb import ClauseDB
+from logic import Expr
+from parser import parse_db
+
+
+class Session:
+    # A knowledge base that is parsed, indexed and propagated once and then
+    # queried many times. Queries and temporary facts are passed to the
+    # solver as assumption literals, so learnt clauses and level-0
+    # propagation are shared by every query.
+    def __init__(self, knowledge_base: str | ClauseDB | Iterable[Expr], **solver_options):
+        if isinstance(knowledge_base, str):
+            self.db = parse_db(knowledge_base)
+        elif isinstance(knowledge_base, ClauseDB):
+            self.db = knowledge_base
+        else:
+            self.db = ClauseDB.from_exprs(knowledge_base)
+        self.solver = Solver(self.db, **solver_options)
+        self.frames = []  # activation literal of every pushed frame
+        self.model = None  # last model found, still a model of KB ∧ frames
+
+    def _clauses(self, expr: Expr) -> list[list[int]]:
+        scratch = ClauseDB(self.db.symbols)
+        scratch.add_expr(expr)
+        self.solver.reserve(self.db.num_vars)
+        return [clause.tolist() for clause in scratch]
+
+    def add(self, fact: Expr):
+        # Permanent: becomes part of the knowledge base
+        self.model = None
+        for clause in self._clauses(fact):
+            self.db.add_clause(clause)
+            self.solver.add_clause(clause)
+
+    def push(self):
+        self.frames.append(self.db.symbols.new_var("_frame"))
+        self.solver.reserve(self.db.num_vars)
+
+    def pop(self):
+        if not self.frames:
+            raise IndexError("pop from an empty session")
+        # Permanently switch the frame's clauses off
+        self.solver.add_clause([-self.frames.pop()])
+
+    def assume(self, fact: Expr):
+        # Temporary: holds until the enclosing frame is popped
+        if not self.frames:
+            raise IndexError("assume needs a pushed frame")
+        self.model = None
+        for clause in self._clauses(fact):
+            self.solver.add_clause([-self.frames[-1], *clause])
+
+    def check(self, assumptions: Iterable[int] = (), budget: Budget | None = None) -> SolveResult:
+        # "UNKNOWN" when the budget runs out; its steps and conflicts count
+        # per call, the deadline and the token across calls
+        result = self.solver.solve([*self.frames, *assumptions], budget)
+        if result.status == "SAT":
+            self.model = set(result.model)
+        return result
+
+    def satisfiable(self) -> bool:
+        return self.check().status == "SAT"
+
+    def entails(self, goal: Expr, budget: Budget | None = None) -> bool:
+        # KB ⊨ C1 ∧ ... ∧ Cn iff, for every clause Ci, KB ∧ ¬Ci is UNSAT,
+        # and ¬Ci is just the negation of its literals as assumptions.
+        # Raises BudgetExceeded if the budget runs out before the answer.
+        for clause in self._clauses(goal):
+            if self.model is not None and all(-lit in self.model for lit in clause):
+                return False  # a known model already falsifies it
+            result = self.check((-lit for lit in clause), budget)
+            if result.status == "UNKNOWN":
+                raise BudgetExceeded(result.exhausted)
+            if result.status != "UNSAT":
+                return False
+        return True
+
+    def entails_all(self, goals: Iterable[Expr], budget: Budget | None = None) -> list[bool]:
+        # When the budget runs out, BudgetExceeded.partial has the answers
+        # for the goals before the one being decided
+        answers = []
+        try:
+            for goal in goals:
+                answers.append(self.entails(goal, budget))
+        except BudgetExceeded as exceeded:
+            exceeded.partial = answers
+            raise
+        return answers
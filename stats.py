@@ -0,0 +1,72 @@
+from __future__ import annotations
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, TextIO
+
+
+class Stats:
+    # Filled in by the engines when passed as stats=...; engines keep plain
+    # local counters in their hot loops and only report here in bulk, so an
+    # absent Stats costs nothing and a present one very little.
+    def __init__(self, progress: float | None = None, stream: TextIO = sys.stderr):
+        self.counters = defaultdict(int)
+        self.phases = defaultdict(float)  # seconds spent per phase
+        self.peaks = defaultdict(int)  # largest working-set sizes seen
+        self.hooks = defaultdict(list)
+        self.progress = progress  # seconds between progress lines, None for off
+        self.stream = stream
+        self._started = time.perf_counter()
+        self._next_report = self._started + progress if progress else float("inf")
+
+    def add(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    def peak(self, name: str, value: int):
+        if value > self.peaks[name]:
+            self.peaks[name] = value
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def on(self, event: str, callback: Callable[..., None]):
+        # Engines emit "progress" from tick() and "done" when they finish
+        self.hooks[event].append(callback)
+
+    def emit(self, event: str, **info):
+        for callback in self.hooks.get(event, ()):
+            callback(self, **info)
+
+    interval = 4096  # steps between ticks for engines that run without a budget
+
+    def tick(self, engine: str, **counters):
+        # Called by engines every few thousand steps with their running totals.
+        # Engines fold it into their budget check: without a budget they
+        # check every Stats.interval steps just for the tick.
+        now = time.perf_counter()
+        if now < self._next_report and not self.hooks.get("progress"):
+            return
+        if now >= self._next_report:
+            self._next_report = now + self.progress
+            fields = " ".join(f"{name}={value}" for name, value in counters.items())
+            print(f"c [{now - self._started:8.2f}s] {engine} {fields}", file=self.stream, flush=True)
+        self.emit("progress", engine=engine, **counters)
+
+    def as_dict(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "phases": dict(self.phases),
+            "peaks": dict(self.peaks),
+        }
+
+    def __str__(self):
+        lines = [f"{name}: {value}" for name, value in sorted(self.counters.items())]
+        lines += [f"peak {name}: {value}" for name, value in sorted(self.peaks.items())]
+        lines += [f"time {name}: {seconds:.4f}s" for name, seconds in self.phases.items()]
+        return "\n".join(lines)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+from typing import Any, Callable, Generator, Iterable, Iterator
+
+# Formula traversals on an explicit stack. Parsed clauses, rule chains and
+# nested connectives can be hundreds of thousands of levels deep, far past
+# the interpreter's recursion limit, so nothing here calls itself. Results
+# are cached per node object (by id, since a model node hashes its whole tree)
+# for the length of one traversal, so shared subformulas are visited once.
+
+Children = Callable[[Any], Iterable[Any]]
+
+
+def walk(root, children: Children) -> Iterator:
+    # Every distinct node once, parents before children, left to right
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+        stack.extend(reversed(tuple(children(node))))
+
+
+def fold(root, children: Children, combine: Callable[[Any, list], Any], memo: dict | None = None):
+    # Post-order: combine(node, results of its children)
+    memo = {} if memo is None else memo  # id -> (node, result), the node keeps its id unique
+    stack = [(root, None)]
+    while stack:
+        node, kids = stack.pop()
+        if kids is None:
+            if id(node) in memo:
+                continue
+            kids = tuple(children(node))
+            if not kids:
+                memo[id(node)] = node, combine(node, [])
+                continue
+            stack.append((node, kids))
+            stack.extend((kid, None) for kid in reversed(kids) if id(kid) not in memo)
+        else:
+            memo[id(node)] = node, combine(node, [memo[id(kid)][1] for kid in kids])
+    return memo[id(root)][1]
+
+
+def trampoline(root, step: Callable[[Any], Generator], memo: dict | None = None):
+    # For rewrites that need results of nodes they build on the fly, not
+    # just of their children: step(node) is a generator that yields every
+    # node whose result it needs, is sent that result back, and returns
+    # the node's own result. The generators stand in for the call stack.
+    memo = {} if memo is None else memo
+    if id(root) in memo:
+        return memo[id(root)][1]
+    stack = [(root, step(root))]
+    value = None
+    while stack:
+        node, frame = stack[-1]
+        try:
+            needed = frame.send(value)
+        except StopIteration as done:
+            stack.pop()
+            value = done.value
+            memo[id(node)] = node, value
+            continue
+        cached = memo.get(id(needed))
+        if cached is not None:
+            value = cached[1]
+        else:
+            stack.append((needed, step(needed)))
+            value = None
+    return value
+
+
+def results(nodes: Iterable) -> Generator:
+    # Inside a trampoline step: ops = yield from results(node.operands)
+    values = []
+    for node in nodes:
+        values.append((yield node))
+    return values
+
+
+def render(root, parts: Callable[[Any], Iterable]) -> str:
+    # parts(node) gives the node's text as strings and child nodes, which
+    # are expanded in place
+    out = []
+    stack = [root]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            out.append(item)
+        else:
+            stack.extend(reversed(tuple(parts(item))))
+    return "".join(out)
+
+
+def interleave(separator: str, nodes: Iterable) -> list:
+    # [n1, sep, n2, sep, ..., nk], for parts()
+    out = []
+    for node in nodes:
+        if out:
+            out.append(separator)
+        out.append(node)
+    return out
@@ -0,0 +1,220 @@
+from __future__ import annotations
+from collections import defaultdict, deque
+from typing import Iterable
+
+from budget import Budget, BudgetExceeded
+from logic import Expr, Key, Rule, compile_rules, literal_key, make_literal
+from stats import Stats
+
+try:
+    import numpy as np
+except ImportError:  # falls back to Python integers as bitsets
+    np = None
+
+
+def _ranges(indptr, items):
+    # Positions indptr[i]:indptr[i + 1] of every item i, concatenated
+    starts = indptr[items]
+    lengths = indptr[items + 1] - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+class RuleMatrix:
+    # Rule bodies as a sparse rules × literals incidence matrix in CSR form
+    # (indptr/indices), with the head column and body size of every row, and
+    # its transpose (CSC) to find the rules that read a literal. Facts are a
+    # literals × scenarios bit matrix, 64 independent fact sets per uint64
+    # word. A rule fires in the scenarios where all of its body literals
+    # hold, i.e. where its count of true body literals reaches its body
+    # size; with packed scenarios that is an AND over the body's rows.
+    # Rounds are semi-naive: only rules reading a literal that changed in
+    # the previous round are evaluated again.
+    #
+    # Without NumPy the same closure is computed with one Python integer per
+    # literal whose bits are the scenarios, propagated along an agenda.
+    def __init__(self, rules: list[Rule], backend: str = "auto"):
+        if backend not in ("auto", "numpy", "bitset"):
+            raise ValueError(f"Unknown backend: {backend}")
+        if backend == "numpy" and np is None:
+            raise ImportError("the numpy backend needs numpy installed")
+        if backend == "auto":
+            backend = "numpy" if np is not None else "bitset"
+        self.backend = backend
+
+        self.columns = {}  # literal -> column
+        for rule in rules:
+            for key in (*rule.body, rule.head):
+                self.columns.setdefault(key, len(self.columns))
+        self.keys = list(self.columns)
+
+        self.facts = []
+        indptr, indices, heads, sizes = [0], [], [], []
+        for rule in rules:
+            if not rule.body:
+                self.facts.append(self.columns[rule.head])
+                continue
+            body = dict.fromkeys(self.columns[key] for key in rule.body)
+            indices.extend(body)
+            indptr.append(len(indices))
+            heads.append(self.columns[rule.head])
+            sizes.append(len(body))
+
+        if self.backend == "numpy":
+            self.indptr = np.array(indptr, dtype=np.intp)
+            self.indices = np.array(indices, dtype=np.intp)
+            self.heads = np.array(heads, dtype=np.intp)
+            self.sizes = np.array(sizes, dtype=np.intp)
+            rows = np.repeat(np.arange(len(heads)), self.sizes)
+            order = np.argsort(self.indices, kind="stable")
+            self.csc_rows = rows[order]
+            self.csc_indptr = np.concatenate(([0], np.cumsum(np.bincount(self.indices, minlength=len(self.columns)))))
+        else:
+            self.indptr, self.indices, self.heads, self.sizes = indptr, indices, heads, sizes
+            self.watching = defaultdict(list)
+            for i in range(len(heads)):
+                for column in indices[indptr[i]:indptr[i + 1]]:
+                    self.watching[column].append(i)
+
+    @classmethod
+    def from_kb(cls, knowledge_base: Iterable[Expr], backend: str = "auto") -> RuleMatrix:
+        return cls(compile_rules(knowledge_base)[0], backend)
+
+    def closure(self, scenarios: list[Iterable[Key]] | None = None, stats: Stats | None = None,
+                budget: Budget | None = None) -> list[set[Key]]:
+        # The closure of the rules plus each scenario's extra facts. A budget
+        # counts rule evaluations as steps; when it runs out,
+        # BudgetExceeded.partial has what every scenario had derived so far.
+        scenarios = [()] if scenarios is None else [list(facts) for facts in scenarios]
+        extra = [[key for key in facts if key not in self.columns] for facts in scenarios]
+        try:
+            if self.backend == "numpy":
+                inferred, rounds = self._numpy(scenarios, budget)
+            else:
+                inferred, checked = self._bitset(scenarios, budget)
+        except BudgetExceeded as exceeded:
+            exceeded.partial = [exceeded.partial[s] | set(extra[s]) for s in range(len(scenarios))]
+            raise
+        if stats is not None:
+            if self.backend == "numpy":
+                stats.add("rounds", rounds)
+            else:
+                stats.add("rules_checked", checked)
+            stats.add("scenarios", len(scenarios))
+            stats.peak("literals", len(self.columns))
+        return [inferred[s] | set(extra[s]) for s in range(len(scenarios))]
+
+    def _numpy(self, scenarios: list[list[Key]], budget: Budget | None) -> tuple[list[set[Key]], int]:
+        words = (len(scenarios) + 63) // 64
+        everyone = np.full(words, ~np.uint64(0), dtype=np.uint64)
+        if len(scenarios) % 64:
+            everyone[-1] = np.uint64((1 << len(scenarios) % 64) - 1)
+        facts = np.zeros((len(self.columns), words), dtype=np.uint64)
+        facts[self.facts] = everyone
+        for s, keys in enumerate(scenarios):
+            facts[[self.columns[key] for key in keys if key in self.columns], s // 64] |= np.uint64(1 << s % 64)
+
+        rounds = evaluated = 0
+        next_check = float("inf") if budget is None else budget.check()
+        changed = np.flatnonzero(facts.any(axis=1))
+        try:
+            while len(changed):
+                rows = np.unique(self.csc_rows[_ranges(self.csc_indptr, changed)])
+                if not len(rows):
+                    break
+                evaluated += len(rows)
+                if evaluated >= next_check:
+                    next_check = budget.check(evaluated)
+                rounds += 1
+                # Scenarios where every body literal of the row holds
+                lengths = self.sizes[rows]
+                fired = np.bitwise_and.reduceat(facts[self.indices[_ranges(self.indptr, rows)]],
+                                                np.cumsum(lengths) - lengths, axis=0)
+                heads = self.heads[rows]
+                new = fired & ~facts[heads]
+                hit = new.any(axis=1)
+                heads, new = heads[hit], new[hit]
+                np.bitwise_or.at(facts, heads, new)  # heads may repeat
+                changed = np.unique(heads)
+        except BudgetExceeded as exceeded:
+            exceeded.partial = self._numpy_sets(facts, len(scenarios))
+            raise
+        return self._numpy_sets(facts, len(scenarios)), rounds
+
+    def _numpy_sets(self, facts, count: int) -> list[set[Key]]:
+        inferred = []
+        for s in range(count):
+            holds = (facts[:, s // 64] >> np.uint64(s % 64)) & np.uint64(1)
+            inferred.append({self.keys[column] for column in np.flatnonzero(holds)})
+        return inferred
+
+    def _bitset(self, scenarios: list[list[Key]], budget: Budget | None) -> tuple[list[set[Key]], int]:
+        everyone = (1 << len(scenarios)) - 1
+        masks = [0] * len(self.columns)
+        for column in self.facts:
+            masks[column] = everyone
+        for s, keys in enumerate(scenarios):
+            for key in keys:
+                if key in self.columns:
+                    masks[self.columns[key]] |= 1 << s
+
+        indptr, indices, heads = self.indptr, self.indices, self.heads
+        agenda = deque(column for column, mask in enumerate(masks) if mask)
+        checked = 0
+        next_check = float("inf") if budget is None else budget.check()
+        try:
+            while agenda:
+                if checked >= next_check:
+                    next_check = budget.check(checked)
+                column = agenda.popleft()
+                for i in self.watching.get(column, ()):
+                    checked += 1
+                    # Scenarios in which the whole body holds
+                    fired = everyone
+                    for other in indices[indptr[i]:indptr[i + 1]]:
+                        fired &= masks[other]
+                        if not fired:
+                            break
+                    new = fired & ~masks[heads[i]]
+                    if new:
+                        masks[heads[i]] |= new
+                        agenda.append(heads[i])
+        except BudgetExceeded as exceeded:
+            exceeded.partial = self._bitset_sets(masks, len(scenarios))
+            raise
+        return self._bitset_sets(masks, len(scenarios)), checked
+
+    def _bitset_sets(self, masks: list[int], count: int) -> list[set[Key]]:
+        inferred = [set() for _ in range(count)]
+        for column, mask in enumerate(masks):
+            while mask:
+                low = mask & -mask
+                inferred[low.bit_length() - 1].add(self.keys[column])
+                mask ^= low
+        return inferred
+
+
+def vectorized_closure(knowledge_base: Iterable[Expr], backend: str = "auto", stats: Stats | None = None) -> list[Expr]:
+    # Same literals as main.forward_chaining, in no particular order
+    return evaluate_scenarios(knowledge_base, [()], backend, stats)[0]
+
+
+def evaluate_scenarios(knowledge_base: Iterable[Expr], scenarios: Iterable[Iterable[Expr]], backend: str = "auto",
+                       stats: Stats | None = None) -> list[list[Expr]]:
+    rules, literals = compile_rules(knowledge_base)
+    keyed = []
+    for facts in scenarios:
+        keys = []
+        for literal in facts:
+            key = literal_key(literal)
+            if key is None:
+                raise ValueError(f"Scenario fact is not a literal: {literal}")
+            literals.setdefault(key, literal)
+            keys.append(key)
+        keyed.append(keys)
+    matrix = RuleMatrix(rules, backend)
+    if stats is None:
+        closures = matrix.closure(keyed)
+    else:
+        with stats.phase("closure"):
+            closures = matrix.closure(keyed, stats)
+    return [[literals.get(key) or make_literal(key) for key in closure] for closure in closures]
@@ -0,0 +1,55 @@
+from __future__ import annotations
+import random
+
+import pytest
+
+from budget import Budget, BudgetExceeded
+from generators import random_horn
+from hadeh import Implies, Not, Symbol
+from logic import Rule, compile_rules, horn_closure
+from vectorized import RuleMatrix
+
+
+@pytest.fixture(params=["bitset", "numpy"])
+def backend(request):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    return request.param
+
+
+def _knowledge_base(seed: int) -> list:
+    # Random Horn rules, a few with negative heads
+    knowledge_base = random_horn(120, 40, num_facts=3, seed=seed)
+    rng = random.Random(seed)
+    for _ in range(10):
+        knowledge_base.append(Implies(Symbol(f"p{rng.randrange(40)}"), Not(Symbol(f"p{rng.randrange(40)}"))))
+    return knowledge_base
+
+
+def _scenarios(seed: int, count: int) -> list[list]:
+    rng = random.Random(seed)
+    return [[(f"p{rng.randrange(45)}", True) for _ in range(rng.randint(0, 4))] for _ in range(count)]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_matches_horn_closure(backend, seed):
+    rules = compile_rules(_knowledge_base(seed))[0]
+    # More than 64 scenarios, so the numpy backend uses two words per literal
+    scenarios = _scenarios(seed, 70)
+    closures = RuleMatrix(rules, backend).closure(scenarios)
+    for facts, closure in zip(scenarios, closures):
+        assert closure == set(horn_closure(rules + [Rule((), key) for key in facts]))
+
+
+def test_no_scenarios_is_the_plain_closure(backend):
+    rules = compile_rules(_knowledge_base(0))[0]
+    assert RuleMatrix(rules, backend).closure() == [set(horn_closure(rules))]
+
+
+def test_budget_partial_is_sound(backend):
+    rules = compile_rules(random_horn(2000, 1000, seed=1))[0]
+    scenarios = _scenarios(1, 8)
+    with pytest.raises(BudgetExceeded) as exceeded:
+        RuleMatrix(rules, backend).closure(scenarios, budget=Budget(steps=10))
+    for facts, partial in zip(scenarios, exceeded.value.partial):
+        assert partial <= set(horn_closure(rules + [Rule((), key) for key in facts]))